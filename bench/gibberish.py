@@ -0,0 +1,162 @@
+# coding=utf-8
+"""
+Gibberish detector backtest: precision/recall of the model (plugins/spam_model.npy) at different ratios
+and messages/sec of the old pure Python scorer, the NumPy scorer and its batch API
+
+Usage (from the repository root):
+    python -m bench.gibberish synthesize corpus.jsonl --amount 20000
+    python -m bench.gibberish run corpus.jsonl --ratios 1.4,1.6,1.8,2.0,2.2
+
+Corpus format (one JSON object per line):
+    {"content": "hello everyone, how is it going?", "gibberish": false}
+    {"content": "asdjkhasdkjhasdkjahsd", "gibberish": true}
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Keyboard rows, mashing them is the most common kind of gibberish
+KEYBOARD = ["qwertyuiop", "asdfghjkl", "zxcvbnm"]
+
+
+def synthesize(amount: int, seed: int = 0) -> list:
+    from bench.replay import CHAT
+    from bench.swearing import FILLER
+
+    rnd = random.Random(seed)
+    corpus = []
+
+    for _ in range(amount):
+        roll = rnd.random()
+
+        if roll < 0.4:
+            content = rnd.choice(CHAT)
+            gibberish = False
+        elif roll < 0.8:
+            content = " ".join(rnd.choice(FILLER) for _ in range(rnd.randint(3, 20)))
+            gibberish = False
+        elif roll < 0.95:
+            row = rnd.choice(KEYBOARD)
+            content = "".join(rnd.choice(row) for _ in range(rnd.randint(8, 40)))
+            gibberish = True
+        else:
+            content = "".join(rnd.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rnd.randint(8, 40)))
+            gibberish = True
+
+        corpus.append({"content": content, "gibberish": gibberish})
+
+    return corpus
+
+
+def load_corpus(path: str) -> list:
+    with open(path, encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def legacy_is_gibberish(data: list, threshold: list, message: str, ratio: float) -> bool:
+    # The pure Python scorer the NumPy one replaced
+    from plugins.moderator import accepted_chars
+
+    norm = "".join([char for char in message if char in accepted_chars])
+    positions = {c: i for i, c in enumerate(accepted_chars)}
+
+    c = 0
+    for i in range(len(norm) - 1):
+        a, b = positions[norm[i]], positions[norm[i + 1]]
+        if data[a][b] < threshold[a]:
+            c += 1
+
+    return bool(message) and c >= len(message) / ratio
+
+
+def scores(predicted, labels: list) -> dict:
+    tp = sum(1 for p, l in zip(predicted, labels) if p and l)
+    fp = sum(1 for p, l in zip(predicted, labels) if p and not l)
+    fn = sum(1 for p, l in zip(predicted, labels) if not p and l)
+    tn = len(labels) - tp - fp - fn
+
+    precision = tp / (tp + fp) if tp + fp else 0
+    recall = tp / (tp + fn) if tp + fn else 0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0
+
+    return {"precision": precision, "recall": recall, "f1": f1, "accuracy": (tp + tn) / len(labels)}
+
+
+def throughput(function, messages: list) -> float:
+    started = time.perf_counter()
+    function(messages)
+    return len(messages) / (time.perf_counter() - started)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Nano gibberish detector backtest")
+    sub = arg_parser.add_subparsers(dest="action")
+
+    syn = sub.add_parser("synthesize", help="generate a labelled corpus")
+    syn.add_argument("path")
+    syn.add_argument("--amount", type=int, default=20000)
+    syn.add_argument("--seed", type=int, default=0)
+
+    run = sub.add_parser("run", help="backtest against a labelled corpus")
+    run.add_argument("path")
+    run.add_argument("--ratios", default="1.4,1.6,1.8,2.0,2.2", help="comma separated ratios to try")
+    run.add_argument("--model", help="model to test instead of plugins/spam_model.npy")
+
+    args = arg_parser.parse_args()
+
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+
+    if args.action == "synthesize":
+        corpus = synthesize(args.amount, args.seed)
+        with open(args.path, "w", encoding="utf-8") as file:
+            for entry in corpus:
+                file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+        print("Wrote {} messages to {}".format(len(corpus), args.path))
+        return
+
+    if args.action != "run":
+        arg_parser.print_help()
+        return
+
+    from plugins.moderator import GibberishDetector
+
+    corpus = load_corpus(args.path)
+    messages = [entry["content"] for entry in corpus]
+    labels = [bool(entry["gibberish"]) for entry in corpus]
+
+    print("{} messages, {} labelled as gibberish".format(len(messages), sum(labels)))
+    print("{:<7} {:>10} {:>8} {:>8} {:>9}".format("ratio", "precision", "recall", "f1", "accuracy"))
+
+    for ratio in (float(a) for a in args.ratios.split(",")):
+        detector = GibberishDetector(args.model, ratio=ratio)
+        result = scores(detector.is_gibberish_batch(messages), labels)
+
+        print("{:<7} {:>10.3f} {:>8.3f} {:>8.3f} {:>9.3f}".format(
+            ratio, result["precision"], result["recall"], result["f1"], result["accuracy"]))
+
+    detector = GibberishDetector(args.model)
+    data = detector.model[:-1].tolist()
+    threshold = detector.model[-1].tolist()
+
+    legacy = [legacy_is_gibberish(data, threshold, m, detector.ratio) for m in messages]
+    mismatches = sum(1 for a, b in zip(legacy, detector.is_gibberish_batch(messages)) if a != b)
+
+    print("\n{:<10} {:>14}".format("scorer", "messages/s"))
+    for name, function in (
+            ("old", lambda ms: [legacy_is_gibberish(data, threshold, m, detector.ratio) for m in ms]),
+            ("numpy", lambda ms: [detector.is_gibberish(m) for m in ms]),
+            ("batch", detector.is_gibberish_batch)):
+        print("{:<10} {:>14.0f}".format(name, throughput(function, messages)))
+
+    print("decisions different from the old scorer: {}".format(mismatches))
+
+
+if __name__ == '__main__':
+    main()
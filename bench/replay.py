@@ -0,0 +1,504 @@
+# coding=utf-8
+"""
+Replay benchmark for the whole plugin pipeline
+
+Feeds recorded (or synthesized) gateway events through Nano.dispatch_event using lightweight fake
+discord objects, without connecting to Discord. Reports events/sec, per-plugin time and redis commands per event.
+
+Usage (from the repository root):
+    python -m bench.replay synthesize events.jsonl --amount 20000
+    python -m bench.replay run events.jsonl --fakeredis --output results.json
+    python -m bench.replay run events.jsonl --compare results.json --tolerance 10
+
+Events are recorded by Nano itself (core/recorder.py) when settings.ini has [Bench] record_events = path/to/events.jsonl
+
+Event format (one JSON object per line):
+    {"type": "message", "id": 1, "content": "!ping",
+     "author": {"id": 1, "name": "user", "bot": false},
+     "guild": {"id": 1, "name": "guild", "owner_id": 1},
+     "channel": {"id": 1, "name": "general"},
+     "mentions": [{"id": 2, "name": "other", "bot": false}], "role_mentions": 0}
+
+    {"type": "reaction", "message_id": 1, "emoji": "👍", "user": {...}, "guild": {...}, "channel": {...}}
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+log = logging.getLogger("bench.replay")
+
+# Exit code when performance regressed
+REGRESSION_EXIT_CODE = 3
+
+
+#####
+# Synthesizing
+#####
+
+CHAT = [
+    "hello everyone", "how is it going?", "lol", "anyone up for a game tonight?",
+    "I just got home from work", "that's what she said", "gg wp", "brb",
+    "does anyone know how to fix this error", "check this out https://example.com/some/page",
+    "I love this server", "what time is it there?", "nice", "same",
+]
+
+COMMANDS = [
+    "!hello", "!roll 100", "!dice 2d6 + 1d8", "!8ball will it rain?", "!quote", "!decide pizza|burgers|tacos",
+    "!uptime", "!help", "!help roll", "!stats", "!github", "!nano", "!cmds", "!prefix",
+]
+
+SPAM = [
+    "THIS IS VERY LOUD AND ANNOYING", "asdjkhasdkjhasdkjahsdkjahsdkj", "ffffffffffffffffffffffff",
+    "buy cheap stuff at discord.gg/abcdef",
+]
+
+
+def synthesize(amount: int, guilds: int = 50, users: int = 2000, seed: int = 0) -> list:
+    rnd = random.Random(seed)
+
+    guild_list = [{"id": 100000 + g, "name": "guild {}".format(g), "owner_id": 1} for g in range(guilds)]
+    user_list = [{"id": 200000 + u, "name": "user{}".format(u), "bot": u % 97 == 0} for u in range(users)]
+
+    events = []
+    for n in range(amount):
+        guild = rnd.choice(guild_list)
+        author = rnd.choice(user_list)
+        channel = {"id": guild["id"] * 10 + rnd.randint(0, 2), "name": "general"}
+
+        roll = rnd.random()
+        if roll < 0.65:
+            content = rnd.choice(CHAT)
+        elif roll < 0.9:
+            content = rnd.choice(COMMANDS)
+        else:
+            content = rnd.choice(SPAM)
+
+        mentions = [rnd.choice(user_list) for _ in range(rnd.randint(1, 3))] if rnd.random() < 0.05 else []
+
+        events.append({
+            "type": "message",
+            "id": 300000 + n,
+            "content": content,
+            "author": author,
+            "guild": guild,
+            "channel": channel,
+            "mentions": mentions,
+            "role_mentions": 0,
+        })
+
+        # Some reactions to previous messages
+        if rnd.random() < 0.05:
+            events.append({
+                "type": "reaction",
+                "message_id": 300000 + rnd.randint(0, n),
+                "emoji": "\U0001F44D",
+                "user": rnd.choice(user_list),
+                "guild": guild,
+                "channel": channel,
+            })
+
+    return events
+
+
+def load_events(path: str) -> list:
+    with open(path, encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+#####
+# Redis
+#####
+
+class RedisCounter:
+    """
+    Counts redis commands and round trips of both redis clients
+    """
+    def __init__(self):
+        self.commands = 0
+        self.round_trips = 0
+
+    def install(self):
+        import redis
+        import redis.asyncio
+
+        counter = self
+
+        sync_execute = redis.client.Redis.execute_command
+        sync_pipe_execute = redis.client.Pipeline.execute
+        async_execute = redis.asyncio.client.Redis.execute_command
+        async_pipe_execute = redis.asyncio.client.Pipeline.execute
+
+        def execute_command(self, *args, **kwargs):
+            counter.commands += 1
+            counter.round_trips += 1
+            return sync_execute(self, *args, **kwargs)
+
+        def pipe_execute(self, *args, **kwargs):
+            counter.commands += len(self.command_stack)
+            counter.round_trips += 1
+            return sync_pipe_execute(self, *args, **kwargs)
+
+        async def async_execute_command(self, *args, **kwargs):
+            counter.commands += 1
+            counter.round_trips += 1
+            return await async_execute(self, *args, **kwargs)
+
+        async def async_pipe_execute(self, *args, **kwargs):
+            counter.commands += len(self.command_stack)
+            counter.round_trips += 1
+            return await async_pipe_execute(self, *args, **kwargs)
+
+        redis.client.Redis.execute_command = execute_command
+        redis.client.Pipeline.execute = pipe_execute
+        redis.asyncio.client.Redis.execute_command = async_execute_command
+        redis.asyncio.client.Pipeline.execute = async_pipe_execute
+
+    def reset(self):
+        self.commands = 0
+        self.round_trips = 0
+
+
+def use_fakeredis():
+    """
+    Replaces both redis clients with in-memory fakeredis ones sharing a single server
+    """
+    import redis
+    import redis.asyncio
+    import fakeredis
+    import fakeredis.aioredis
+
+    server = fakeredis.FakeServer()
+
+    def make_sync(*_, **__):
+        return fakeredis.FakeStrictRedis(server=server)
+
+    def make_async(*_, **__):
+        return fakeredis.aioredis.FakeRedis(server=server)
+
+    redis.StrictRedis = make_sync
+    redis.asyncio.StrictRedis = make_async
+
+
+#####
+# Fake discord objects
+#####
+
+def make_fakes():
+    """
+    Builds fake discord classes (discord must be imported lazily, after redis has been patched)
+    """
+    import discord
+
+    class FakeUser:
+        def __init__(self, data: dict):
+            self.id = data["id"]
+            self.name = data["name"]
+            self.display_name = data["name"]
+            self.bot = data.get("bot", False)
+            self.discriminator = "0001"
+
+            self.mention = "<@{}>".format(self.id)
+            self.avatar_url = ""
+            self.default_avatar_url = ""
+            self.created_at = datetime(2017, 1, 1)
+
+            self.roles = []
+            self.guild_permissions = discord.Permissions.none()
+
+        def __eq__(self, other):
+            return getattr(other, "id", None) == self.id
+
+        def __hash__(self):
+            return hash(self.id)
+
+    class FakeGuild:
+        def __init__(self, data: dict):
+            self.id = data["id"]
+            self.name = data["name"]
+            self.owner_id = data.get("owner_id", 1)
+            self.owner = FakeUser({"id": self.owner_id, "name": "owner"})
+
+            self.member_count = 1
+            self.members = []
+            self.text_channels = []
+            self.channels = []
+
+        async def fetch_member(self, member_id):
+            return FakeUser({"id": member_id, "name": "member"})
+
+        def get_member(self, member_id):
+            return None
+
+    class FakeTextChannel(discord.TextChannel):
+        # TextChannel uses __slots__, a subclass without them gets a __dict__ and passes isinstance checks
+        def __init__(self, data: dict, guild):
+            self.id = data["id"]
+            self.name = data["name"]
+            self.guild = guild
+            self.position = 0
+
+            self.sent = 0
+
+        @property
+        def mention(self):
+            return "<#{}>".format(self.id)
+
+        async def send(self, content=None, **kwargs):
+            self.sent += 1
+            return FakeMessage(None, content or "", self.guild, self, bot_user)
+
+        async def trigger_typing(self):
+            pass
+
+    class FakeMessage:
+        def __init__(self, message_id, content, guild, channel, author, mentions=(), role_mentions=0):
+            self.id = message_id if message_id is not None else random.getrandbits(48)
+            self.content = content
+            self.guild = guild
+            self.channel = channel
+            self.author = author
+
+            self.mentions = list(mentions)
+            self.role_mentions = [None] * role_mentions
+            self.channel_mentions = []
+            self.created_at = datetime.now()
+
+        async def delete(self):
+            pass
+
+        async def add_reaction(self, emoji):
+            pass
+
+        async def clear_reactions(self):
+            pass
+
+        async def edit(self, **kwargs):
+            self.content = kwargs.get("content", self.content)
+
+    class FakeReaction:
+        def __init__(self, emoji, message):
+            self.emoji = emoji
+            self.message = message
+
+    bot_user = FakeUser({"id": 1, "name": "Nano", "bot": True})
+
+    return FakeUser, FakeGuild, FakeTextChannel, FakeMessage, FakeReaction, bot_user
+
+
+class EventFactory:
+    """
+    Turns event dicts into fake discord objects, reusing guilds, channels and users
+    """
+    def __init__(self):
+        self.User, self.Guild, self.Channel, self.Message, self.Reaction, self.bot_user = make_fakes()
+
+        self.guilds = {}
+        self.channels = {}
+        self.users = {}
+
+    def _user(self, data):
+        user = self.users.get(data["id"])
+        if user is None:
+            user = self.users[data["id"]] = self.User(data)
+
+        return user
+
+    def _guild_and_channel(self, event):
+        guild = self.guilds.get(event["guild"]["id"])
+        if guild is None:
+            guild = self.guilds[event["guild"]["id"]] = self.Guild(event["guild"])
+
+        channel = self.channels.get(event["channel"]["id"])
+        if channel is None:
+            channel = self.channels[event["channel"]["id"]] = self.Channel(event["channel"], guild)
+            guild.text_channels.append(channel)
+            guild.channels.append(channel)
+
+        return guild, channel
+
+    def message(self, event):
+        guild, channel = self._guild_and_channel(event)
+        mentions = [self._user(u) for u in event.get("mentions", [])]
+
+        return self.Message(event["id"], event["content"], guild, channel, self._user(event["author"]),
+                            mentions, event.get("role_mentions", 0))
+
+    def reaction(self, event):
+        guild, channel = self._guild_and_channel(event)
+        message = self.Message(event["message_id"], "", guild, channel, self.bot_user)
+
+        return self.Reaction(event["emoji"], message), self._user(event["user"])
+
+
+#####
+# Replay
+#####
+
+async def replay(nano_module, events: list, counter: RedisCounter, warmup: int = 200) -> dict:
+    nano = nano_module.nano
+    factory = EventFactory()
+
+    # Make the observer ignore Nano's own messages as it would when connected
+    nano_module.client._connection.user = factory.bot_user
+
+    # Let ON_PLUGINS_LOADED finish
+    await asyncio.sleep(0.5)
+
+    profiler = nano.profiler
+    profiler.enabled = True
+    profiler.sample_rate = 1
+
+    errors = 0
+
+    async def dispatch(event):
+        nonlocal errors
+
+        try:
+            if event["type"] == "message":
+                await nano.dispatch_event(nano_module.ON_MESSAGE, factory.message(event))
+            elif event["type"] == "reaction":
+                reaction, user = factory.reaction(event)
+                await nano.dispatch_event(nano_module.ON_REACTION_ADD, reaction, user)
+        except Exception:
+            errors += 1
+            log.debug("Event failed", exc_info=True)
+
+    # Warm up caches (guild setup, settings cache, ...)
+    for event in events[:warmup]:
+        await dispatch(event)
+
+    measured = events[warmup:] or events
+    profiler.reset()
+    counter.reset()
+    errors = 0
+
+    started = time.perf_counter()
+    for event in measured:
+        await dispatch(event)
+    elapsed = time.perf_counter() - started
+
+    per_plugin = {}
+    for s in profiler.get_stats(sort_by="total"):
+        per_plugin["{}:{}".format(s["plugin"], s["event"])] = {
+            "calls": s["calls"],
+            "total_s": round(s["total"], 4),
+            "p50_ms": round(s["p50"], 3),
+            "p99_ms": round(s["p99"], 3),
+        }
+
+    return {
+        "version": nano.version,
+        "events": len(measured),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 4),
+        "events_per_sec": round(len(measured) / elapsed, 1) if elapsed else 0,
+        "redis_commands_per_event": round(counter.commands / len(measured), 3),
+        "redis_round_trips_per_event": round(counter.round_trips / len(measured), 3),
+        "plugins": per_plugin,
+    }
+
+
+def print_results(results: dict):
+    print("Nano {}: {} events in {}s ({} errors)".format(
+        results["version"], results["events"], results["elapsed_s"], results["errors"]))
+    print("  events/sec:                {}".format(results["events_per_sec"]))
+    print("  redis commands/event:      {}".format(results["redis_commands_per_event"]))
+    print("  redis round trips/event:   {}".format(results["redis_round_trips_per_event"]))
+    print("  per plugin (total s, calls, p50 ms, p99 ms):")
+
+    for name, data in results["plugins"].items():
+        print("    {:<30} {:>9} {:>8} {:>9} {:>9}".format(
+            name, data["total_s"], data["calls"], data["p50_ms"], data["p99_ms"]))
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> bool:
+    """
+    Returns False if throughput regressed by more than tolerance (in %)
+    """
+    old, new = baseline["events_per_sec"], results["events_per_sec"]
+    change = (new - old) / old * 100 if old else 0
+
+    print("Compared to {}: {} -> {} events/sec ({:+.1f}%), redis commands/event {} -> {}".format(
+        baseline.get("version"), old, new, change,
+        baseline["redis_commands_per_event"], results["redis_commands_per_event"]))
+
+    return change >= -tolerance
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Nano replay benchmark")
+    sub = arg_parser.add_subparsers(dest="action")
+
+    syn = sub.add_parser("synthesize", help="generate a synthetic event file")
+    syn.add_argument("path")
+    syn.add_argument("--amount", type=int, default=10000)
+    syn.add_argument("--guilds", type=int, default=50)
+    syn.add_argument("--users", type=int, default=2000)
+    syn.add_argument("--seed", type=int, default=0)
+
+    run = sub.add_parser("run", help="replay an event file")
+    run.add_argument("path")
+    run.add_argument("--fakeredis", action="store_true", help="use an in-memory redis instead of settings.ini")
+    run.add_argument("--warmup", type=int, default=200, help="events replayed before measuring")
+    run.add_argument("--output", help="save results as JSON")
+    run.add_argument("--compare", help="previous results (JSON) to compare against")
+    run.add_argument("--tolerance", type=float, default=10, help="allowed throughput regression in %%")
+
+    args = arg_parser.parse_args()
+
+    if args.action == "synthesize":
+        events = synthesize(args.amount, args.guilds, args.users, args.seed)
+        with open(args.path, "w", encoding="utf-8") as file:
+            for event in events:
+                file.write(json.dumps(event, ensure_ascii=False) + "\n")
+
+        print("Wrote {} events to {}".format(len(events), args.path))
+        return
+
+    if args.action != "run":
+        arg_parser.print_help()
+        return
+
+    events = load_events(args.path)
+
+    # nano.py expects to be run from the repository root
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+
+    logging.basicConfig(level=logging.WARNING)
+
+    if args.fakeredis:
+        use_fakeredis()
+
+    counter = RedisCounter()
+    counter.install()
+
+    import nano as nano_module
+    logging.getLogger().setLevel(logging.WARNING)
+
+    results = nano_module.loop.run_until_complete(replay(nano_module, events, counter, args.warmup))
+    print_results(results)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+
+        if not compare(results, baseline, args.tolerance):
+            print("Throughput regressed by more than {}%".format(args.tolerance))
+            sys.exit(REGRESSION_EXIT_CODE)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+# coding=utf-8
+"""
+Repeated message detector memory benchmark: the old per-user dicts vs. the bounded store (plugins/moderator.py)
+
+Usage (from the repository root):
+    python -m bench.spam --users 1000000 --messages 2
+
+Every user writes a few messages in one of the guilds, memory is what the detector still holds afterwards.
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class LegacyModBucket:
+    __slots__ = ("threshold", "max_history", "history", "position")
+
+    def __init__(self, limit: int = 2, history: int = 3):
+        self.threshold = limit
+        self.max_history = history
+
+        self.history = [False] * history
+        self.position = 0
+
+    def notice(self, is_offense=False) -> bool:
+        self.position = 0 if self.position >= self.max_history - 1 else self.position + 1
+        self.history[self.position] = is_offense
+
+        if self.history.count(True) >= self.threshold:
+            self.history = [False] * self.max_history
+            return True
+
+
+class LegacyRepeatingMessageDetector:
+    # How repeated messages were detected before: the last message and a bucket per user, kept forever
+    def __init__(self):
+        self.last_from_user = {}
+        self.user_buckets = {}
+
+    def is_repeating(self, guild_id: int, user_id: int, features):
+        bucket = self.user_buckets.get(user_id)
+        if not bucket:
+            bucket = LegacyModBucket()
+            self.user_buckets[user_id] = bucket
+
+        last = self.last_from_user.get(user_id)
+        self.last_from_user[user_id] = features.content
+
+        if not last:
+            return False
+
+        return bucket.notice(features.content == last)
+
+
+def workload(users: int, messages: int, guilds: int, seed: int = 0):
+    from bench.swearing import FILLER
+
+    rnd = random.Random(seed)
+    for user in range(users):
+        guild_id = 100000 + user % guilds
+        user_id = 10 ** 17 + user
+
+        for _ in range(messages):
+            yield guild_id, user_id, " ".join(rnd.choice(FILLER) for _ in range(rnd.randint(3, 12)))
+
+
+def measure(detector, args) -> tuple:
+    from plugins.moderator import MessageFeatures
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+
+    started = time.perf_counter()
+    for guild_id, user_id, content in workload(args.users, args.messages, args.guilds):
+        detector.is_repeating(guild_id, user_id, MessageFeatures(content))
+    elapsed = time.perf_counter() - started
+
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    # The detector is freed when it goes out of scope, before the next one is measured
+    return used, elapsed
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Nano repeated message detector memory benchmark")
+    arg_parser.add_argument("--users", type=int, default=1000000)
+    arg_parser.add_argument("--messages", type=int, default=2, help="messages per user")
+    arg_parser.add_argument("--guilds", type=int, default=5000)
+    args = arg_parser.parse_args()
+
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+
+    from plugins.moderator import RepeatingMessageDetector, REPEAT_MAX_ENTRIES
+
+    detectors = [
+        ("old", LegacyRepeatingMessageDetector),
+        ("new (uncapped)", lambda: RepeatingMessageDetector(max_entries=float("inf"))),
+        ("new ({} max)".format(REPEAT_MAX_ENTRIES), RepeatingMessageDetector),
+    ]
+
+    print("{} users, {} messages each, {} guilds (time includes tracemalloc overhead)".format(
+        args.users, args.messages, args.guilds))
+    print("{:<20} {:>10} {:>12} {:>10}".format("detector", "MB", "bytes/user", "seconds"))
+
+    for name, factory in detectors:
+        used, elapsed = measure(factory(), args)
+        print("{:<20} {:>10.1f} {:>12.0f} {:>10.1f}".format(name, used / 2 ** 20, used / args.users, elapsed))
+
+
+if __name__ == '__main__':
+    main()
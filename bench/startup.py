@@ -0,0 +1,74 @@
+# coding=utf-8
+"""
+Startup benchmark: time and memory needed to import nano.py (and load the plugins) with and without lazy plugin loading
+
+Usage (from the repository root):
+    python -m bench.startup --fakeredis --runs 3
+
+Every run is a fresh interpreter. Network downloads started by plugins (tf2 prices, minecraft items, ...)
+only run once the event loop starts, so they are not included, only the imports and instantiation.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_RUN = """
+import json, os, sys, time
+started = time.perf_counter()
+
+sys.path.insert(0, {root!r})
+os.chdir({root!r})
+
+if {fakeredis!r}:
+    from bench.replay import use_fakeredis
+    use_fakeredis()
+
+from core.confparser import get_settings_parser
+get_settings_parser().read_dict({{"Plugins": {{"lazy_load": {lazy!r}}}}})
+
+import logging
+logging.disable(logging.CRITICAL)
+
+import nano
+import psutil
+
+print(json.dumps({{
+    "seconds": time.perf_counter() - started,
+    "rss": psutil.Process(os.getpid()).memory_info().rss / 2 ** 20,
+    "loaded": len(nano.nano.plugins),
+    "deferred": len(nano.nano.lazy_plugins),
+    "modules": len(sys.modules),
+}}))
+"""
+
+
+def run_once(lazy: bool, fakeredis: bool) -> dict:
+    code = _RUN.format(root=ROOT, fakeredis=fakeredis, lazy=str(lazy).lower())
+    out = subprocess.check_output([sys.executable, "-c", code], cwd=ROOT)
+
+    # Plugins can print while loading, the result is the last line
+    return json.loads(out.decode().strip().splitlines()[-1])
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Nano startup benchmark")
+    arg_parser.add_argument("--runs", type=int, default=3)
+    arg_parser.add_argument("--fakeredis", action="store_true", help="use an in-memory redis instead of settings.ini")
+    args = arg_parser.parse_args()
+
+    print("{:<8} {:>10} {:>10} {:>8} {:>9} {:>8}".format("mode", "seconds", "RSS (MB)", "loaded", "deferred", "modules"))
+
+    for lazy in (False, True):
+        results = [run_once(lazy, args.fakeredis) for _ in range(args.runs)]
+        best = min(results, key=lambda a: a["seconds"])
+
+        print("{:<8} {:>10.3f} {:>10.1f} {:>8} {:>9} {:>8}".format(
+            "lazy" if lazy else "eager", best["seconds"], best["rss"], best["loaded"], best["deferred"], best["modules"]))
+
+
+if __name__ == '__main__':
+    main()
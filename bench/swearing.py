@@ -0,0 +1,115 @@
+# coding=utf-8
+"""
+Swearing filter benchmark: the old token list scan vs. the word matcher (plugins/moderator.py)
+
+Usage (from the repository root):
+    python -m bench.swearing --amount 50000
+    python -m bench.swearing --events events.jsonl
+
+The corpus is either the message content of recorded events (see bench/replay.py)
+or synthesized chat where ~3% of the messages contain a banned word, some of them in leetspeak.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Common chat words to pad messages with
+FILLER = [
+    "the", "a", "to", "and", "of", "i", "you", "it", "is", "that", "in", "this", "for", "on", "my", "with",
+    "was", "have", "be", "just", "not", "but", "so", "what", "are", "lol", "like", "do", "me", "can", "get",
+    "how", "yeah", "no", "we", "if", "your", "at", "all", "up", "out", "game", "good", "time", "know", "one",
+    "now", "think", "when", "there", "ok", "assassin", "class", "pass", "cocktail", "shitake", "grass",
+]
+
+LEET = [("a", "4"), ("s", "$"), ("o", "0"), ("a", "@")]
+
+
+def legacy_word_list(words: list) -> list:
+    # How the word list was expanded before
+    expanded = list(words)
+    for word in words:
+        for k, v in LEET:
+            changed = word.replace(k, v)
+            if changed != word:
+                expanded.append(changed)
+
+    return expanded
+
+
+def legacy_has_swearing(word_list: list, message: str) -> bool:
+    return bool([a for a in word_list if a in message.split(" ")])
+
+
+def synthesize(amount: int, words: list, seed: int = 0) -> list:
+    from bench.replay import CHAT, COMMANDS, SPAM
+
+    rnd = random.Random(seed)
+    templates = CHAT + COMMANDS + SPAM
+
+    messages = []
+    for _ in range(amount):
+        if rnd.random() < 0.5:
+            message = rnd.choice(templates)
+        else:
+            message = " ".join(rnd.choice(FILLER) for _ in range(rnd.randint(3, 30)))
+
+        if rnd.random() < 0.03:
+            word = rnd.choice(words)
+            if rnd.random() < 0.3:
+                k, v = rnd.choice(LEET)
+                word = word.replace(k, v)
+
+            tokens = message.split(" ")
+            tokens.insert(rnd.randint(0, len(tokens)), word + rnd.choice(["", "", "!", "?", ","]))
+            message = " ".join(tokens)
+
+        messages.append(message.lower())
+
+    return messages
+
+
+def measure(function, messages: list) -> tuple:
+    started = time.perf_counter()
+    hits = sum(1 for message in messages if function(message))
+    return time.perf_counter() - started, hits
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Nano swearing filter benchmark")
+    arg_parser.add_argument("--amount", type=int, default=50000, help="amount of synthesized messages")
+    arg_parser.add_argument("--events", help="use message content from a recorded events file instead")
+    args = arg_parser.parse_args()
+
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+
+    from plugins.moderator import SwearingDetector
+
+    detector = SwearingDetector()
+    old_list = legacy_word_list(detector.word_list)
+
+    if args.events:
+        from bench.replay import load_events
+        messages = [e["content"].lower() for e in load_events(args.events) if e["type"] == "message"]
+    else:
+        messages = synthesize(args.amount, detector.word_list)
+
+    old_time, old_hits = measure(lambda m: legacy_has_swearing(old_list, m), messages)
+    new_time, new_hits = measure(detector.has_swearing, messages)
+
+    print("{} messages, {} words ({} with permutations), {} matcher states".format(
+        len(messages), len(detector.word_list), len(old_list), detector.matcher.size))
+
+    print("{:<10} {:>10} {:>14} {:>8}".format("matcher", "seconds", "messages/s", "hits"))
+    for name, seconds, hits in (("old", old_time, old_hits), ("new", new_time, new_hits)):
+        print("{:<10} {:>10.3f} {:>14.0f} {:>8}".format(name, seconds, len(messages) / seconds, hits))
+
+    print("speedup: {:.1f}x".format(old_time / new_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+# coding=utf-8
+"""
+Translation loading benchmark: parsing every XML file (cold) vs. loading the compiled snapshots (warm)
+With --memory: per-language memory of fully materialized dicts vs. interned keys with overlays over English
+
+Usage (from the repository root):
+    python -m bench.translations --runs 20
+    python -m bench.translations --memory
+"""
+import argparse
+import os
+import shutil
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(runs: int, setup=None, **kwargs) -> float:
+    from core import translations
+
+    best = None
+    for _ in range(runs):
+        if setup:
+            setup()
+
+        # TranslationManager is a singleton
+        translations.Singleton._instances.pop(translations.TranslationManager, None)
+
+        started = time.perf_counter()
+        translations.TranslationManager(preload=["*"], **kwargs)
+        elapsed = time.perf_counter() - started
+
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+
+def deep_size(obj, seen: set) -> int:
+    """
+    Size of a translation table: the dict, its keys and its strings (lists/tuples of special strings included)
+    Objects in seen are not counted again (shared between languages).
+    """
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += deep_size(key, seen) + deep_size(value, seen)
+    elif isinstance(obj, (list, tuple)):
+        for item in obj:
+            size += deep_size(item, seen)
+
+    return size
+
+
+def measure_memory():
+    from core import translations
+
+    translations.Singleton._instances.pop(translations.TranslationManager, None)
+    trans = translations.TranslationManager(preload=[translations.DEFAULT_LANGUAGE])
+    preloaded = len(trans.translations)
+
+    languages = list(trans.meta.keys())
+
+    # Before: every language fully materialized, keys not shared
+    # (keep the tables alive while measuring, seen is keyed by id)
+    tables = {lang: trans._load_language(lang)[0] for lang in languages}
+    full_seen = set()
+    full = {lang: deep_size(tables[lang], full_seen) for lang in languages}
+
+    # After: English + overlays (loading the rest the way a guild using them would)
+    started = time.perf_counter()
+    for lang in languages:
+        trans.for_lang(lang).get("INFO_CHANNEL")
+    lazy_ms = (time.perf_counter() - started) * 1000 / max(len(languages) - preloaded, 1)
+
+    # Everything the manager keeps per language: the overlay and the bound translator (with its tables)
+    sparse_seen = set()
+    sparse = {}
+    for lang in languages:
+        bound = trans._bound[lang]
+        sparse[lang] = sum(deep_size(obj, sparse_seen) for obj in (
+            trans.translations[lang], bound, bound.strings, bound.base, bound._formatters))
+
+    print("{:<8} {:>10} {:>10} {:>8}".format("lang", "full (KB)", "overlay (KB)", "strings"))
+    for lang in languages:
+        print("{:<8} {:>10.1f} {:>12.1f} {:>8}".format(
+            lang, full[lang] / 1024, sparse[lang] / 1024, len(trans.translations[lang])))
+
+    total_full = sum(full.values())
+    total_sparse = sum(sparse.values())
+    print("{:<8} {:>10.1f} {:>12.1f}".format("total", total_full / 1024, total_sparse / 1024))
+    print("saved: {:.0f}%, loaded at startup: {} of {}, first use of a language: {:.2f} ms".format(
+        (1 - total_sparse / total_full) * 100, preloaded, len(languages), lazy_ms))
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Nano translation loading benchmark")
+    arg_parser.add_argument("--runs", type=int, default=10)
+    arg_parser.add_argument("--memory", action="store_true", help="measure memory per language instead")
+    args = arg_parser.parse_args()
+
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+
+    if args.memory:
+        measure_memory()
+        return
+
+    from core.translations import SNAPSHOT_DIR
+
+    def clear_snapshots():
+        shutil.rmtree(SNAPSHOT_DIR, ignore_errors=True)
+
+    results = [
+        ("cold (no snapshots)", measure(args.runs, use_snapshots=False)),
+        ("cold (parse + write snapshots)", measure(args.runs, setup=clear_snapshots)),
+        ("warm (snapshots)", measure(args.runs)),
+    ]
+
+    for name, seconds in results:
+        print("{:<32} {:>8.2f} ms".format(name, seconds * 1000))
+
+    print("speedup: {:.1f}x".format(results[0][1] / results[2][1]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,360 @@
+# coding=utf-8
+"""
+Cluster mode: a supervisor process runs several Nano workers, each owning a part of the shards
+
+Start it with (from the Nano directory):
+    python -m core.cluster
+
+Workers are normal nano.py processes started with the NANO_CLUSTER_WORKER environment variable. They share
+state through redis: a heartbeat hash for the cluster-wide status and leader keys for background jobs
+(reminders, softbans, backups) that must run in exactly one process.
+"""
+import asyncio
+import json
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+from math import isnan
+
+import redis.asyncio as aioredis
+
+from .confparser import get_settings_parser
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+# Set by the supervisor for every worker process
+WORKER_ENV = "NANO_CLUSTER_WORKER"
+
+WORKERS_KEY = "cluster:workers"
+LEADER_KEY = "cluster:leader:{}"
+
+# Workers report their status this often (in seconds)
+HEARTBEAT_INTERVAL = 10
+# Workers without a heartbeat for this long are considered dead
+HEARTBEAT_TTL = 35
+
+# Leadership expires if not renewed in this many seconds
+LEADER_TTL = 30
+
+# nano.py exit codes the supervisor understands
+EXIT_STOP = 0
+EXIT_RESTART = 75
+
+# Crashed workers are restarted with an exponential backoff (in seconds)
+RESTART_MIN_BACKOFF = 5
+RESTART_MAX_BACKOFF = 300
+# A worker that ran for this long is considered stable again
+STABLE_UPTIME = 120
+
+# Only extends the key if this process still owns it
+_RENEW_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("EXPIRE", KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+_RELEASE_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+
+
+def shard_ids_for(worker_id: int, workers: int, shard_count: int) -> list:
+    return [shard for shard in range(shard_count) if shard % workers == worker_id]
+
+
+class ClusterConfig:
+    __slots__ = ("enabled", "worker_id", "workers", "shard_count", "shard_ids")
+
+    def __init__(self, enabled: bool, worker_id: int = 0, workers: int = 1, shard_count: int = None):
+        self.enabled = enabled
+        self.worker_id = worker_id
+        self.workers = workers
+        self.shard_count = shard_count
+
+        self.shard_ids = shard_ids_for(worker_id, workers, shard_count) if enabled else None
+
+    @classmethod
+    def from_settings(cls, parser=None):
+        """
+        Cluster mode is enabled only in processes started by the supervisor
+        """
+        worker_id = os.environ.get(WORKER_ENV)
+        if worker_id is None:
+            return cls(False)
+
+        parser = parser or get_settings_parser()
+        workers = parser.getint("Cluster", "workers", fallback=1)
+        shard_count = parser.getint("Cluster", "shard_count", fallback=workers)
+
+        return cls(True, int(worker_id), workers, shard_count)
+
+
+class LeaderElection:
+    """
+    Keeps (or tries to acquire) a redis lease named cluster:leader:<name>
+
+    Outside of cluster mode the only process is always the leader.
+    Jobs should check is_leader before every run: leadership can be lost at any time (e.g. redis timeouts).
+    """
+    __slots__ = ("redis", "name", "identity", "ttl", "enabled", "is_leader")
+
+    def __init__(self, redis, name: str, identity: str, ttl: int = LEADER_TTL, enabled: bool = True):
+        self.redis = redis
+        self.name = name
+        self.identity = identity
+        self.ttl = ttl
+
+        self.enabled = enabled
+        self.is_leader = not enabled
+
+    @property
+    def key(self):
+        return LEADER_KEY.format(self.name)
+
+    def _set_leader(self, state: bool):
+        if state != self.is_leader:
+            log.info("{} leadership for {}".format("Acquired" if state else "Lost", self.name))
+
+        self.is_leader = state
+
+    async def _elect(self):
+        if self.is_leader:
+            renewed = await self.redis.eval(_RENEW_SCRIPT, 1, self.key, self.identity, self.ttl)
+            self._set_leader(bool(renewed))
+
+        if not self.is_leader:
+            acquired = await self.redis.set(self.key, self.identity, nx=True, ex=self.ttl)
+            self._set_leader(bool(acquired))
+
+    async def campaign(self):
+        if not self.enabled:
+            return
+
+        while True:
+            try:
+                await self._elect()
+            except aioredis.RedisError as e:
+                # Someone else will take over when the lease expires
+                log.warning("Leader election for {} failed: {}".format(self.name, e))
+                self._set_leader(False)
+
+            await asyncio.sleep(self.ttl / 3)
+
+    async def release(self):
+        if not self.enabled or not self.is_leader:
+            return
+
+        self.is_leader = False
+        await self.redis.eval(_RELEASE_SCRIPT, 1, self.key, self.identity)
+
+
+class ClusterNode:
+    """
+    This process' membership in the cluster
+    """
+    def __init__(self, config: ClusterConfig, redis, loop):
+        self.config = config
+        self.redis = redis
+        self.loop = loop
+
+        self.identity = "{}:{}".format(config.worker_id, os.getpid())
+        self.started = time.time()
+
+        # name -> LeaderElection
+        self.elections = {}
+
+    @property
+    def enabled(self):
+        return self.config.enabled
+
+    def election(self, name: str) -> LeaderElection:
+        """
+        Returns the (shared) election for a job and starts campaigning if needed
+        """
+        election = self.elections.get(name)
+        if election is None:
+            election = self.elections[name] = LeaderElection(self.redis, name, self.identity,
+                                                             enabled=self.enabled)
+            self.loop.create_task(election.campaign())
+
+        return election
+
+    async def release(self):
+        for election in self.elections.values():
+            try:
+                await election.release()
+            except aioredis.RedisError:
+                pass
+
+    def _make_status(self, client) -> dict:
+        return {
+            "worker": self.config.worker_id,
+            "pid": os.getpid(),
+            "shards": self.config.shard_ids,
+            "guilds": len(client.guilds),
+            "members": sum(int(guild.member_count or 0) for guild in client.guilds),
+            "channels": sum(len(guild.channels) for guild in client.guilds),
+            # Latency is nan until the first heartbeat
+            "latency": None if isnan(client.latency) else round(client.latency * 1000),
+            "leader": sorted(name for name, e in self.elections.items() if e.is_leader),
+            "started": self.started,
+            "updated": time.time(),
+        }
+
+    async def run_heartbeat(self, client):
+        if not self.enabled:
+            return
+
+        await client.wait_until_ready()
+
+        while not client.is_closed():
+            try:
+                status = json.dumps(self._make_status(client))
+                await self.redis.hset(WORKERS_KEY, self.config.worker_id, status)
+            except aioredis.RedisError as e:
+                log.warning("Could not send the cluster heartbeat: {}".format(e))
+
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+    async def get_status(self) -> list:
+        """
+        Returns status dicts of live workers
+        """
+        now = time.time()
+        workers = []
+
+        for raw in (await self.redis.hgetall(WORKERS_KEY)).values():
+            status = json.loads(raw)
+
+            if now - status["updated"] <= HEARTBEAT_TTL and status["worker"] < self.config.workers:
+                workers.append(status)
+
+        return sorted(workers, key=lambda a: a["worker"])
+
+
+class Supervisor:
+    """
+    Runs the workers and restarts them when they crash
+
+    Worker exit codes: EXIT_STOP (nano.kill) stops the whole cluster, EXIT_RESTART (nano.restart) restarts
+    the worker right away, anything else is a crash and is restarted with a backoff.
+    """
+    def __init__(self, workers: int, shard_count: int, spawn_delay: float = 5):
+        if not (1 <= workers <= shard_count):
+            raise ValueError("need at least one worker and one shard per worker")
+
+        self.workers = workers
+        self.shard_count = shard_count
+        self.spawn_delay = spawn_delay
+
+        # worker id -> Popen
+        self.processes = {}
+        self.started = {}
+        self.backoff = {}
+        # worker id -> time of the next restart
+        self.pending = {}
+
+        self.running = False
+
+    def spawn(self, worker_id: int):
+        env = dict(os.environ)
+        env[WORKER_ENV] = str(worker_id)
+
+        log.info("Starting worker {} (shards {})".format(
+            worker_id, shard_ids_for(worker_id, self.workers, self.shard_count)))
+
+        self.processes[worker_id] = subprocess.Popen([sys.executable, "nano.py"], env=env)
+        self.started[worker_id] = time.time()
+
+    def _handle_exit(self, worker_id: int, code: int):
+        del self.processes[worker_id]
+
+        if code == EXIT_STOP:
+            log.warning("Worker {} exited cleanly, stopping the cluster".format(worker_id))
+            self.running = False
+            return
+
+        if code == EXIT_RESTART:
+            log.info("Worker {} asked for a restart".format(worker_id))
+            self.pending[worker_id] = time.time()
+            return
+
+        # Crash: back off if it keeps crashing
+        uptime = time.time() - self.started[worker_id]
+        if uptime > STABLE_UPTIME:
+            self.backoff[worker_id] = RESTART_MIN_BACKOFF
+        else:
+            self.backoff[worker_id] = min(self.backoff.get(worker_id, RESTART_MIN_BACKOFF / 2) * 2,
+                                          RESTART_MAX_BACKOFF)
+
+        log.critical("Worker {} crashed (code {}), restarting in {}s".format(worker_id, code, self.backoff[worker_id]))
+        self.pending[worker_id] = time.time() + self.backoff[worker_id]
+
+    def _stop(self, *_):
+        self.running = False
+
+    def shutdown(self):
+        for proc in self.processes.values():
+            proc.terminate()
+
+        deadline = time.time() + 30
+        for worker_id, proc in self.processes.items():
+            try:
+                proc.wait(timeout=max(deadline - time.time(), 0))
+            except subprocess.TimeoutExpired:
+                log.warning("Worker {} did not exit, killing it".format(worker_id))
+                proc.kill()
+
+        self.processes = {}
+
+    def run(self):
+        self.running = True
+        signal.signal(signal.SIGINT, self._stop)
+        signal.signal(signal.SIGTERM, self._stop)
+
+        # Stagger the workers so their shards do not identify at the same time
+        for worker_id in range(self.workers):
+            self.pending[worker_id] = time.time() + worker_id * self.spawn_delay
+
+        try:
+            while self.running:
+                now = time.time()
+
+                for worker_id, when in list(self.pending.items()):
+                    if when <= now:
+                        del self.pending[worker_id]
+                        self.spawn(worker_id)
+
+                for worker_id, proc in list(self.processes.items()):
+                    code = proc.poll()
+                    if code is not None:
+                        self._handle_exit(worker_id, code)
+
+                time.sleep(1)
+
+        finally:
+            log.info("Stopping workers...")
+            self.shutdown()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+
+    parser = get_settings_parser()
+    workers = parser.getint("Cluster", "workers", fallback=1)
+    shard_count = parser.getint("Cluster", "shard_count", fallback=workers)
+    spawn_delay = parser.getfloat("Cluster", "spawn_delay", fallback=5)
+
+    Supervisor(workers, shard_count, spawn_delay).run()
+
+
+if __name__ == '__main__':
+    main()
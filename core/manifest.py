@@ -0,0 +1,137 @@
+# coding=utf-8
+import ast
+import json
+import logging
+import os
+
+from .confparser import CACHE_DIR
+from .utils import INDEPENDENT
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+MANIFEST_PATH = os.path.join(CACHE_DIR, "plugins.json")
+# Bump when the format of entries changes
+MANIFEST_VERSION = 1
+
+ON_MESSAGE = "on_message"
+
+# Names a NanoPlugin.events dict can use instead of a number
+_EVENT_CONSTANTS = {
+    "INDEPENDENT": INDEPENDENT,
+}
+
+
+def _literal(node):
+    if isinstance(node, ast.Name) and node.id in _EVENT_CONSTANTS:
+        return _EVENT_CONSTANTS[node.id]
+
+    return ast.literal_eval(node)
+
+
+def read_plugin(path: str) -> dict:
+    """
+    Extracts commands and NanoPlugin.events/commands_only from a plugin's source without importing it
+    "static" is False if something is not a literal (the plugin must then be imported to know)
+    """
+    with open(path, encoding="utf-8") as file:
+        tree = ast.parse(file.read(), path)
+
+    entry = {"commands": None, "events": None, "commands_only": False, "static": True}
+
+    try:
+        for node in tree.body:
+            if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+                if node.targets[0].id == "commands":
+                    entry["commands"] = ast.literal_eval(node.value)
+
+            elif isinstance(node, ast.ClassDef) and node.name == "NanoPlugin":
+                for item in node.body:
+                    if not (isinstance(item, ast.Assign) and isinstance(item.targets[0], ast.Name)):
+                        continue
+
+                    name = item.targets[0].id
+                    if name == "events":
+                        entry["events"] = {_literal(k): _literal(v) for k, v in zip(item.value.keys, item.value.values)}
+                    elif name == "commands_only":
+                        entry["commands_only"] = ast.literal_eval(item.value)
+
+    except (ValueError, TypeError, SyntaxError):
+        entry["static"] = False
+
+    if entry["events"] is None:
+        entry["static"] = False
+
+    return entry
+
+
+class PluginManifest:
+    """
+    Cached commands and events of every plugin in cache/plugins.json
+
+    Entries are keyed by the file's mtime and size, so only changed plugins are parsed again.
+    """
+    def __init__(self, plugins_dir: str, path: str = MANIFEST_PATH):
+        self.plugins_dir = plugins_dir
+        self.path = path
+
+        # plugin name -> entry
+        self.entries = {}
+
+    def _read_cache(self) -> dict:
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+        if data.get("version") != MANIFEST_VERSION:
+            return {}
+
+        return data.get("plugins", {})
+
+    def load(self, names: list):
+        cached = self._read_cache()
+        changed = 0
+
+        for name in names:
+            path = os.path.join(self.plugins_dir, name + ".py")
+            stat = os.stat(path)
+
+            entry = cached.get(name)
+            if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+                self.entries[name] = entry
+                continue
+
+            try:
+                entry = read_plugin(path)
+            except SyntaxError:
+                # Importing will report it properly
+                entry = {"commands": None, "events": None, "commands_only": False, "static": False}
+
+            entry["mtime"] = stat.st_mtime
+            entry["size"] = stat.st_size
+
+            self.entries[name] = entry
+            changed += 1
+
+        if changed or set(cached.keys()) != set(names):
+            self.save()
+            log.info("Plugin manifest updated ({} changed)".format(changed))
+
+    def save(self):
+        with open(self.path, "w", encoding="utf-8") as file:
+            json.dump({"version": MANIFEST_VERSION, "plugins": self.entries}, file)
+
+    def get(self, name: str) -> dict:
+        return self.entries.get(name)
+
+    def is_lazy(self, name: str) -> bool:
+        """
+        Plugins that only handle their own commands in on_message can be imported on first use
+        """
+        entry = self.entries.get(name)
+        if not entry or not entry["static"]:
+            return False
+
+        return bool(entry["commands"]) and entry["commands_only"] and set(entry["events"].keys()) == {ON_MESSAGE}
@@ -0,0 +1,217 @@
+# coding=utf-8
+import asyncio
+import logging
+import time
+from math import log2
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+# Buckets per power of two (4 -> each bucket is ~19% wide)
+BUCKET_RESOLUTION = 4
+# 2^(128 / 4) microseconds is more than an hour, anything slower ends up in the last bucket
+BUCKET_COUNT = 128
+
+# Rolling window length in seconds (percentiles cover the current and the previous window)
+DEFAULT_WINDOW = 300
+
+
+def _bucket_for(micros: float) -> int:
+    if micros <= 1:
+        return 0
+
+    return min(int(log2(micros) * BUCKET_RESOLUTION), BUCKET_COUNT - 1)
+
+
+def _bucket_upper_bound(index: int) -> float:
+    # In milliseconds
+    return (2 ** ((index + 1) / BUCKET_RESOLUTION)) / 1000
+
+
+class LatencyHistogram:
+    """
+    Log-bucketed histogram over two rolling windows
+    Recording is a couple of arithmetic operations and a list increment
+    """
+    __slots__ = ("current", "previous", "window", "window_start", "calls", "total_time", "max_time")
+
+    def __init__(self, window: int = DEFAULT_WINDOW):
+        self.window = window
+        self.window_start = time.monotonic()
+
+        self.current = [0] * BUCKET_COUNT
+        self.previous = [0] * BUCKET_COUNT
+
+        # Lifetime counters
+        self.calls = 0
+        self.total_time = 0
+        self.max_time = 0
+
+    def _rotate(self, now: float):
+        # If more than one window passed, the previous one is stale as well
+        if now - self.window_start > self.window * 2:
+            self.previous = [0] * BUCKET_COUNT
+        else:
+            self.previous = self.current
+
+        self.current = [0] * BUCKET_COUNT
+        self.window_start = now
+
+    def record(self, seconds: float, now: float):
+        if now - self.window_start > self.window:
+            self._rotate(now)
+
+        self.current[_bucket_for(seconds * 1000000)] += 1
+
+        self.calls += 1
+        self.total_time += seconds
+        if seconds > self.max_time:
+            self.max_time = seconds
+
+    def percentiles(self, *points) -> list:
+        """
+        Returns approximate percentiles (in ms) of the rolling windows, upper bounds of the matching buckets
+        """
+        merged = [a + b for a, b in zip(self.current, self.previous)]
+        total = sum(merged)
+
+        if not total:
+            return [0] * len(points)
+
+        results = []
+        for point in points:
+            needed = total * point / 100
+
+            seen = 0
+            for index, amount in enumerate(merged):
+                seen += amount
+                if seen >= needed:
+                    results.append(_bucket_upper_bound(index))
+                    break
+
+        return results
+
+    def reset(self):
+        self.current = [0] * BUCKET_COUNT
+        self.previous = [0] * BUCKET_COUNT
+        self.window_start = time.monotonic()
+
+        self.calls = 0
+        self.total_time = 0
+        self.max_time = 0
+
+
+class EventProfiler:
+    """
+    Records latency of every (plugin, event) callback in Nano.dispatch_event and counts their control-flow results
+
+    Only one in sample_rate dispatches is measured, so it can stay enabled permanently.
+    """
+    __slots__ = ("enabled", "sample_rate", "window", "_counter", "histograms", "results", "started")
+
+    def __init__(self, enabled: bool = True, sample_rate: int = 1, window: int = DEFAULT_WINDOW):
+        self.enabled = enabled
+        self.sample_rate = max(int(sample_rate), 1)
+        self.window = window
+
+        self._counter = 0
+
+        # (plugin, event) -> LatencyHistogram
+        self.histograms = {}
+        # (plugin, event) -> {result: amount}
+        self.results = {}
+
+        self.started = time.time()
+
+    def should_sample(self) -> bool:
+        if not self.enabled:
+            return False
+
+        self._counter += 1
+        if self._counter >= self.sample_rate:
+            self._counter = 0
+            return True
+
+        return False
+
+    @staticmethod
+    def result_type(resp) -> str:
+        """
+        Classifies a plugin response: "none", "return", "add_var", "shutdown", ...
+        """
+        if not resp:
+            return "none"
+
+        # Multiple commands, the first one decides
+        if type(resp) is list:
+            resp = resp[0]
+
+        if type(resp) in (tuple, list, set):
+            resp = next(iter(resp))
+
+        return str(resp)
+
+    def record(self, plugin: str, event: str, seconds: float, resp=None):
+        key = (plugin, event)
+
+        hist = self.histograms.get(key)
+        if hist is None:
+            hist = self.histograms[key] = LatencyHistogram(self.window)
+            self.results[key] = {}
+
+        hist.record(seconds, time.monotonic())
+
+        results = self.results[key]
+        result = self.result_type(resp)
+        results[result] = results.get(result, 0) + 1
+
+    def get_stats(self, sort_by: str = "p99") -> list:
+        stats = []
+        for (plugin, event), hist in self.histograms.items():
+            # Bucket bounds can overshoot the slowest recorded call
+            max_time = hist.max_time * 1000
+            p50, p95, p99 = (min(a, max_time) for a in hist.percentiles(50, 95, 99))
+
+            stats.append({
+                "plugin": plugin,
+                "event": event,
+                "calls": hist.calls,
+                "p50": p50,
+                "p95": p95,
+                "p99": p99,
+                "max": max_time,
+                "total": hist.total_time,
+                "results": dict(self.results[(plugin, event)]),
+            })
+
+        return sorted(stats, key=lambda a: a[sort_by], reverse=True)
+
+    def format_stats(self, limit: int = 20, sort_by: str = "p99") -> str:
+        stats = self.get_stats(sort_by)[:limit]
+        if not stats:
+            return "No samples yet."
+
+        lines = ["{:<28} {:>7} {:>8} {:>8} {:>8} {:>9}  results".format(
+            "plugin:event", "calls", "p50", "p95", "p99", "max")]
+
+        for s in stats:
+            results = ", ".join("{}={}".format(k, v) for k, v in sorted(s["results"].items()))
+            lines.append("{:<28} {:>7} {:>8.2f} {:>8.2f} {:>8.2f} {:>9.2f}  {}".format(
+                "{}:{}".format(s["plugin"], s["event"])[:28], s["calls"], s["p50"], s["p95"], s["p99"], s["max"], results))
+
+        return "\n".join(lines)
+
+    def reset(self):
+        self.histograms = {}
+        self.results = {}
+        self.started = time.time()
+
+    async def run_dumper(self, interval: int):
+        """
+        Periodically logs the slowest callbacks
+        """
+        while True:
+            await asyncio.sleep(interval)
+
+            if self.histograms:
+                log.info("Event latency (ms, sampling 1/{}):\n{}".format(self.sample_rate, self.format_stats()))
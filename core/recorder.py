@@ -0,0 +1,62 @@
+# coding=utf-8
+"""
+Records guild events as JSONL for the replay benchmark (bench/replay.py)
+Enabled with [Bench] record_events = path/to/events.jsonl in settings.ini
+"""
+import json
+
+
+def serialize_user(user) -> dict:
+    return {"id": user.id, "name": user.name, "bot": bool(user.bot)}
+
+
+def serialize_message(message) -> dict:
+    return {
+        "type": "message",
+        "id": message.id,
+        "content": message.content,
+        "author": serialize_user(message.author),
+        "guild": {"id": message.guild.id, "name": message.guild.name, "owner_id": message.guild.owner_id},
+        "channel": {"id": message.channel.id, "name": message.channel.name},
+        "mentions": [serialize_user(u) for u in message.mentions],
+        "role_mentions": len(message.role_mentions),
+    }
+
+
+def serialize_reaction(reaction, user) -> dict:
+    message = reaction.message
+    return {
+        "type": "reaction",
+        "message_id": message.id,
+        "emoji": str(reaction.emoji),
+        "user": serialize_user(user),
+        "guild": {"id": message.guild.id, "name": message.guild.name, "owner_id": message.guild.owner_id},
+        "channel": {"id": message.channel.id, "name": message.channel.name},
+    }
+
+
+class EventRecorder:
+    """
+    Appends guild events to a JSONL file (private messages are skipped)
+    """
+    def __init__(self, path: str):
+        self.file = open(path, "a", encoding="utf-8")
+        self.amount = 0
+
+    def _write(self, data: dict):
+        self.file.write(json.dumps(data, ensure_ascii=False) + "\n")
+        self.amount += 1
+
+        if self.amount % 100 == 0:
+            self.file.flush()
+
+    def record_message(self, message):
+        if message.guild is not None:
+            self._write(serialize_message(message))
+
+    def record_reaction(self, reaction, user):
+        if reaction.message.guild is not None:
+            self._write(serialize_reaction(reaction, user))
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,114 @@
+# coding=utf-8
+import logging
+
+log = logging.getLogger(__name__)
+
+# Commands starting with this character are relative to the guild prefix (_help -> !help)
+PREFIX_TOKEN = "_"
+
+# Key under which a trie node keeps the commands that end there (characters are always str)
+_TERMINAL = None
+
+
+class Route:
+    """
+    Result of CommandRouter.resolve: which plugins own the command in a message
+
+    command: longest matching command (as written in the plugin, e.g. "_cmd add")
+    plugin: name of the plugin that owns it
+    matches: plugin name -> longest command of that plugin that matches
+    """
+    __slots__ = ("command", "plugin", "matches")
+
+    def __init__(self, command: str, plugin: str, matches: dict):
+        self.command = command
+        self.plugin = plugin
+        self.matches = matches
+
+    def __contains__(self, plugin_name):
+        return plugin_name in self.matches
+
+
+class CommandRouter:
+    """
+    Prefix trie of every plugin's commands dict
+
+    Prefixed commands are stored without their prefix so a single trie serves every guild prefix;
+    resolve() strips the guild's prefix first. A command matches when the message starts with it
+    (with _ replaced by the prefix), followed by a space or the end of the message.
+    """
+    __slots__ = ("_absolute", "_prefixed", "size")
+
+    def __init__(self):
+        self._absolute = {}
+        self._prefixed = {}
+        self.size = 0
+
+    @staticmethod
+    def _insert(root: dict, text: str, command: str, plugin: str):
+        node = root
+        for char in text:
+            node = node.setdefault(char, {})
+
+        node.setdefault(_TERMINAL, []).append((command, plugin))
+
+    def build(self, plugin_commands: dict):
+        """
+        :param plugin_commands: plugin name -> commands dict (or any iterable of command names)
+        """
+        self._absolute = {}
+        self._prefixed = {}
+        self.size = 0
+
+        for plugin, commands in plugin_commands.items():
+            if not commands:
+                continue
+
+            for cmd in commands:
+                if cmd.startswith(PREFIX_TOKEN):
+                    self._insert(self._prefixed, cmd[len(PREFIX_TOKEN):], cmd, plugin)
+                else:
+                    self._insert(self._absolute, cmd, cmd, plugin)
+
+                self.size += 1
+
+        log.info("Built command router with {} commands".format(self.size))
+
+    @staticmethod
+    def _walk(root: dict, text: str, found: list):
+        node = root
+        length = len(text)
+
+        for index, char in enumerate(text, 1):
+            node = node.get(char)
+            if node is None:
+                return
+
+            # Commands are whole words: !cat matches "!cat" and "!cat me", but not "!catXXX"
+            owners = node.get(_TERMINAL)
+            if owners and (index == length or text[index] == " "):
+                found.extend(owners)
+
+    def resolve(self, content: str, prefix: str):
+        """
+        Returns a Route or None if the message is not a command
+        """
+        found = []
+
+        self._walk(self._absolute, content, found)
+        if prefix and content.startswith(prefix):
+            self._walk(self._prefixed, content[len(prefix):], found)
+
+        if not found:
+            return None
+
+        # Nodes are visited from the shortest to the longest match
+        matches = {}
+        longest = found[0]
+        for cmd, plugin in found:
+            matches[plugin] = cmd
+
+            if len(cmd) >= len(longest[0]):
+                longest = (cmd, plugin)
+
+        return Route(longest[0], longest[1], matches)
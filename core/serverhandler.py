@@ -1,8 +1,11 @@
 # coding=utf-8
+import asyncio
 import redis
+import redis.asyncio as aioredis
 import logging
 import time
 import os
+from collections import OrderedDict
 
 from discord import Member, Guild
 from .utils import Singleton, decode, bin2bool, SecurityError
@@ -120,6 +123,11 @@ class ServerHandler:
         log.info("Created ConnectionPool for {}:{}".format(ip, port))
         return redis.ConnectionPool(host=ip, port=port, password=password, **kwargs)
 
+    @staticmethod
+    def make_async_pool(ip, port, password, **kwargs):
+        log.info("Created asyncio ConnectionPool for {}:{}".format(ip, port))
+        return aioredis.ConnectionPool(host=ip, port=port, password=password, **kwargs)
+
     # Permission checker
     @staticmethod
     def has_role(member: Member, role_name: str):
@@ -182,16 +190,167 @@ mod_settings_map = {
     "invitefilter": INVITEFILTER_SETTING,
 }
 
+# Version of the guild's own word list (words:<id>), changes whenever the list does
+WORDLIST_VERSION_SETTING = "wordlistver"
+# Global counter the versions are taken from, so a version is never reused (not even after a reset)
+WORDLIST_VERSION_KEY = "words:version"
+# Longest word a guild can add to its word list
+WORD_MAX_LENGTH = 50
+
+# Version of the guild's custom commands (commands:<id>), same idea as the word list version
+COMMANDS_VERSION_SETTING = "cmdver"
+COMMANDS_VERSION_KEY = "commands:version"
+
+# Changes a versioned key (commands:<id>, words:<id>) and gives it a new version from its global counter, atomically
+# KEYS: changed key, server:<id>, version counter
+# ARGV: version setting, command, its arguments...
+VERSIONED_CHANGE_SCRIPT = """
+local result = redis.call(ARGV[2], KEYS[1], unpack(ARGV, 3))
+local version = redis.call("INCR", KEYS[3])
+redis.call("HSET", KEYS[2], ARGV[1], version)
+return {result, version}
+"""
+
+# Settings that are read on every message and are cached in-process
+CACHED_SETTINGS = ("prefix", "lang", "sleeping", WORDFILTER_SETTING, SPAMFILTER_SETTING, INVITEFILTER_SETTING,
+                   WORDLIST_VERSION_SETTING, COMMANDS_VERSION_SETTING)
+
+# Guilds that were cached on shutdown, used for warming up the cache
+CACHE_WARMUP_KEY = "cache:warmup"
+# How many guilds to warm up at most
+CACHE_WARMUP_MAX = 2500
+
+# Flags that must be present in notify-keyspace-events: K = keyspace events, g = generic (DEL, ...), h = hash commands
+KEYSPACE_FLAGS = "Kgh"
+
+
+class GuildSettingsCache:
+    """
+    Per-guild cache of CACHED_SETTINGS (server:<id> hash)
+
+    Writes through the handlers invalidate the guild instead of updating it (no write-through): keyspace notifications
+    (see AsyncRedisServerHandler.listen_for_invalidations) invalidate it again for our own writes, which is harmless,
+    and for writes of other processes.
+
+    Every invalidation (and clear) bumps the generation. Values read from redis are only stored if the generation is
+    still the one from before the read (see token), so an invalidation that arrives during the read is never overwritten.
+    An invalidation of another guild only means the values aren't cached this time, settings rarely change.
+    """
+    __slots__ = ("_guilds", "_generation", "hits", "misses", "invalidations")
+
+    def __init__(self):
+        # guild_id -> settings, least recently used first (see cached_guilds)
+        self._guilds = OrderedDict()
+        # Bumped by invalidate() and clear()
+        self._generation = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, guild_id: int):
+        settings = self._guilds.get(guild_id)
+
+        if settings is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._guilds.move_to_end(guild_id)
+
+        return settings
+
+    def __contains__(self, guild_id: int) -> bool:
+        # Doesn't count as a hit or a miss (see warm_up_cache)
+        return guild_id in self._guilds
+
+    def token(self) -> int:
+        """
+        Taken before reading settings from redis and passed to put
+        """
+        return self._generation
+
+    def put(self, guild_id: int, values: list, token: int = None) -> dict:
+        # values must be in the same order as CACHED_SETTINGS (HMGET response)
+        settings = dict(zip(CACHED_SETTINGS, decode(values)))
+
+        # Invalidated while reading: use the values for this message, but don't cache them
+        if token is None or token == self._generation:
+            self._guilds[guild_id] = settings
+
+        return settings
+
+    def invalidate(self, guild_id: int):
+        self._generation += 1
+
+        if self._guilds.pop(guild_id, None) is not None:
+            self.invalidations += 1
+
+    def clear(self):
+        self._generation += 1
+
+        self.invalidations += len(self._guilds)
+        self._guilds.clear()
+
+    def cached_guilds(self) -> list:
+        """
+        Cached guilds, least recently used first
+        """
+        return list(self._guilds.keys())
+
+    def get_stats(self) -> dict:
+        total = self.hits + self.misses
+
+        return {
+            "guilds": len(self._guilds),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_ratio": round(self.hits / total, 4) if total else 0,
+        }
+
+
+class GuildContext:
+    """
+    Everything the on_message chain needs to know about a guild, fetched once per message
+    (see AsyncRedisServerHandler.get_guild_context)
+    """
+    __slots__ = ("guild_id", "exists", "prefix", "lang", "sleeping", "muted", "blacklisted",
+                 "word_filter", "spam_filter", "invite_filter", "word_list_version", "commands_version")
+
+    def __init__(self, guild_id: int, exists: bool, settings: dict, muted: bool, blacklisted: bool):
+        self.guild_id = guild_id
+        self.exists = exists
+
+        self.prefix = settings["prefix"]
+        self.lang = settings["lang"]
+        self.sleeping = settings["sleeping"] is True
+
+        self.muted = muted
+        self.blacklisted = blacklisted
+
+        self.word_filter = settings[WORDFILTER_SETTING] is True
+        self.spam_filter = settings[SPAMFILTER_SETTING] is True
+        self.invite_filter = settings[INVITEFILTER_SETTING] is True
+        # None if the guild only uses banned_words.txt
+        self.word_list_version = settings[WORDLIST_VERSION_SETTING]
+        # None if the custom commands haven't changed since versions were introduced
+        self.commands_version = settings[COMMANDS_VERSION_SETTING]
+
+
 # IMPORTANT
 # The format for saving server data is => server:id_here
 # For commands => commands:id_here
 # For mutes => mutes:id_here
 # For blacklist => blacklist:id_here
 # For selfroles => sr:
+# For blocked words => words:id_here
 
 
 class RedisServerHandler(ServerHandler, metaclass=Singleton):
-    __slots__ = ("_redis", "redis", "pool")
+    """
+    Blocking handler, kept as a shim while plugins migrate to the coroutine versions in self.aio
+    """
+    __slots__ = ("_redis", "redis", "pool", "aio", "cache", "versioned_change")
 
     def __init__(self, loop, redis_ip, redis_port, redis_password):
         super().__init__()
@@ -200,11 +359,18 @@ class RedisServerHandler(ServerHandler, metaclass=Singleton):
         self.redis = None
         self.loop = loop
 
+        # Shared with self.aio
+        self.cache = GuildSettingsCache()
+
         self.pool = self.make_pool(redis_ip, redis_port, redis_password, db=0)
         self.redis = redis.StrictRedis(connection_pool=self.pool)
+        self.versioned_change = self.redis.register_script(VERSIONED_CHANGE_SCRIPT)
 
         self.verify_connection(redis_ip, redis_port, redis_password)
 
+        # Non-blocking counterpart with the same method names (see AsyncRedisServerHandler)
+        self.aio = AsyncRedisServerHandler(loop, redis_ip, redis_port, redis_password, self.cache)
+
     def verify_connection(self, redis_ip, redis_port, redis_password):
         try:
             self.redis.ping()
@@ -234,34 +400,9 @@ class RedisServerHandler(ServerHandler, metaclass=Singleton):
         # Remove entries with None
         return {a: b for a, b in s_data.items() if b is not None}
 
-    async def server_setup(self, guild: Guild):
-        # These are server defaults
-        s_data = await self._default_guild_data(guild)
-
-        sid = "server:{}".format(guild.id)
-
-        self.redis.hmset(sid, s_data)
-        # commands:id, mutes:id, blacklist:id and sr:id are created automatically when needed
-
-        log.info("New server: {}".format(guild.name))
-
-    def reset_server(self, guild: Guild):
-        server_data = self._default_guild_data(guild)
-        sid = "server:{}".format(guild.id)
-
-        self.redis.delete(sid)
-        self.redis.hmset(sid, server_data)
-
-        log.info("Guild reset: {}".format(guild.name))
-
     def server_exists(self, server_id: int) -> bool:
         return bool(self.redis.exists("server:{}".format(server_id)))
 
-    def auto_setup_server(self, server: Guild):
-        # shortcut for checking sever existence
-        if not self.server_exists(server.id):
-            self.server_setup(server)
-
     def get_server_data(self, server) -> dict:
         # NOTE: HGETALL returns a dict with binary keys and values!
         base = decode(self.redis.hgetall("server:{}".format(server.id)))
@@ -276,6 +417,15 @@ class RedisServerHandler(ServerHandler, metaclass=Singleton):
 
         return data
 
+    # CACHED SETTINGS
+    def get_settings(self, server_id: int) -> dict:
+        settings = self.cache.get(server_id)
+        if settings is None:
+            values = self.redis.hmget("server:{}".format(server_id), *CACHED_SETTINGS)
+            settings = self.cache.put(server_id, values)
+
+        return settings
+
     # GENERAL USE: moderation settings, server vars
     # TODO investigate uses
     def get_var(self, server_id: int, key: str):
@@ -284,14 +434,21 @@ class RedisServerHandler(ServerHandler, metaclass=Singleton):
 
     @validate_input
     def update_var(self, server_id: int, key: str, value: str) -> bool:
-        return bin2bool(self.redis.hset("server:{}".format(server_id), key, value))
+        resp = bin2bool(self.redis.hset("server:{}".format(server_id), key, value))
+        self.cache.invalidate(server_id)
+
+        return resp
 
     @validate_input
     def update_moderation_settings(self, server_id: int, key: str, value: bool) -> bool:
         if key not in mod_settings_map.keys():
             raise TypeError("invalid moderation setting: {}".format(key))
 
-        return bin2bool(self.redis.hset("server:{}".format(server_id), mod_settings_map.get(key), value))
+        setting = mod_settings_map.get(key)
+        resp = bin2bool(self.redis.hset("server:{}".format(server_id), setting, value))
+        self.cache.invalidate(server_id)
+
+        return resp
 
     def check_server_vars(self, server: Guild):
         try:
@@ -325,19 +482,33 @@ class RedisServerHandler(ServerHandler, metaclass=Singleton):
         self.redis.delete("server:{}".format(server_id))
         self.redis.delete("voting:{}".format(server_id))
         self.redis.delete("sr:{}".format(server_id))
+        self.redis.delete("words:{}".format(server_id))
+        self.cache.invalidate(server_id)
 
         log.info("Deleted server: {}".format(server_id))
 
     # COMMANDS
+    def _change_commands(self, server_id: int, command: str, *args):
+        """
+        Runs command on commands:<id> and gives the commands a new version, atomically (see VERSIONED_CHANGE_SCRIPT)
+        :return: result of the command
+        """
+        result, _ = self.versioned_change(
+            keys=["commands:{}".format(server_id), "server:{}".format(server_id), COMMANDS_VERSION_KEY],
+            args=[COMMANDS_VERSION_SETTING, command, *args])
+
+        self.cache.invalidate(server_id)
+        return result
+
     @validate_input
     def set_command(self, server: Guild, trigger: str, response: str) -> bool:
         if len(trigger) > 80:
             return False
 
-        return self.redis.hset("commands:{}".format(server.id), trigger, response)
+        return self._change_commands(server.id, "HSET", trigger, response)
 
     def remove_command(self, server: Guild, trigger: str) -> bool:
-        return bin2bool(self.redis.hdel("commands:{}".format(server.id), trigger))
+        return bin2bool(self._change_commands(server.id, "HDEL", trigger))
 
     def get_custom_commands(self, server_id: int) -> dict:
         return decode(self.redis.hgetall("commands:{}".format(server_id))) or {}
@@ -372,21 +543,22 @@ class RedisServerHandler(ServerHandler, metaclass=Singleton):
 
     # PREFIX
     def get_prefix(self, server: Guild) -> str:
-        return decode(self.redis.hget("server:{}".format(server.id), "prefix"))
+        return self.get_settings(server.id)["prefix"]
 
     @validate_input
     def change_prefix(self, server, prefix):
         self.redis.hset("server:{}".format(server.id), "prefix", prefix)
+        self.cache.invalidate(server.id)
 
     # MODERATION
     def has_spam_filter(self, server):
-        return decode(self.redis.hget("server:{}".format(server.id), SPAMFILTER_SETTING)) is True
+        return self.get_settings(server.id)[SPAMFILTER_SETTING] is True
 
     def has_word_filter(self, server):
-        return decode(self.redis.hget("server:{}".format(server.id), WORDFILTER_SETTING)) is True
+        return self.get_settings(server.id)[WORDFILTER_SETTING] is True
 
     def has_invite_filter(self, server):
-        return decode(self.redis.hget("server:{}".format(server.id), INVITEFILTER_SETTING)) is True
+        return self.get_settings(server.id)[INVITEFILTER_SETTING] is True
 
     def get_log_channel(self, server):
         return decode(self.redis.hget("server:{}".format(server.id), "logchannel"))
@@ -421,11 +593,12 @@ class RedisServerHandler(ServerHandler, metaclass=Singleton):
 
     # SLEEPING
     def is_sleeping(self, server_id):
-        return decode(self.redis.hget("server:{}".format(server_id), "sleeping"))
+        return self.get_settings(server_id)["sleeping"]
 
     @validate_input
     def set_sleeping(self, server, bool_var):
         self.redis.hset("server:{}".format(server.id), "sleeping", bool(bool_var))
+        self.cache.invalidate(server.id)
 
     # MUTING
     @validate_input
@@ -450,9 +623,10 @@ class RedisServerHandler(ServerHandler, metaclass=Singleton):
     @validate_input
     def set_lang(self, server_id, language):
         self.redis.hset("server:{}".format(server_id), "lang", language)
+        self.cache.invalidate(server_id)
 
     def get_lang(self, server_id):
-        return decode(self.redis.hget("server:{}".format(server_id), "lang"))
+        return self.get_settings(server_id)["lang"]
 
     # SELFROLES
     def get_selfroles(self, server_id):
@@ -584,5 +758,610 @@ class RedisCacheHandler(RedisPluginDataManager, ServerHandler, metaclass=Singlet
 
         super().__init__(self.pool)
 
+        self.aio = AsyncRedisCacheHandler(redis_ip, redis_port, redis_pass)
+
     def get_plugin_data_manager(self, namespace):
         return RedisPluginDataManager(self.pool, namespace)
+
+
+# Everything regarding the asyncio backend below
+# Method names and return values mirror the blocking classes above, but every call is a coroutine
+# and runs on an asyncio ConnectionPool, so waiting for redis doesn't block the event loop
+
+MAX_ASYNC_CONNECTIONS = 50
+
+
+class AsyncRedisServerHandler(ServerHandler, metaclass=Singleton):
+    __slots__ = ("redis", "pool", "loop", "cache", "versioned_change")
+
+    def __init__(self, loop, redis_ip, redis_port, redis_password, cache: GuildSettingsCache):
+        super().__init__()
+
+        self.loop = loop
+        self.cache = cache
+
+        self.pool = self.make_async_pool(redis_ip, redis_port, redis_password, db=0,
+                                         max_connections=MAX_ASYNC_CONNECTIONS)
+        self.redis = aioredis.StrictRedis(connection_pool=self.pool)
+        self.versioned_change = self.redis.register_script(VERSIONED_CHANGE_SCRIPT)
+
+    async def verify_connection(self):
+        try:
+            return await self.redis.ping()
+        except aioredis.ConnectionError:
+            log.error("Could not connect to redis (asyncio)! Check settings.ini and your redis server")
+            return False
+
+    async def bg_save(self):
+        return bool(await self.redis.bgsave() == b"OK")
+
+    # SERVER SETUPS
+    async def server_setup(self, guild: Guild):
+        # These are server defaults
+        s_data = await RedisServerHandler._default_guild_data(guild)
+
+        sid = "server:{}".format(guild.id)
+
+        # A fresh version, so custom commands cached before the guild was deleted aren't used again
+        s_data[COMMANDS_VERSION_SETTING] = await self.redis.incr(COMMANDS_VERSION_KEY)
+
+        await self.redis.hmset(sid, s_data)
+        self.cache.invalidate(guild.id)
+        # commands:id, mutes:id, blacklist:id and sr:id are created automatically when needed
+
+        log.info("New server: {}".format(guild.name))
+
+    async def reset_server(self, guild: Guild):
+        server_data = await RedisServerHandler._default_guild_data(guild)
+        sid = "server:{}".format(guild.id)
+
+        # The word list and custom commands are kept (like selfroles), so are their versions
+        versions = await self.redis.hmget(sid, WORDLIST_VERSION_SETTING, COMMANDS_VERSION_SETTING)
+        for setting, version in zip((WORDLIST_VERSION_SETTING, COMMANDS_VERSION_SETTING), versions):
+            if version:
+                server_data[setting] = version
+
+        async with self.redis.pipeline() as pipe:
+            pipe.delete(sid)
+            pipe.hmset(sid, server_data)
+            await pipe.execute()
+
+        self.cache.invalidate(guild.id)
+
+        log.info("Guild reset: {}".format(guild.name))
+
+    async def server_exists(self, server_id: int) -> bool:
+        return bool(await self.redis.exists("server:{}".format(server_id)))
+
+    async def auto_setup_server(self, server: Guild):
+        # shortcut for checking sever existence
+        if not await self.server_exists(server.id):
+            await self.server_setup(server)
+
+    async def get_server_data(self, server) -> dict:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hgetall("server:{}".format(server.id))
+            pipe.hgetall("commands:{}".format(server.id))
+            pipe.smembers("blacklist:{}".format(server.id))
+            pipe.smembers("mutes:{}".format(server.id))
+            base, cmd_list, bl, mutes = await pipe.execute()
+
+        data = decode(base)
+        data["commands"] = decode(cmd_list) or {}
+        data["blacklist"] = list(decode(bl) or [])
+        data["mutes"] = list(decode(mutes) or [])
+
+        return data
+
+    # CACHED SETTINGS
+    async def get_settings(self, server_id: int) -> dict:
+        settings = self.cache.get(server_id)
+        if settings is None:
+            token = self.cache.token()
+            values = await self.redis.hmget("server:{}".format(server_id), *CACHED_SETTINGS)
+            settings = self.cache.put(server_id, values, token)
+
+        return settings
+
+    async def get_guild_context(self, message) -> GuildContext:
+        """
+        Fetches per-message guild data in a single round trip
+        Settings come from the cache when possible, everything else is pipelined
+        """
+        guild_id = message.guild.id
+        settings = self.cache.get(guild_id)
+        token = self.cache.token()
+
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.exists("server:{}".format(guild_id))
+            pipe.sismember("mutes:{}".format(guild_id), message.author.id)
+            pipe.sismember("blacklist:{}".format(guild_id), message.channel.id)
+
+            if settings is None:
+                pipe.hmget("server:{}".format(guild_id), *CACHED_SETTINGS)
+
+            exists, muted, blacklisted, *values = await pipe.execute()
+
+        if settings is None:
+            settings = self.cache.put(guild_id, values[0], token)
+
+        return GuildContext(guild_id, bool(exists), settings, bool(muted), bool(blacklisted))
+
+    async def warm_up_cache(self, guild_ids: list):
+        """
+        Fetches settings of all given guilds in one pipeline and fills the cache directly (no hits or misses are counted)
+        """
+        guild_ids = [g for g in guild_ids if g not in self.cache]
+        if not guild_ids:
+            return 0
+
+        token = self.cache.token()
+
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for guild_id in guild_ids:
+                pipe.hmget("server:{}".format(guild_id), *CACHED_SETTINGS)
+
+            results = await pipe.execute()
+
+        for guild_id, values in zip(guild_ids, results):
+            self.cache.put(guild_id, values, token)
+
+        return len(guild_ids)
+
+    async def get_warmup_guilds(self) -> list:
+        return [int(a) for a in await self.redis.srandmember(CACHE_WARMUP_KEY, CACHE_WARMUP_MAX)]
+
+    async def save_warmup_guilds(self):
+        # The most recently used ones
+        guilds = self.cache.cached_guilds()[-CACHE_WARMUP_MAX:]
+
+        async with self.redis.pipeline() as pipe:
+            pipe.delete(CACHE_WARMUP_KEY)
+            if guilds:
+                pipe.sadd(CACHE_WARMUP_KEY, *guilds)
+            await pipe.execute()
+
+    async def enable_keyspace_events(self) -> bool:
+        try:
+            current = (await self.redis.config_get("notify-keyspace-events")).get("notify-keyspace-events", "")
+            if isinstance(current, bytes):
+                current = current.decode()
+
+            missing = "".join(flag for flag in KEYSPACE_FLAGS if flag not in current)
+            if missing:
+                await self.redis.config_set("notify-keyspace-events", current + missing)
+
+            return True
+        except aioredis.ResponseError:
+            # CONFIG can be disabled (managed redis), notify-keyspace-events must then be set in redis.conf
+            log.warning("Could not enable keyspace notifications, settings cache will not be invalidated across processes")
+            return False
+
+    async def listen_for_invalidations(self):
+        """
+        Invalidates cached guild settings whenever a server:<id> hash is changed (by any process)
+        """
+        pattern = "__keyspace@{}__:server:*".format(self.pool.connection_kwargs.get("db", 0))
+        prefix_len = len(pattern) - 1
+
+        while True:
+            pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+
+            try:
+                await pubsub.psubscribe(pattern)
+                log.info("Listening for settings invalidations")
+
+                async for msg in pubsub.listen():
+                    try:
+                        channel = msg["channel"]
+                        if isinstance(channel, bytes):
+                            channel = channel.decode()
+
+                        self.cache.invalidate(int(channel[prefix_len:]))
+                    except (KeyError, TypeError, ValueError, UnicodeDecodeError):
+                        log.debug("Ignoring keyspace message: {}".format(msg))
+
+            except asyncio.CancelledError:
+                raise
+            except aioredis.ConnectionError:
+                log.warning("Lost the invalidation subscription, clearing settings cache and retrying in 5s")
+            except Exception:
+                # Anything else (timeouts, bad replies, ...) must not end the task, the cache would never be invalidated again
+                log.exception("Invalidation listener failed, clearing settings cache and retrying in 5s")
+            finally:
+                try:
+                    await pubsub.reset()
+                except Exception as e:
+                    log.warning("Could not reset the invalidation subscription: {}".format(e))
+
+            # Updates might have been missed while disconnected
+            self.cache.clear()
+            await asyncio.sleep(5)
+
+    # GENERAL USE: moderation settings, server vars
+    async def get_var(self, server_id: int, key: str):
+        # If value is in json, it will be a json-encoded string and not parsed
+        return decode(await self.redis.hget("server:{}".format(server_id), key))
+
+    @validate_input
+    async def update_var(self, server_id: int, key: str, value: str) -> bool:
+        resp = bin2bool(await self.redis.hset("server:{}".format(server_id), key, value))
+        self.cache.invalidate(server_id)
+
+        return resp
+
+    @validate_input
+    async def update_moderation_settings(self, server_id: int, key: str, value: bool) -> bool:
+        if key not in mod_settings_map.keys():
+            raise TypeError("invalid moderation setting: {}".format(key))
+
+        setting = mod_settings_map.get(key)
+        resp = bin2bool(await self.redis.hset("server:{}".format(server_id), setting, value))
+        self.cache.invalidate(server_id)
+
+        return resp
+
+    async def check_server_vars(self, server: Guild):
+        try:
+            sid = "server:{}".format(server.id)
+            owner, name = decode(await self.redis.hmget(sid, "owner", "name"))
+
+            if owner != server.owner.id:
+                await self.redis.hset(sid, "owner", server.owner.id)
+
+            if name != str(server.name):
+                await self.redis.hset(sid, "name", server.name)
+        except AttributeError:
+            pass
+
+    async def check_old_servers(self, current_servers: list):
+        servers = ["server:" + str(s_id) for s_id in current_servers]
+        redis_servers = [decode(a) async for a in self.redis.scan_iter(match="server:*")]
+
+        # Filter - only remove server that nano is not part of anymore
+        removed_servers = set(redis_servers) - set(servers)
+
+        # Delete every old server
+        for rem_serv in removed_servers:
+            await self.delete_server(rem_serv.strip("server:"))
+
+        log.info("Removed {} old servers.".format(len(removed_servers)))
+
+    async def delete_server(self, server_id: int):
+        await self.redis.delete("commands:{}".format(server_id),
+                                "blacklist:{}".format(server_id),
+                                "mutes:{}".format(server_id),
+                                "server:{}".format(server_id),
+                                "voting:{}".format(server_id),
+                                "sr:{}".format(server_id),
+                                "words:{}".format(server_id))
+        self.cache.invalidate(server_id)
+
+        log.info("Deleted server: {}".format(server_id))
+
+    # COMMANDS
+    async def _change_commands(self, server_id: int, command: str, *args):
+        """
+        Runs command on commands:<id> and gives the commands a new version, atomically (see VERSIONED_CHANGE_SCRIPT)
+        :return: result of the command
+        """
+        result, _ = await self.versioned_change(
+            keys=["commands:{}".format(server_id), "server:{}".format(server_id), COMMANDS_VERSION_KEY],
+            args=[COMMANDS_VERSION_SETTING, command, *args])
+
+        self.cache.invalidate(server_id)
+        return result
+
+    @validate_input
+    async def set_command(self, server: Guild, trigger: str, response: str) -> bool:
+        if len(trigger) > 80:
+            return False
+
+        return await self._change_commands(server.id, "HSET", trigger, response)
+
+    async def remove_command(self, server: Guild, trigger: str) -> bool:
+        return bin2bool(await self._change_commands(server.id, "HDEL", trigger))
+
+    async def get_custom_commands(self, server_id: int) -> dict:
+        return decode(await self.redis.hgetall("commands:{}".format(server_id))) or {}
+
+    async def get_command_list(self, server_id: int) -> tuple:
+        """
+        Returns (version, {trigger: response}) of a guild's custom commands, read together so they always match
+        """
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hget("server:{}".format(server_id), COMMANDS_VERSION_SETTING)
+            pipe.hgetall("commands:{}".format(server_id))
+            version, commands = await pipe.execute()
+
+        return decode(version), {str(k): str(v) for k, v in (decode(commands) or {}).items()}
+
+    # WORD LISTS
+    async def _change_words(self, server_id: int, command: str, *args) -> int:
+        """
+        Runs command on words:<id> and gives the list a new version, atomically (see VERSIONED_CHANGE_SCRIPT)
+        :return: result of the command
+        """
+        result, _ = await self.versioned_change(
+            keys=["words:{}".format(server_id), "server:{}".format(server_id), WORDLIST_VERSION_KEY],
+            args=[WORDLIST_VERSION_SETTING, command, *args])
+
+        self.cache.invalidate(server_id)
+        return result
+
+    async def add_words(self, server_id: int, words: list) -> int:
+        # Lists are checked word by word, validate_input would limit the length of the whole list
+        if [a for a in words if len(a) > WORD_MAX_LENGTH]:
+            security_error(self.add_words, (server_id, words), {})
+
+        return await self._change_words(server_id, "SADD", *words)
+
+    async def remove_words(self, server_id: int, words: list) -> int:
+        if [a for a in words if len(a) > WORD_MAX_LENGTH]:
+            security_error(self.remove_words, (server_id, words), {})
+
+        return await self._change_words(server_id, "SREM", *words)
+
+    async def clear_words(self, server_id: int):
+        async with self.redis.pipeline() as pipe:
+            pipe.delete("words:{}".format(server_id))
+            pipe.hdel("server:{}".format(server_id), WORDLIST_VERSION_SETTING)
+            await pipe.execute()
+
+        self.cache.invalidate(server_id)
+
+    async def get_words(self, server_id: int) -> list:
+        return sorted(str(a) for a in decode(await self.redis.smembers("words:{}".format(server_id))) or [])
+
+    async def get_word_list(self, server_id: int) -> tuple:
+        """
+        Returns (version, words) of a guild's word list, read together so they always match
+        """
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hget("server:{}".format(server_id), WORDLIST_VERSION_SETTING)
+            pipe.smembers("words:{}".format(server_id))
+            version, words = await pipe.execute()
+
+        return decode(version), [str(a) for a in decode(words) or []]
+
+    async def get_custom_commands_keys(self, server_id: int) -> list:
+        return decode(await self.redis.hkeys("commands:{}".format(server_id))) or []
+
+    async def get_custom_command_by_key(self, server_id: int, key: str) -> str:
+        return decode(await self.redis.hget("commands:{}".format(server_id), key))
+
+    async def get_command_amount(self, server_id: int) -> int:
+        return decode(await self.redis.hlen("commands:{}".format(server_id)))
+
+    async def custom_command_exists(self, server_id: int, trigger: str):
+        return await self.redis.hexists("commands:{}".format(server_id), trigger)
+
+    # CHANNEL BLACKLIST
+    @validate_input
+    async def add_channel_blacklist(self, server_id: int, channel_id: int):
+        return bool(await self.redis.sadd("blacklist:{}".format(server_id), channel_id))
+
+    @validate_input
+    async def remove_channel_blacklist(self, server_id: int, channel_id: int):
+        return bool(await self.redis.srem("blacklist:{}".format(server_id), channel_id))
+
+    async def is_blacklisted(self, server_id, channel_id):
+        return await self.redis.sismember("blacklist:{}".format(server_id), channel_id)
+
+    async def get_blacklists(self, server_id):
+        return list(decode(await self.redis.smembers("blacklist:{}".format(server_id))) or [])
+
+    # PREFIX
+    async def get_prefix(self, server: Guild) -> str:
+        return (await self.get_settings(server.id))["prefix"]
+
+    @validate_input
+    async def change_prefix(self, server, prefix):
+        await self.redis.hset("server:{}".format(server.id), "prefix", prefix)
+        self.cache.invalidate(server.id)
+
+    # MODERATION
+    async def has_spam_filter(self, server):
+        return (await self.get_settings(server.id))[SPAMFILTER_SETTING] is True
+
+    async def has_word_filter(self, server):
+        return (await self.get_settings(server.id))[WORDFILTER_SETTING] is True
+
+    async def has_invite_filter(self, server):
+        return (await self.get_settings(server.id))[INVITEFILTER_SETTING] is True
+
+    async def get_log_channel(self, server):
+        return decode(await self.redis.hget("server:{}".format(server.id), "logchannel"))
+
+    async def get_defaultchannel(self, server_id):
+        return decode(await self.redis.hget("server:{}".format(server_id), "dchan"))
+
+    @validate_input
+    async def set_defaultchannel(self, server, channel_id):
+        await self.redis.hset("server:{}".format(server.id), "dchan", channel_id)
+
+    # SETTINGS
+    @validate_input
+    async def set_custom_channel(self, guild_id, var_name, value):
+        if var_name not in ["logchannel", "dchan"]:
+            raise TypeError("invalid channel type")
+
+        if value is not None:
+            return bin2bool(await self.redis.hset("server:{}".format(guild_id), var_name, value))
+        else:
+            return await self.redis.hdel("server:{}".format(guild_id), var_name)
+
+    @validate_input
+    async def set_custom_event_message(self, guild_id, var_name, value):
+        if var_name not in ["welcomemsg", "banmsg", "kickmsg", "leavemsg"]:
+            raise TypeError("invalid event type")
+
+        if value is not None:
+            return bin2bool(await self.redis.hset("server:{}".format(guild_id), var_name, value))
+        else:
+            return await self.redis.hdel("server:{}".format(guild_id), var_name)
+
+    # SLEEPING
+    async def is_sleeping(self, server_id):
+        return (await self.get_settings(server_id))["sleeping"]
+
+    @validate_input
+    async def set_sleeping(self, server, bool_var):
+        await self.redis.hset("server:{}".format(server.id), "sleeping", str(bool(bool_var)))
+        self.cache.invalidate(server.id)
+
+    # MUTING
+    @validate_input
+    async def mute(self, server, user_id):
+        return bool(await self.redis.sadd("mutes:{}".format(server.id), user_id))
+
+    @validate_input
+    async def unmute(self, member_id, server_id):
+        return bool(await self.redis.srem("mutes:{}".format(server_id), member_id))
+
+    async def is_muted(self, server, user_id):
+        return bool(await self.redis.sismember("mutes:{}".format(server.id), user_id))
+
+    async def get_mute_list(self, server):
+        return list(decode(await self.redis.smembers("mutes:{}".format(server.id))) or [])
+
+    # LANGUAGES
+    @validate_input
+    async def set_lang(self, server_id, language):
+        await self.redis.hset("server:{}".format(server_id), "lang", language)
+        self.cache.invalidate(server_id)
+
+    async def get_lang(self, server_id):
+        return (await self.get_settings(server_id))["lang"]
+
+    # SELFROLES
+    async def get_selfroles(self, server_id):
+        return decode(await self.redis.smembers("sr:{}".format(server_id)))
+
+    @validate_input
+    async def add_selfrole(self, server_id, role_name):
+        return bin2bool(await self.redis.sadd("sr:{}".format(server_id), role_name))
+
+    @validate_input
+    async def remove_selfrole(self, server_id, role_name):
+        return bin2bool(await self.redis.srem("sr:{}".format(server_id), role_name))
+
+    async def is_selfrole(self, server_id, role_name):
+        return bin2bool(await self.redis.sismember("sr:{}".format(server_id), role_name))
+
+    # Special debug methods
+    async def db_info(self, section=None):
+        return decode(await self.redis.info(section=section))
+
+    async def db_size(self):
+        return int(await self.redis.dbsize())
+
+    # Plugin storage system
+    def get_plugin_data_manager(self, namespace, *args, **kwargs) -> "AsyncRedisPluginDataManager":
+        return AsyncRedisPluginDataManager(self.pool, namespace, *args, **kwargs)
+
+    def _get_redis_instance(self):
+        return self.redis
+
+
+class AsyncRedisPluginDataManager:
+    def __init__(self, pool, namespace=None, *_, **__):
+        self.namespace = namespace
+        self.redis = aioredis.StrictRedis(connection_pool=pool)
+
+        log.info("New asyncio plugin namespace registered: {}".format(self.namespace or "(no namespace)"))
+
+    def _make_key(self, name):
+        if not self.namespace:
+            return name
+
+        # Returns a hash name formatted with the namespace
+        return "{}:{}".format(self.namespace, name)
+
+    async def set(self, key, val, **kwargs):
+        return decode(await self.redis.set(self._make_key(key), val, **kwargs))
+
+    async def get(self, key):
+        return decode(await self.redis.get(self._make_key(key)))
+
+    async def hget(self, name, field, use_namespace=True):
+        return decode(await self.redis.hget(self._make_key(name) if use_namespace else name, field))
+
+    async def hgetall(self, name, use_namespace=True):
+        return decode(await self.redis.hgetall(self._make_key(name) if use_namespace else name))
+
+    async def hdel(self, name, field):
+        return decode(await self.redis.hdel(self._make_key(name), field))
+
+    async def hmset(self, name, payload):
+        return await self.redis.hmset(self._make_key(name), payload)
+
+    async def hset(self, name, field, value):
+        return decode(await self.redis.hset(self._make_key(name), field, value))
+
+    async def hexists(self, name, field):
+        return await self.redis.hexists(name, field)
+
+    async def exists(self, name, use_namespace=True):
+        return await self.redis.exists(self._make_key(name) if use_namespace else name)
+
+    async def delete(self, name, use_namespace=True):
+        return await self.redis.delete(self._make_key(name) if use_namespace else name)
+
+    async def scan(self, cursor, use_namespace=True, match=None, **kwargs):
+        match = self._make_key(match) if use_namespace else match
+        return await self.redis.scan(cursor, match=match, **kwargs)
+
+    async def sscan(self, name, cursor, use_namespace=True, match=None, **kwargs):
+        match = self._make_key(match) if use_namespace else match
+        return await self.redis.sscan(name, cursor, match=match, **kwargs)
+
+    async def scan_iter(self, match, use_namespace=True):
+        match = self._make_key(match) if use_namespace else match
+        return [a.decode() async for a in self.redis.scan_iter(match)]
+
+    async def sscan_iter(self, name, match=None, use_namespace=True):
+        name = self._make_key(name) if use_namespace else name
+        return [a.decode() async for a in self.redis.sscan_iter(name, match)]
+
+    async def lpush(self, key, value):
+        return await self.redis.lpush(self._make_key(key), value)
+
+    async def lrange(self, key, from_key=0, to_key=-1):
+        return decode(await self.redis.lrange(self._make_key(key), from_key, to_key))
+
+    async def lrem(self, key, value, count=1):
+        return decode(await self.redis.lrem(self._make_key(key), count, value))
+
+    async def lpop(self, key):
+        return decode(await self.redis.lpop(self._make_key(key)))
+
+    async def sadd(self, name, *values):
+        return await self.redis.sadd(self._make_key(name), *values)
+
+    async def srandmember(self, name, amount=1):
+        return decode(await self.redis.srandmember(self._make_key(name), amount))
+
+    async def scard(self, name):
+        return await self.redis.scard(self._make_key(name))
+
+    def pipeline(self, **options):
+        # Commands are queued synchronously, only execute() has to be awaited
+        return self.redis.pipeline(**options)
+
+    async def expire(self, name, time):
+        return await self.redis.expire(name, int(time))
+
+    async def ttl(self, name):
+        return decode(await self.redis.ttl(name))
+
+
+class AsyncRedisCacheHandler(AsyncRedisPluginDataManager, ServerHandler, metaclass=Singleton):
+    def __init__(self, redis_ip, redis_port, redis_pass):
+        self.pool = self.make_async_pool(redis_ip, redis_port, redis_pass, db=0,
+                                         max_connections=MAX_ASYNC_CONNECTIONS)
+
+        super().__init__(self.pool)
+
+    def get_plugin_data_manager(self, namespace):
+        return AsyncRedisPluginDataManager(self.pool, namespace)
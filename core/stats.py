@@ -1,7 +1,10 @@
 # coding=utf-8
+import asyncio
 import configparser
 import logging
+import time
 import redis
+import redis.asyncio as aioredis
 from .utils import decode
 
 __author__ = "DefaltSimon"
@@ -27,25 +30,69 @@ PING = "timespinged"
 SUPPRESS = "messagessuppressed"
 DOWNLOAD = "imagesize"
 PRAYER = "prayerssaid"
+SEEN = "messagesseen"
+ERROR = "errors"
 
-stat_types = [MESSAGE, WRONG_ARG, SERVER_LEFT, SLEPT, WRONG_PERMS, HELP, IMAGE_SENT, VOTE, PING, SUPPRESS, DOWNLOAD, PRAYER]
+stat_types = [MESSAGE, WRONG_ARG, SERVER_LEFT, SLEPT, WRONG_PERMS, HELP, IMAGE_SENT, VOTE, PING, SUPPRESS, DOWNLOAD, PRAYER,
+              SEEN, ERROR]
+
+# Stat types that are also kept as a time series (see nano.dev.history)
+SERIES = {
+    MESSAGE: "commands",
+    SEEN: "messages",
+    SUPPRESS: "suppressed",
+    ERROR: "errors",
+}
 
 
 # Regarding NanoStats
 # Stats are saved in a hash => stats
+# Increments are kept in memory and written by a background flusher in one pipeline
+
+# Time series are stored per minute, hour and day:
+#   stats:ts:m:<hours since epoch> -> hash of <series>:<minute of the hour> (kept for 2 days)
+#   stats:ts:h:<days since epoch>  -> hash of <series>:<hour of the day> (kept for 35 days)
+#   stats:ts:d:<days since epoch // 30> -> hash of <series>:<day of the 30 days> (kept for 400 days)
+TS_MINUTES = "stats:ts:m:{}"
+TS_HOURS = "stats:ts:h:{}"
+TS_DAYS = "stats:ts:d:{}"
+
+# Days per stats:ts:d hash
+TS_DAYS_PER_HASH = 30
+
+TS_MINUTES_TTL = 60 * 60 * 48
+TS_HOURS_TTL = 60 * 60 * 24 * 35
+TS_DAYS_TTL = 60 * 60 * 24 * 400
+
+# Flush at least this often (in seconds)
+FLUSH_INTERVAL = 30
+# or as soon as this many increments are pending
+FLUSH_THRESHOLD = 100
 
 
 class NanoStats:
-    __slots__ = ("_redis", "redis", "loop", "_pending_data", "MAX_BEFORE_UPDATE")
+    __slots__ = ("_redis", "redis", "aio", "loop", "_pending_data", "_pending_series", "_pending_total",
+                 "_flushing", "_flushing_series", "_wake", "flush_interval", "flush_threshold")
 
-    def __init__(self, loop, redis_ip, redis_port, redis_pass):
+    def __init__(self, loop, redis_ip, redis_port, redis_pass,
+                 flush_interval=FLUSH_INTERVAL, flush_threshold=FLUSH_THRESHOLD):
         self.loop = loop
         self.redis = None
 
         self._pending_data = {a: 0 for a in stat_types}
-        self.MAX_BEFORE_UPDATE = 5
+        # (series, minutes since epoch) -> amount
+        self._pending_series = {}
+        self._pending_total = 0
+        # Increments that are being written right now
+        self._flushing = {}
+        self._flushing_series = {}
+
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self._wake = asyncio.Event()
 
         self.redis = redis.StrictRedis(host=redis_ip, port=redis_port, password=redis_pass)
+        self.aio = aioredis.StrictRedis(host=redis_ip, port=redis_port, password=redis_pass)
 
         try:
             self.redis.ping()
@@ -61,26 +108,177 @@ class NanoStats:
         else:
             log.info("Enabled: stats found")
 
-
-
-    def add(self, stat_type):
+    def add(self, stat_type, amount=1):
         if stat_type not in stat_types:
             return False
 
-        self._pending_data[stat_type] += 1
+        self._pending_data[stat_type] += amount
+        self._pending_total += 1
+
+        series = SERIES.get(stat_type)
+        if series:
+            key = (series, int(time.time() // 60))
+            self._pending_series[key] = self._pending_series.get(key, 0) + amount
 
-        value = self._pending_data[stat_type]
-        if value >= self.MAX_BEFORE_UPDATE:
-            log.debug("Reached max size, posting to redis...")
-            # Send data and reset the pending counter
-            self.redis.hincrby("stats", stat_type, value)
-            self._pending_data[stat_type] = 0
+        if self._pending_total >= self.flush_threshold:
+            self._wake.set()
+
+    def _take_pending(self) -> tuple:
+        pending = {typ: value for typ, value in self._pending_data.items() if value}
+        series = self._pending_series
+
+        self._pending_data = {a: 0 for a in stat_types}
+        self._pending_series = {}
+        self._pending_total = 0
+
+        return pending, series
+
+    def _restore_pending(self, pending: dict, series: dict):
+        for typ, value in pending.items():
+            self._pending_data[typ] += value
+            self._pending_total += 1
+
+        for key, value in series.items():
+            self._pending_series[key] = self._pending_series.get(key, 0) + value
+
+    @staticmethod
+    def _queue_writes(pipe, pending: dict, series: dict):
+        for typ, value in pending.items():
+            pipe.hincrby("stats", typ, value)
+
+        # Downsample right away, the hour and day buckets get the same increments
+        touched = set()
+        for (name, minute), value in series.items():
+            hour = minute // 60
+            day = hour // 24
+            days = day // TS_DAYS_PER_HASH
+
+            pipe.hincrby(TS_MINUTES.format(hour), "{}:{}".format(name, minute % 60), value)
+            pipe.hincrby(TS_HOURS.format(day), "{}:{}".format(name, hour % 24), value)
+            pipe.hincrby(TS_DAYS.format(days), "{}:{}".format(name, day % TS_DAYS_PER_HASH), value)
+
+            touched.add((hour, day, days))
+
+        for hour, day, days in touched:
+            pipe.expire(TS_MINUTES.format(hour), TS_MINUTES_TTL)
+            pipe.expire(TS_HOURS.format(day), TS_HOURS_TTL)
+            pipe.expire(TS_DAYS.format(days), TS_DAYS_TTL)
+
+    async def flush_async(self):
+        pending, series = self._take_pending()
+        if not pending:
+            return
+
+        self._flushing = pending
+        self._flushing_series = series
+
+        try:
+            pipe = self.aio.pipeline(transaction=False)
+            self._queue_writes(pipe, pending, series)
+
+            await pipe.execute()
+            log.debug("Flushed {} counters".format(len(pending)))
+
+        except aioredis.RedisError as e:
+            # Keep the increments for the next flush
+            log.warning("Could not flush stats: {}".format(e))
+            self._restore_pending(pending, series)
+
+        finally:
+            self._flushing = {}
+            self._flushing_series = {}
+
+    def flush(self):
+        """
+        Blocking flush, used on shutdown
+        """
+        pending, series = self._take_pending()
+        if not pending:
+            return
+
+        pipe = self.redis.pipeline(transaction=False)
+        self._queue_writes(pipe, pending, series)
+
+        pipe.execute()
+        log.info("Flushed {} counters".format(len(pending)))
+
+    async def run_flusher(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+
+            self._wake.clear()
+            await self.flush_async()
+
+    def _unflushed(self, typ) -> int:
+        return self._pending_data.get(typ, 0) + self._flushing.get(typ, 0)
 
     def get_data(self):
-        return decode(self.redis.hgetall("stats"))
+        data = decode(self.redis.hgetall("stats"))
+
+        # Include increments that haven't been written yet
+        for typ in stat_types:
+            unflushed = self._unflushed(typ)
+            if unflushed:
+                data[typ] = int(data.get(typ) or 0) + unflushed
+
+        return data
 
     def get_amount(self, typ):
         if typ not in stat_types:
             raise TypeError("invalid type")
 
-        return decode(self.redis.hget("stats", typ))
+        return int(decode(self.redis.hget("stats", typ)) or 0) + self._unflushed(typ)
+
+    async def get_history(self, resolution: str = "hour", amount: int = 24) -> dict:
+        """
+        Returns series name -> list of counts per minute/hour/day, oldest first, ending with the current one
+        Unflushed increments (pending and the ones being flushed) are included.
+        """
+        size = {"minute": 60, "hour": 60 * 60, "day": 60 * 60 * 24}[resolution]
+        last = int(time.time() // size)
+        indexes = range(last - amount + 1, last + 1)
+
+        # Which hashes hold these buckets: minutes are grouped per hour, hours per day, days per TS_DAYS_PER_HASH
+        if resolution == "minute":
+            keys = sorted(set(i // 60 for i in indexes))
+            hashes = [TS_MINUTES.format(k) for k in keys]
+        elif resolution == "hour":
+            keys = sorted(set(i // 24 for i in indexes))
+            hashes = [TS_HOURS.format(k) for k in keys]
+        else:
+            keys = sorted(set(i // TS_DAYS_PER_HASH for i in indexes))
+            hashes = [TS_DAYS.format(k) for k in keys]
+
+        pipe = self.aio.pipeline(transaction=False)
+        for name in hashes:
+            pipe.hgetall(name)
+
+        results = await pipe.execute()
+        history = {name: [0] * amount for name in SERIES.values()}
+
+        for key, data in zip(keys, results):
+            for field, value in data.items():
+                name, index = field.decode().split(":")
+
+                # Fields are relative to their hash
+                if resolution == "minute":
+                    index = key * 60 + int(index)
+                elif resolution == "hour":
+                    index = key * 24 + int(index)
+                else:
+                    index = key * TS_DAYS_PER_HASH + int(index)
+
+                position = index - indexes[0]
+                if name in history and 0 <= position < amount:
+                    history[name][position] += int(value)
+
+        for series in (self._pending_series, self._flushing_series):
+            for (name, minute), value in series.items():
+                position = minute * 60 // size - indexes[0]
+                if 0 <= position < amount:
+                    history[name][position] += value
+
+        return history
@@ -0,0 +1,297 @@
+# coding=utf-8
+import re
+import time
+from collections import OrderedDict
+from datetime import datetime
+from random import randint, choice
+
+from .utils import IgnoredException, filter_text
+
+# Syntaxes a TemplateEngine understands (flags, can be combined)
+# {author|name}, {mentions|0|id}, {rnd|1|6}, {time|format|%H:%M}, {choose|a|b}, {onfail|text} (custom commands)
+BRACES = 1
+# :user, :username, :server (welcome, leave, kick and ban messages)
+COLONS = 2
+
+# Compiled templates kept in memory
+TEMPLATE_CACHE_SIZE = 512
+# Budgets of a single render: evaluated groups and characters (Discord's message limit)
+RENDER_MAX_OPS = 100
+RENDER_MAX_LENGTH = 2000
+
+_BRACES_RE = r"{.+?}"
+_COLONS_RE = r":username|:user|:server"
+_PATTERNS = {
+    BRACES: re.compile(_BRACES_RE),
+    COLONS: re.compile(_COLONS_RE),
+    BRACES | COLONS: re.compile("{}|{}".format(_BRACES_RE, _COLONS_RE)),
+}
+
+# Op kinds
+_TEXT = 0
+_VALUE = 1
+_ONFAIL = 2
+
+# {onfail|raw}: the error itself is sent
+_RAW_ERROR = object()
+
+_USER_ATTRIBUTES = {
+    "name": "display_name",
+    "id": "id",
+    "mention": "mention",
+    "discrim": "discriminator",
+}
+
+
+class RenderError(IgnoredException):
+    """
+    Raised when a template fails (without {onfail}) or goes over its budget
+    """
+    pass
+
+
+class TemplateContext:
+    """
+    What templates can refer to: author (or the member that joined/left), mentions and the guild
+    """
+    __slots__ = ("author", "mentions", "guild")
+
+    def __init__(self, author, mentions, guild):
+        self.author = author
+        self.mentions = mentions
+        self.guild = guild
+
+    @classmethod
+    def from_message(cls, message):
+        return cls(message.author, message.mentions, message.guild)
+
+    @classmethod
+    def from_member(cls, member):
+        return cls(member, (), member.guild)
+
+
+def _user_value(attribute: str):
+    if attribute == "avatar":
+        return lambda user: user.avatar_url or user.default_avatar_url
+
+    attribute = _USER_ATTRIBUTES.get(attribute, "name")
+    if attribute in ("id", "mention"):
+        return lambda user: getattr(user, attribute)
+
+    # Names are chosen by members, they must not ping everyone
+    return lambda user: filter_text(getattr(user, attribute), user_mention=False)
+
+
+def _get_mention(ctx, index: int):
+    try:
+        return ctx.mentions[index]
+    except IndexError:
+        raise IndexError("No such mention") from None
+
+
+def _fail(error: Exception):
+    # Arguments are checked when compiling, but the error is raised when rendering (after {onfail})
+    def fail(_):
+        raise error
+
+    return fail
+
+
+def _compile_group(group: str):
+    """
+    Compiles the inside of a {group} into an op, None if it's not a known group (kept as text)
+    """
+    name, *tokens = group.split("|")
+    first = tokens[0] if tokens else None
+    rest = tokens[1:]
+
+    if name == "author":
+        value = _user_value(first)
+        return _VALUE, lambda ctx: value(ctx.author)
+
+    elif name == "mentions":
+        value = _user_value(rest[0] if rest else None)
+
+        try:
+            index = int(first) if first else 0
+        except ValueError as e:
+            return _VALUE, _fail(e)
+
+        return _VALUE, lambda ctx: value(_get_mention(ctx, index))
+
+    elif name == "rnd":
+        try:
+            if rest and rest[0]:
+                low, high = int(first or 1), int(rest[0])
+            else:
+                low, high = 0, int(first or 1)
+        except ValueError as e:
+            return _VALUE, _fail(e)
+
+        return _VALUE, lambda _: randint(low, high)
+
+    elif name == "time":
+        first = first or "format"
+
+        if first == "now":
+            return _VALUE, lambda _: datetime.now().strftime("%H:%M %d. of %B, %Y")
+        elif first == "format":
+            if not rest:
+                return _VALUE, _fail(IndexError("No time format"))
+
+            time_format = rest[0]
+            return _VALUE, lambda _: datetime.now().strftime(time_format)
+        else:
+            # raw (and anything else) is epoch time
+            return _VALUE, lambda _: time.time()
+
+    elif name == "choose":
+        if first is None:
+            return None
+
+        items = (first, *rest)
+        return _VALUE, lambda _: choice(items)
+
+    elif name == "onfail":
+        # onfail|<message> - returns your custom text
+        # onfail|raw - returns the raw exception
+        return _ONFAIL, _RAW_ERROR if first == "raw" else first
+
+    return None
+
+
+_COLON_VALUES = {
+    ":user": lambda ctx: ctx.author.mention,
+    ":username": lambda ctx: filter_text(ctx.author.display_name, user_mention=False),
+    ":server": lambda ctx: filter_text(ctx.guild.name, user_mention=False),
+}
+
+
+class Template:
+    """
+    A compiled template: a list of (kind, value) ops, text is only rendered from it (never parsed again)
+    """
+    __slots__ = ("ops", "static", "values")
+
+    def __init__(self, ops: list):
+        self.ops = ops
+        # Groups evaluated on every render (see RENDER_MAX_OPS)
+        self.values = sum(1 for kind, _ in ops if kind == _VALUE)
+        # Templates without any groups are just text
+        if not ops:
+            self.static = ""
+        elif len(ops) == 1 and ops[0][0] == _TEXT:
+            self.static = ops[0][1]
+        else:
+            self.static = None
+
+    @classmethod
+    def compile(cls, text: str, syntax: int):
+        ops = []
+        position = 0
+
+        for match in _PATTERNS[syntax].finditer(text):
+            token = match.group()
+
+            if token[0] == "{":
+                op = _compile_group(token[1:-1])
+            else:
+                op = _VALUE, _COLON_VALUES[token]
+
+            # Unknown groups stay as they are (part of the next text op)
+            if op is None:
+                continue
+
+            if match.start() > position:
+                ops.append((_TEXT, text[position:match.start()]))
+            ops.append(op)
+            position = match.end()
+
+        if position < len(text):
+            ops.append((_TEXT, text[position:]))
+
+        return cls(ops)
+
+    def render(self, ctx: TemplateContext, max_ops: int = RENDER_MAX_OPS,
+               max_length: int = RENDER_MAX_LENGTH) -> str:
+        if self.static is not None:
+            if len(self.static) > max_length:
+                raise RenderError("template is longer than {} characters".format(max_length))
+            return self.static
+
+        if self.values > max_ops:
+            raise RenderError("template has more than {} groups".format(max_ops))
+
+        parts = []
+        length = 0
+        on_fail = None
+
+        for kind, value in self.ops:
+            if kind == _TEXT:
+                part = value
+            elif kind == _ONFAIL:
+                on_fail = value
+                continue
+            else:
+                try:
+                    part = str(value(ctx))
+                except Exception as e:
+                    if on_fail is None:
+                        raise RenderError(str(e)) from e
+
+                    return "Error: {}".format(e) if on_fail is _RAW_ERROR else on_fail
+
+            length += len(part)
+            if length > max_length:
+                raise RenderError("render is longer than {} characters".format(max_length))
+
+            parts.append(part)
+
+        return "".join(parts)
+
+
+class TemplateEngine:
+    """
+    Compiles templates once and keeps them in an LRU cache keyed by their text
+    """
+    __slots__ = ("syntax", "_templates", "max_size", "hits", "misses")
+
+    def __init__(self, syntax: int = BRACES, max_size: int = TEMPLATE_CACHE_SIZE):
+        self.syntax = syntax
+
+        # text -> Template
+        self._templates = OrderedDict()
+        self.max_size = max_size
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, text: str) -> Template:
+        template = self._templates.get(text)
+
+        if template is None:
+            self.misses += 1
+
+            template = Template.compile(text, self.syntax)
+            self._templates[text] = template
+
+            if len(self._templates) > self.max_size:
+                self._templates.popitem(last=False)
+        else:
+            self.hits += 1
+            self._templates.move_to_end(text)
+
+        return template
+
+    def render(self, text: str, ctx: TemplateContext, **budgets) -> str:
+        """
+        Renders text, raises RenderError if it fails (and has no {onfail}) or goes over a budget
+        """
+        return self.get(text).render(ctx, **budgets)
+
+    def get_stats(self) -> dict:
+        return {
+            "templates": len(self._templates),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
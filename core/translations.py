@@ -1,9 +1,16 @@
 # coding=utf-8
+import hashlib
 import logging
+import marshal
+import os
+import sys
+from string import Formatter
 from typing import Union
 from json import loads
 from xml.etree import ElementTree
 
+from .confparser import CACHE_DIR, get_settings_parser
+
 log = logging.getLogger(__name__)
 
 
@@ -19,6 +26,13 @@ class Singleton(type):
 
 DEFAULT_LANGUAGE = "en"
 
+TRANSLATIONS_DIR = "translations"
+
+# Compiled languages (marshal), one file per language: cache/translations/<lang>.bin
+SNAPSHOT_DIR = os.path.join(CACHE_DIR, "translations")
+# Bump when the snapshot layout changes (marshal's format depends on the Python version as well)
+SNAPSHOT_VERSION = "1:{}.{}".format(*sys.version_info[:2])
+
 # Handle some string in a different way
 
 strings_to_list = [
@@ -58,8 +72,73 @@ def split_into_tuple(something: str) -> tuple:
     return tuple(a.strip(" ") for a in something.split("|"))
 
 
+_formatter = Formatter()
+
+
+def get_placeholders(template: str) -> tuple:
+    """
+    Returns (amount of automatic {} fields, set of named/numbered fields) of a str.format template
+    :raises ValueError: if the template is malformed
+    """
+    auto = 0
+    names = set()
+
+    for _, field, _, _ in _formatter.parse(template):
+        if field is None:
+            continue
+
+        if field == "":
+            auto += 1
+        else:
+            names.add(field.split(".")[0].split("[")[0])
+
+    return auto, frozenset(names)
+
+
+def missing_translation(name: str) -> str:
+    return "Please notify the dev, something went wrong (translation missing): {}".format(name)
+
+
+class BoundTranslator:
+    """
+    Strings of a single language (see TranslationManager.for_lang): its overlay, then English.
+    Both tables are shared with the TranslationManager, nothing is copied.
+    Keys are upper case, as they are written in the code: trans["MSG_HELP"]
+    """
+    __slots__ = ("lang", "strings", "base", "_formatters")
+
+    def __init__(self, lang: str, strings: dict, base: dict = None):
+        self.lang = lang
+        self.strings = strings
+        self.base = base if base is not None else {}
+
+        # name -> bound str.format of the template
+        self._formatters = {}
+
+    def get(self, name: str) -> str:
+        value = self.strings.get(name) or self.base.get(name)
+        if value:
+            return value
+
+        # Not pre-normalized
+        name = name.upper()
+        return self.strings.get(name) or self.base.get(name) or missing_translation(name.lower())
+
+    __getitem__ = get
+
+    def format(self, name: str, *args, **kwargs) -> str:
+        """
+        Same as get(name).format(...), but the template's format method is looked up only once
+        """
+        formatter = self._formatters.get(name)
+        if formatter is None:
+            formatter = self._formatters[name] = self.get(name).format
+
+        return formatter(*args, **kwargs)
+
+
 def get_meta() -> dict:
-    with open("translations/meta.json") as meta:
+    with open(os.path.join(TRANSLATIONS_DIR, "meta.json")) as meta:
         d = meta.read()
         if not d:
             raise RuntimeError("meta.json is empty")
@@ -68,58 +147,194 @@ def get_meta() -> dict:
 
 
 class TranslationManager(metaclass=Singleton):
+    """
+    English is kept whole, every other language only stores the strings that differ from it (an overlay).
+    Languages that are not preloaded (see [Translations] preload) are loaded the first time they are used.
+    """
     __slots__ = (
-        "meta", "translations", "default_lang"
+        "meta", "translations", "default_lang", "use_snapshots", "preload", "_bound", "problems"
     )
 
-    def __init__(self):
+    def __init__(self, use_snapshots=True, preload=None):
         self.meta = {}
+        # lang -> strings (overlay over English for every other language)
         self.translations = {}
 
         self.default_lang = DEFAULT_LANGUAGE
+        self.use_snapshots = use_snapshots
+
+        if preload is None:
+            preload = get_settings_parser().get("Translations", "preload", fallback=DEFAULT_LANGUAGE)
+            preload = [a.strip(" ") for a in preload.split(",") if a.strip(" ")]
+
+        self.preload = preload
+
+        # lang -> BoundTranslator
+        self._bound = {}
+        # lang -> {"missing": [...], "placeholders": [...], "malformed": [...]}
+        self.problems = {}
 
         self.reload_translations()
 
     def load_languages(self):
-        for lang in self.meta.keys():
-            log.info("Loading {}.xml".format(lang))
-            etree = ElementTree.parse("translations/{}.xml".format(lang))
+        """
+        (Re)loads English, the preloaded languages and the ones that were already in use
+        """
+        if "*" in self.preload:
+            languages = list(self.meta.keys())
+        else:
+            languages = [a for a in self.meta.keys() if a in self.preload or a in self.translations]
+
+        # English first, it's the base of every overlay
+        if DEFAULT_LANGUAGE in languages:
+            languages.remove(DEFAULT_LANGUAGE)
+        languages.insert(0, DEFAULT_LANGUAGE)
 
-            xml_dict = self.parse_xml_to_dict(etree)
+        self.translations = {}
+        self.problems = {}
 
-            if type(xml_dict) is not dict:
-                raise TypeError("expected dict, got {}".format(type(xml_dict)))
+        parsed = [lang for lang in languages if self._add_language(lang)]
 
-            self.translations[lang] = xml_dict
+        log.info("Loaded {} of {} languages: {} (parsed: {})".format(
+            len(languages), len(self.meta.keys()), ",".join(languages), ",".join(parsed) or "none"))
 
-        log.info("Parsed {} languages: {}".format(len(self.meta.keys()), ",".join(self.meta.keys())))
-        self.parse_special_strings()
+    def _add_language(self, lang: str) -> bool:
+        """
+        Loads a language into self.translations
+        :return: whether the XML file had to be parsed
+        """
+        strings, was_parsed = self._load_language(lang)
 
-    def parse_special_strings(self):
-        if not self.translations:
-            raise RuntimeError("Translations are not yet loaded!")
+        if type(strings) is not dict:
+            raise TypeError("expected dict, got {}".format(type(strings)))
 
-        c = 0
+        # Keys are upper case (as in the code) and shared between all languages
+        strings = {sys.intern(name.upper()): value for name, value in strings.items()}
+
+        if lang == DEFAULT_LANGUAGE:
+            self.check_language(lang, strings)
+            self.translations[lang] = strings
+            return was_parsed
 
-        for lang, words in self.translations.items():
-            specials = {}
+        self.check_language(lang, strings)
 
-            for name, string in words.items():
+        # Only keep what English doesn't already have
+        base = self.translations[DEFAULT_LANGUAGE]
+        self.translations[lang] = {name: value for name, value in strings.items()
+                                   if value and value != base.get(name)}
 
-                if name in strings_to_list:
-                    # Parse: split the string into a list
-                    specials[name] = split_into_list(string)
-                    c += 1
-                elif name in strings_to_tuple:
-                    # Parse: split the string into a tuple
-                    specials[name] = split_into_tuple(string)
-                    c += 1
+        return was_parsed
 
-            # Overwrite existing dictionary with parsed strings
-            if specials:
-                self.translations[lang].update(specials)
+    def _load_lazy(self, lang: str) -> bool:
+        """
+        Loads a language on first use
+        :return: whether the language is available now
+        """
+        if lang in self.translations:
+            return True
 
-        log.info("Parsed {} special strings".format(c))
+        if lang not in self.meta:
+            return False
+
+        self._add_language(lang)
+        log.info("Loaded {} on first use".format(lang))
+        return True
+
+    @staticmethod
+    def _snapshot_path(lang: str) -> str:
+        return os.path.join(SNAPSHOT_DIR, "{}.bin".format(lang))
+
+    def _read_snapshot(self, lang: str) -> Union[dict, None]:
+        try:
+            with open(self._snapshot_path(lang), "rb") as file:
+                snapshot = marshal.loads(file.read())
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+
+        if type(snapshot) is not dict or snapshot.get("version") != SNAPSHOT_VERSION:
+            return None
+
+        return snapshot
+
+    def _write_snapshot(self, lang: str, stat, digest: str, strings: dict):
+        if not os.path.isdir(SNAPSHOT_DIR):
+            os.makedirs(SNAPSHOT_DIR)
+
+        snapshot = {
+            "version": SNAPSHOT_VERSION,
+            "mtime": stat.st_mtime,
+            "size": stat.st_size,
+            "sha1": digest,
+            "strings": strings,
+        }
+
+        # Write to a temporary file first so a crash can't leave a broken snapshot behind
+        path = self._snapshot_path(lang)
+        with open(path + ".tmp", "wb") as file:
+            marshal.dump(snapshot, file)
+
+        os.replace(path + ".tmp", path)
+
+    def _load_language(self, lang: str) -> tuple:
+        """
+        Loads a language from its snapshot, the XML file is parsed only if it changed
+        :return: tuple(strings, was_parsed)
+        """
+        path = os.path.join(TRANSLATIONS_DIR, "{}.xml".format(lang))
+        stat = os.stat(path)
+
+        snapshot = self._read_snapshot(lang) if self.use_snapshots else None
+        if snapshot and snapshot["mtime"] == stat.st_mtime and snapshot["size"] == stat.st_size:
+            return snapshot["strings"], False
+
+        with open(path, "rb") as file:
+            data = file.read()
+
+        digest = hashlib.sha1(data).hexdigest()
+
+        # Touched, but not changed
+        if snapshot and snapshot["sha1"] == digest:
+            strings = snapshot["strings"]
+            was_parsed = False
+        else:
+            log.info("Parsing {}.xml".format(lang))
+
+            strings = self.parse_xml_to_dict(ElementTree.ElementTree(ElementTree.fromstring(data)))
+            self.parse_special_strings(strings)
+            was_parsed = True
+
+        if self.use_snapshots:
+            try:
+                self._write_snapshot(lang, stat, digest, strings)
+            except OSError as e:
+                log.warning("Could not save the {} snapshot: {}".format(lang, e))
+
+        return strings, was_parsed
+
+    @staticmethod
+    def parse_special_strings(words: dict) -> int:
+        """
+        Splits special strings (see strings_to_list and strings_to_tuple) in place
+        """
+        c = 0
+        specials = {}
+
+        for name, string in words.items():
+
+            if name in strings_to_list:
+                # Parse: split the string into a list
+                specials[name] = split_into_list(string)
+                c += 1
+            elif name in strings_to_tuple:
+                # Parse: split the string into a tuple
+                specials[name] = split_into_tuple(string)
+                c += 1
+
+        # Overwrite existing dictionary with parsed strings
+        if specials:
+            words.update(specials)
+
+        return c
 
     @staticmethod
     def parse_xml_to_dict(tree: ElementTree) -> dict:
@@ -144,26 +359,88 @@ class TranslationManager(metaclass=Singleton):
 
         return buffer
 
+    def for_lang(self, lang: str) -> BoundTranslator:
+        """
+        Returns a translator bound to a language, unknown languages get English
+        """
+        try:
+            return self._bound[lang]
+        except KeyError:
+            pass
+
+        if not self._load_lazy(lang):
+            return self.for_lang(DEFAULT_LANGUAGE) if lang != DEFAULT_LANGUAGE else BoundTranslator(lang, {})
+
+        if lang == DEFAULT_LANGUAGE:
+            bound = BoundTranslator(lang, self.translations[lang])
+        else:
+            bound = BoundTranslator(lang, self.translations[lang], self.translations[DEFAULT_LANGUAGE])
+
+        self._bound[lang] = bound
+        return bound
+
+    def check_language(self, lang: str, strings: dict):
+        """
+        Finds strings that are missing or whose placeholders don't match the English ones
+        """
+        base = self.translations.get(DEFAULT_LANGUAGE, strings)
+
+        malformed = []
+        mismatched = []
+        missing = [name for name in base if not strings.get(name)]
+
+        for name, value in strings.items():
+            # Special strings are not templates
+            if type(value) is not str:
+                continue
+
+            try:
+                fields = get_placeholders(value)
+            except ValueError:
+                malformed.append(name)
+                continue
+
+            english = base.get(name)
+            if lang != DEFAULT_LANGUAGE and type(english) is str and value != english:
+                try:
+                    if fields != get_placeholders(english):
+                        mismatched.append(name)
+                except ValueError:
+                    pass
+
+        self.problems[lang] = {"missing": missing, "placeholders": mismatched, "malformed": malformed}
+
+        if mismatched or malformed:
+            log.warning("{}: placeholders don't match English: {}, malformed: {}".format(
+                lang, ", ".join(mismatched) or "none", ", ".join(malformed) or "none"))
+
+        if missing:
+            log.info("{}: {} strings missing, English is used instead".format(lang, len(missing)))
+
     def get(self, name: str, lang=DEFAULT_LANGUAGE, fallback=True) -> str:
         if not lang:
             lang = DEFAULT_LANGUAGE
 
-        name = name.lower()
-        item = self.translations.get(lang)
+        if fallback:
+            return self.for_lang(lang).get(name)
+
+        name = name.upper()
+        base = self.translations[DEFAULT_LANGUAGE]
+
+        # Unknown languages get English
+        if lang == DEFAULT_LANGUAGE or not self._load_lazy(lang):
+            return base.get(name)
 
-        # Fall back to english
-        if not item:
-            item = self.translations.get("en")
+        value = self.translations[lang].get(name)
+        if value:
+            return value
 
-        trans = item.get(name)
-        if not trans and fallback:
-            # Fall back to english, again
-            trans = self.translations.get("en").get(name)
-            # Emergency
-            if not trans:
-                return "Please notify the dev, something went wrong (translation missing): {}".format(name)
+        # Not translated at all: None, like before overlays (see get_ux_disables)
+        if name in self.problems[lang]["missing"]:
+            return None
 
-        return trans
+        # Strings that are the same as in English are not kept in the overlay
+        return base.get(name)
 
     def is_language_code(self, language_code) -> bool:
         return language_code in self.meta.keys()
@@ -177,4 +454,5 @@ class TranslationManager(metaclass=Singleton):
 
     def reload_translations(self):
         self.meta = get_meta()
+        self._bound = {}
         self.load_languages()
@@ -23,20 +23,9 @@ class SecurityError(Exception):
     pass
 
 
-class CmdResponseTypes:
-    REGISTER_ON_FAIL = "reg_on_fail"
-
-
-class DynamicResponse:
-    __slots__ = ("intention", "data")
-
-    def __init__(self, intention, data):
-        self.intention = intention
-        self.data = data
-
-    @classmethod
-    def register_failure_response(cls, text):
-        return cls(CmdResponseTypes.REGISTER_ON_FAIL, text)
+# NanoPlugin.events priority for handlers that don't depend on other plugins (and don't stop the event),
+# they run concurrently after all ordered handlers
+INDEPENDENT = "independent"
 
 
 # Singleton
@@ -271,16 +260,6 @@ def matches_iterable(content: str, lst: Iterable = words) -> bool:
     return content.lower() in lst
 
 
-def is_valid_command(msg: str, commands: Iterable, prefix: str):
-    for cmd in commands:
-        cmd = cmd.replace("_", prefix)
-
-        if msg.startswith(cmd):
-            return True
-
-    return False
-
-
 BUG_FILE = os.path.join(DATA_DIR, "bugs.txt")
 LOG_FILE = os.path.join(DATA_DIR, "log.txt")
 
@@ -323,18 +302,28 @@ none_ux = [
 
 ux_disables = {}
 
-# Adds representations of None from other languages at import
-for lng in tr.translations.keys():
-    if lng not in ux_disables.keys():
-        ux_disables[lng] = list(none_ux)
 
-    th1 = tr.get("INFO_DISABLED", lng, fallback=False)
-    th2 = tr.get("INFO_DISABLED_A", lng, fallback=False)
+def get_ux_disables(lang: str) -> list:
+    """
+    Representations of None in a language, built when the language is first used (languages are loaded lazily)
+    """
+    try:
+        return ux_disables[lang]
+    except KeyError:
+        pass
+
+    disables = list(none_ux)
+
+    th1 = tr.get("INFO_DISABLED", lang, fallback=False)
+    th2 = tr.get("INFO_DISABLED_A", lang, fallback=False)
 
     if th1:
-        ux_disables[lng].append(th1)
+        disables.append(th1)
     if th2:
-        ux_disables[lng].append(th2)
+        disables.append(th2)
+
+    ux_disables[lang] = disables
+    return disables
 
 
 # Returns a bool indicating if 'ct' represents a disabling action
@@ -345,7 +334,7 @@ def is_disabled(ct, lang=DEFAULT_LANGUAGE):
     ct = str(ct).lower()
 
     # Language-sensitive disabling
-    for a in ux_disables[lang]:
+    for a in get_ux_disables(lang):
         if ct.startswith(a):
             return True
 
@@ -516,13 +505,6 @@ def apply_string_padding(strings: tuple, amount: int = 1):
     return temp
 
 
-def get_valid_commands(plugin):
-    try:
-        return list(plugin.commands.keys())
-    except AttributeError:
-        return None
-
-
 USER_MENTION_REGEX = re.compile(r"<@[0-9]{18}>", re.MULTILINE)
 
 
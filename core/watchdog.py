@@ -0,0 +1,160 @@
+# coding=utf-8
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+from .confparser import PLUGINS_DIR
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+# How many stalls to keep for nano.dev.stalls
+MAX_STALL_HISTORY = 20
+# Frames to keep from each captured stack
+MAX_STACK_DEPTH = 25
+
+UNKNOWN_PLUGIN = "(unknown)"
+
+
+class Stall:
+    __slots__ = ("started", "lag", "plugin", "event", "stack")
+
+    def __init__(self, started: float, lag: float, plugin: str, event: str, stack: list):
+        self.started = started
+        self.lag = lag
+        self.plugin = plugin
+        self.event = event
+        self.stack = stack
+
+
+class LoopWatchdog(threading.Thread):
+    """
+    Measures event loop lag from a separate thread
+
+    The loop schedules a heartbeat every `interval` seconds. When the heartbeat is late by more than `threshold`,
+    the loop is blocked: the stack of the loop's thread is captured and attributed to the plugin that owns
+    the innermost frame in plugins/, falling back to the callback that Nano.dispatch_event is currently running.
+    """
+
+    def __init__(self, loop, nano=None, threshold: float = 0.25, interval: float = 0.1):
+        super().__init__(name="LoopWatchdog", daemon=True)
+
+        self.loop = loop
+        self.nano = nano
+
+        self.threshold = threshold
+        self.interval = interval
+
+        self.running = False
+        self.last_beat = time.monotonic()
+        self.loop_thread_id = None
+
+        # Lag statistics
+        self.max_lag = 0
+        self.current_lag = 0
+
+        # plugin name -> amount of stalls
+        self.stall_counts = {}
+        self.stalls = deque(maxlen=MAX_STALL_HISTORY)
+        self._current_stall = None
+
+        self._plugins_dir = os.path.abspath(PLUGINS_DIR)
+
+    def _heartbeat(self):
+        if self.loop_thread_id is None:
+            self.loop_thread_id = threading.get_ident()
+
+        self.last_beat = time.monotonic()
+
+        if self.running:
+            self.loop.call_later(self.interval, self._heartbeat)
+
+    def start(self):
+        self.running = True
+        self.last_beat = time.monotonic()
+        self.loop.call_soon_threadsafe(self._heartbeat)
+
+        super().start()
+        log.info("Watchdog enabled (threshold: {}s)".format(self.threshold))
+
+    def stop(self):
+        self.running = False
+
+    def _attribute(self, frame) -> str:
+        """
+        Finds the innermost frame that belongs to a plugin
+        """
+        while frame is not None:
+            filename = os.path.abspath(frame.f_code.co_filename)
+
+            if filename.startswith(self._plugins_dir):
+                return os.path.splitext(os.path.basename(filename))[0]
+
+            frame = frame.f_back
+
+        return None
+
+    def _capture(self, lag: float) -> Stall:
+        frame = sys._current_frames().get(self.loop_thread_id)
+
+        plugin = self._attribute(frame) if frame else None
+        active = self.nano.get_active_callback() if self.nano else (None, None)
+
+        if plugin is None:
+            plugin = active[0] or UNKNOWN_PLUGIN
+
+        stack = traceback.format_stack(frame, limit=MAX_STACK_DEPTH) if frame else []
+
+        return Stall(time.time(), lag, plugin, active[1], stack)
+
+    def run(self):
+        while self.running:
+            time.sleep(self.interval)
+
+            if self.loop_thread_id is None:
+                continue
+
+            # The heartbeat is rescheduled every interval, anything more is lag
+            lag = max(time.monotonic() - self.last_beat - self.interval, 0)
+            self.current_lag = lag
+
+            if lag > self.max_lag:
+                self.max_lag = lag
+
+            if lag < self.threshold:
+                # Loop has recovered, report the finished stall
+                if self._current_stall is not None:
+                    stall = self._current_stall
+                    self._current_stall = None
+
+                    log.warning("Event loop was blocked for {}s in {} ({})\n{}".format(
+                        round(stall.lag, 3), stall.plugin, stall.event, "".join(stall.stack)))
+
+                continue
+
+            # Capture only the first stack of a stall, but keep track of its length
+            if self._current_stall is None:
+                stall = self._capture(lag)
+
+                self._current_stall = stall
+                self.stalls.append(stall)
+                self.stall_counts[stall.plugin] = self.stall_counts.get(stall.plugin, 0) + 1
+            else:
+                self._current_stall.lag = lag
+
+    def get_stats(self) -> dict:
+        return {
+            "current_lag": self.current_lag,
+            "max_lag": self.max_lag,
+            "stalls": sum(self.stall_counts.values()),
+            "per_plugin": dict(self.stall_counts),
+        }
+
+    def reset(self):
+        self.max_lag = 0
+        self.stall_counts = {}
+        self.stalls.clear()
@@ -6,12 +6,19 @@ import os
 import sys
 import time
 import discord
+import psutil
 import traceback
 
 from core.serverhandler import ServerHandler
+from core.router import CommandRouter
+from core.cluster import ClusterConfig, ClusterNode
+from core.manifest import PluginManifest
+from core.profiler import EventProfiler
+from core.recorder import EventRecorder
+from core.watchdog import LoopWatchdog
 from core.stats import NanoStats
 from core.translations import TranslationManager
-from core.utils import log_to_file
+from core.utils import log_to_file, INDEPENDENT
 from core.confparser import get_settings_parser, PLUGINS_DIR
 
 __title__ = "Nano"
@@ -59,6 +66,9 @@ assert len(set(EVENTS)) == len(EVENTS)
 
 IS_RESUME = False
 
+# Package plugins are imported from
+PLUGINS_NAMESPACE = PLUGINS_DIR.replace("/", "").replace("\\", "")
+
 # LOGGING
 
 logging.basicConfig(level=logging.INFO)
@@ -83,21 +93,43 @@ loop = asyncio.get_event_loop()
 custom_intents = discord.Intents.default()
 custom_intents.members = True
 
+# In cluster mode (see core/cluster.py) this process only runs some of the shards
+cluster_config = ClusterConfig.from_settings(parser)
+shard_options = {}
+if cluster_config.enabled:
+    shard_options = dict(shard_count=cluster_config.shard_count, shard_ids=cluster_config.shard_ids)
+    log.info("Cluster worker {} (shards {} of {})".format(
+        cluster_config.worker_id, cluster_config.shard_ids, cluster_config.shard_count))
+
 client = discord.AutoShardedClient(
     loop=loop,
     intents=custom_intents,
     chunk_guilds_at_startup=True,
     guild_ready_timeout=2,
-    guild_subscriptions=True
+    guild_subscriptions=True,
+    **shard_options
 )
 
 log.info("Initializing ServerHandler and NanoStats...")
 
 # Setup the server data and stats
 handler = ServerHandler.get_handler(loop)
-stats = NanoStats(loop, *ServerHandler.get_redis_credentials())
+stats = NanoStats(loop, *ServerHandler.get_redis_credentials(),
+                  flush_interval=parser.getint("Stats", "flush_interval", fallback=30),
+                  flush_threshold=parser.getint("Stats", "flush_threshold", fallback=100))
 trans = TranslationManager()
 
+# Event latency profiling, see nano.dev.perf
+profiler = EventProfiler(enabled=parser.getboolean("Profiler", "enabled", fallback=True),
+                         sample_rate=parser.getint("Profiler", "sample_rate", fallback=10),
+                         window=parser.getint("Profiler", "window", fallback=300))
+
+# Records guild events for bench/replay.py
+recorder = None
+if parser.get("Bench", "record_events", fallback=None):
+    recorder = EventRecorder(parser.get("Bench", "record_events"))
+    log.warning("Recording events to {}".format(parser.get("Bench", "record_events")))
+
 
 class PluginObject:
     def __init__(self, lib, instance):
@@ -127,81 +159,127 @@ class Nano(metaclass=Singleton):
         self.owner_id = parser.getint("Settings", "ownerid")
         self.dev_server = parser.getint("Dev", "server")
 
+        self.cluster = ClusterNode(cluster_config, handler.aio.redis, loop)
+        # Exit code used after ON_SHUTDOWN (the cluster supervisor restarts workers depending on it)
+        self.exit_code = 0
+
+        self.profiler = profiler
+        # task -> (plugin, event) that dispatch_event is running in it, used by the watchdog
+        self.active_callbacks = {}
+        self.watchdog = LoopWatchdog(loop, self,
+                                     threshold=parser.getfloat("Watchdog", "threshold", fallback=0.25))
+
         # Plugin-related
         self.plugin_names = []
         self.plugins = {}
+        # Plugins that are imported on their first command: name -> manifest entry
+        self.lazy_plugins = {}
+        # name -> task importing it in the background (see load_lazy)
+        self._lazy_loading = {}
+        self.manifest = PluginManifest(PLUGINS_DIR)
         self.plugin_events = {a: [] for a in EVENTS}
+        # Handlers registered with INDEPENDENT priority, run concurrently after the ordered ones
+        self.independent_events = {a: [] for a in EVENTS}
         self.event_types = set(self.plugin_events.keys())
 
+        # Command routing
+        self.router = CommandRouter()
+        # Plugins whose on_message only handles their own commands (NanoPlugin.commands_only)
+        self.command_plugins = set()
+
         # Updates the plugin list
         self.update_plugins()
 
+    @staticmethod
+    def _get_rss() -> float:
+        return round(psutil.Process(os.getpid()).memory_info().rss / 2 ** 20, 1)
+
     def update_plugins(self):
         started = time.monotonic()
+        rss_before = self._get_rss()
+
         plugin_names = [pl[:-3] for pl in os.listdir(PLUGINS_DIR)
                         if os.path.isfile(os.path.join(PLUGINS_DIR, pl))
                         and pl.endswith(".py")]
 
+        self.manifest.load(plugin_names)
+
+        if parser.getboolean("Plugins", "lazy_load", fallback=False):
+            self.lazy_plugins = {name: self.manifest.get(name) for name in plugin_names if self.manifest.is_lazy(name)}
+            plugin_names = [name for name in plugin_names if name not in self.lazy_plugins]
+
         self._update_plugins(plugin_names)
 
-        log.info("Plugins loaded in {}s".format(round(time.monotonic() - started, 3)))
+        rss_after = self._get_rss()
+        log.info("Plugins loaded in {}s, RSS: {} MB (+{} MB), {} deferred until first use".format(
+            round(time.monotonic() - started, 3), rss_after, round(rss_after - rss_before, 1), len(self.lazy_plugins)))
 
-    def _update_plugins(self, names: list):
-        log.info("Loading plugins...")
+    def _load_plugin(self, plug_name: str) -> "PluginObject":
+        """
+        Imports and instantiates a plugin
+        :raises ImportError: the plugin is invalid or failed to load
+        :raises RuntimeError: the plugin doesn't want to be loaded
+        """
+        # Import the plugin
+        try:
+            plugin = importlib.import_module("{}.{}".format(PLUGINS_NAMESPACE, plug_name))
+        except ImportError:
+            log.warning("Couldn't import {}".format(plug_name))
+            log.critical(traceback.format_exc())
 
-        loaded = []
-        failed = []
-        disabled = []
+            raise
 
-        PLUGINS_NAMESPACE = PLUGINS_DIR.replace("/", "").replace("\\", "")
+        # Plugin loaded, check validity
+        # Plugin must have a class NanoPlugin, see examples in plugins/
+        if not hasattr(plugin, "NanoPlugin"):
+            log.warning("Plugin {} does not have the required NanoPlugin class".format(plug_name))
 
-        for plug_name in list(names):
-            # Import the plugin
-            try:
-                plugin = importlib.import_module("{}.{}".format(PLUGINS_NAMESPACE, plug_name))
-            except ImportError:
-                log.warning("Couldn't import {}".format(plug_name))
-                log.critical(traceback.format_exc())
-                failed.append(plug_name)
+            del plugin
+            raise ImportError
 
-                continue
+        info = getattr(plugin, "NanoPlugin")
 
-            # Plugin loaded, check validity
-            # Plugin must have a class NanoPlugin, see examples in plugins/
-            if not hasattr(plugin, "NanoPlugin"):
-                log.warning("Plugin {} does not have the required NanoPlugin class".format(plug_name))
-                failed.append(plug_name)
+        handler_cls = info.handler
 
-                del plugin
-                continue
+        # Make an instance
+        try:
+            inst = handler_cls(client=client,
+                               loop=loop,
+                               handler=handler,
+                               nano=self,
+                               stats=stats,
+                               trans=trans)
+        # A plugin can raise RuntimeError to indicate it doesn't want to be loaded
+        except RuntimeError:
+            del plugin
+            raise
+        # Other exceptions make it fail
+        except Exception:
+            log.warning("Failed to instantiate {}".format(plug_name))
+            log.critical(traceback.format_exc())
 
-            info = getattr(plugin, "NanoPlugin")
+            del plugin
+            raise ImportError
 
-            handler_cls = info.handler
+        return PluginObject(plugin, inst)
 
-            # Make an instance
+    def _update_plugins(self, names: list):
+        log.info("Loading plugins...")
+
+        loaded = []
+        failed = []
+        disabled = []
+
+        for plug_name in list(names):
             try:
-                inst = handler_cls(client=client,
-                                   loop=loop,
-                                   handler=handler,
-                                   nano=self,
-                                   stats=stats,
-                                   trans=trans)
-            # A plugin can raise RuntimeError to indicate it doesn't want to be loaded
+                self.plugins[plug_name] = self._load_plugin(plug_name)
             except RuntimeError:
                 disabled.append(plug_name)
-
-                del plugin
                 continue
-            # Other exceptions make it fail
-            except Exception:
-                log.warning("Failed to instantiate {}".format(plug_name))
-                log.critical(traceback.format_exc())
-
-                del plugin
+            except ImportError:
+                failed.append(plug_name)
                 continue
 
-            self.plugins[plug_name] = PluginObject(plugin, inst)
             loaded.append(plug_name)
 
         self.plugin_names = loaded
@@ -216,15 +294,83 @@ class Nano(metaclass=Singleton):
             log.warning("Failed plugins: {}".format(", ".join(failed)))
 
         self._parse_priorities()
+        self._build_router()
 
         asyncio.ensure_future(self.dispatch_event(ON_PLUGINS_LOADED))
 
+    def _load_lazy(self, name: str) -> bool:
+        """
+        Imports a deferred plugin (they only have on_message, so ON_PLUGINS_LOADED isn't needed)
+        Blocks the loop while importing, use load_lazy where possible
+        """
+        started = time.monotonic()
+        del self.lazy_plugins[name]
+
+        try:
+            self.plugins[name] = self._load_plugin(name)
+        except (RuntimeError, ImportError):
+            log.warning("Deferred plugin {} could not be loaded".format(name))
+
+            # Stop routing its commands
+            self._build_router()
+            return False
+
+        self.plugin_names.append(name)
+        self._parse_priorities()
+
+        log.info("Loaded deferred plugin {} in {}s".format(name, round(time.monotonic() - started, 3)))
+        return True
+
+    async def load_lazy(self, name: str) -> bool:
+        """
+        Imports a deferred plugin's module in an executor and registers the plugin on the loop when it's done
+        Concurrent calls for the same plugin wait for the same import.
+        """
+        task = self._lazy_loading.get(name)
+        if task is None:
+            task = self._lazy_loading[name] = loop.create_task(self._import_lazy(name))
+
+        return await asyncio.shield(task)
+
+    async def _import_lazy(self, name: str) -> bool:
+        try:
+            await loop.run_in_executor(None, importlib.import_module, "{}.{}".format(PLUGINS_NAMESPACE, name))
+        except Exception:
+            # _load_plugin imports it again and logs why it failed
+            pass
+        finally:
+            del self._lazy_loading[name]
+
+        # Could have been loaded synchronously (get_plugin) in the meantime
+        if name not in self.lazy_plugins:
+            return name in self.plugins
+
+        # The module is in sys.modules now, only the instance is created here
+        return self._load_lazy(name)
+
+    async def preload_lazy_plugins(self):
+        """
+        Loads every deferred plugin in the background (after ON_READY), so no message waits for an import
+        """
+        started = time.monotonic()
+        names = list(self.lazy_plugins.keys())
+
+        for name in names:
+            await self.load_lazy(name)
+
+        if names:
+            log.info("Preloaded {} deferred plugins in {}s".format(len(names), round(time.monotonic() - started, 3)))
+
     async def reload_plugin(self, name: str):
         log.info("Reloading plugin: {}".format(name))
 
         if name.endswith(".py"):
             name = name[:-3]
 
+        # Deferred plugins just need to be loaded
+        if name in self.lazy_plugins:
+            return await self.load_lazy(name)
+
         # Verify that the plugin is actually already loaded
         if name not in self.plugins.keys():
             raise NotImplementedError
@@ -279,6 +425,7 @@ class Nano(metaclass=Singleton):
         self.plugins[name] = PluginObject(plugin, inst)
 
         self._parse_priorities()
+        self._build_router()
 
         # Call ON_PLUGINS_LOADED if the plugin requires it
         if ON_PLUGINS_LOADED in events.keys():
@@ -291,96 +438,217 @@ class Nano(metaclass=Singleton):
         log.info("Parsing priorities...")
 
         temp = {}
+        independent = {a: [] for a in EVENTS}
 
-        for p in self.plugins.values():
+        for name, p in self.plugins.items():
             assert isinstance(p, PluginObject)
 
             for ev_name, priority in p.events.items():
+                if priority == INDEPENDENT:
+                    independent[ev_name].append((name, getattr(p.instance, ev_name)))
+                    continue
+
                 if not temp.get(ev_name):
                     temp[ev_name] = []
 
-                temp[ev_name].append({"callback": getattr(p.instance, ev_name), "importance": priority})
+                temp[ev_name].append({"name": name, "callback": getattr(p.instance, ev_name), "importance": priority})
 
         # Order callbacks
+        self.plugin_events = {a: [] for a in EVENTS}
         for event, unordered in temp.items():
             ordered = sorted(unordered, key=lambda a: a["importance"])
-            ordered = [i["callback"] for i in ordered]
+            ordered = [(i["name"], i["callback"]) for i in ordered]
 
             self.plugin_events[event] = ordered
 
+        self.independent_events = independent
+
+    def _build_router(self):
+        self.router.build(self.get_plugin_commands())
+
+        self.command_plugins = {name for name, p in self.plugins.items()
+                                if getattr(p.handler, "commands_only", False)}
+        # Deferred plugins are always commands_only
+        self.command_plugins.update(self.lazy_plugins.keys())
+
+    def get_plugin_commands(self) -> dict:
+        """
+        Returns plugin name -> commands dict of every plugin, including the ones that are not imported yet
+        """
+        commands = {name: getattr(p.plugin, "commands", None) for name, p in self.plugins.items()}
+        commands.update({name: entry["commands"] for name, entry in self.lazy_plugins.items()})
+
+        return commands
+
     def get_plugin(self, name: str) -> dict:
         if name.endswith(".py"):
             name = name[:-3]
 
+        if name in self.lazy_plugins:
+            self._load_lazy(name)
+
         return self.plugins[name]
 
+    def _is_skipped(self, name: str, args, kwargs) -> bool:
+        """
+        Only call command plugins when the message is one of their commands
+        ctx (and usually route) is added by the observer, before any command plugin runs
+        """
+        if name not in self.command_plugins or "ctx" not in kwargs:
+            return False
+
+        if "route" not in kwargs:
+            kwargs["route"] = self.router.resolve(args[0].content, kwargs["ctx"].prefix)
+
+        route = kwargs["route"]
+        return route is None or name not in route
+
+    def get_active_callback(self) -> tuple:
+        """
+        Returns (plugin, event) running in the loop's current task, (None, None) if none is
+        Safe to call from other threads (see LoopWatchdog)
+        """
+        return self.active_callbacks.get(asyncio.current_task(loop)) or (None, None)
+
+    async def _call(self, name: str, cb, event_type: str, profile: bool, args, kwargs):
+        # Independent handlers run in their own tasks (gather), nested events restore the outer callback
+        task = asyncio.current_task()
+        outer = self.active_callbacks.get(task)
+        self.active_callbacks[task] = (name, event_type)
+
+        try:
+            # Execute the corresponding method in the plugin
+            if not profile:
+                return await cb(*args, **kwargs)
+
+            started = time.perf_counter()
+            resp = await cb(*args, **kwargs)
+            self.profiler.record(name, event_type, time.perf_counter() - started, resp)
+
+            return resp
+        finally:
+            if outer is None:
+                del self.active_callbacks[task]
+            else:
+                self.active_callbacks[task] = outer
+
+    async def _call_isolated(self, name: str, cb, event_type: str, profile: bool, args, kwargs):
+        try:
+            return await self._call(name, cb, event_type, profile, args, kwargs)
+        except Exception:
+            # Don't let one handler fail the others, report it the same way discord.py would
+            await self.dispatch_event(ON_ERROR, event_type, *args)
+
+    async def _handle_response(self, resp, kwargs) -> bool:
+        """
+        Parses what a plugin returned
+        :return: True if the event should not be passed to any more plugins
+        """
+        if type(resp) is not list:
+            resp = (resp, )
+
+        # Multiple commands can be passed in a form of a tuple
+        for cmd in resp:
+            # Parse additional variables
+            if type(cmd) in (tuple, list, set):
+                # Unpacks parameters
+                cmd, arguments, *safe = cmd
+
+            # No additional arguments
+            else:
+                arguments = ()
+
+            # Makes communication between the core and plugins possible
+
+            # RETURN
+            # Exits the current event immediately and doesn't call any more plugins
+            if cmd == "return":
+                return True
+
+            # ADD_VAR
+            # Adds a variable to the current kwargs
+            elif cmd == "add_var":
+                if type(arguments) is tuple:
+                    # Arguments must be a dict
+                    for k, v in arguments[0].items():
+                        kwargs[k] = v
+                else:
+                    for k, v in arguments.items():
+                        kwargs[k] = v
+
+            # SHUTDOWN
+            # Calls the ON_SHUTDOWN event, then exists
+            elif cmd == "shutdown":
+                try:
+                    await self.dispatch_event(ON_SHUTDOWN)
+
+                finally:
+                    # Sys.exit is usually handled by developer.py in the ON_SHUTDOWN event
+                    # but it is here as backup as well
+                    sys.exit(self.exit_code)
+
+        return False
+
     async def dispatch_event(self, event_type, *args, **kwargs):
         """
         Dispatches any discord event (for example: on_message)
+
+        Ordered handlers run one after another and can stop the event ("return") or pass data
+        to the next ones ("add_var"). Handlers with INDEPENDENT priority then run concurrently:
+        they only see what the ordered ones added and can't stop each other.
         """
         if event_type not in self.event_types:
             log.warning("No such event: {}".format(event_type))
             return
 
         # If there is no registered event, quit
-        if not self.plugin_events[event_type]:
+        if not self.plugin_events[event_type] and not self.independent_events[event_type]:
             return
 
+        is_message = event_type == ON_MESSAGE
+        profile = self.profiler.should_sample()
+
         # Plugins have already been ordered from most important to least important
-        for cb in self.plugin_events[event_type]:
-            # log.debug("Executing plugin {}:{}".format(cb.strip(".py"), event_type))
+        for name, cb in self.plugin_events[event_type]:
+            # log.debug("Executing plugin {}:{}".format(name, event_type))
 
-            # Execute the corresponding method in the plugin
-            resp = await cb(*args, **kwargs)
+            if is_message and self._is_skipped(name, args, kwargs):
+                continue
+
+            resp = await self._call(name, cb, event_type, profile, args, kwargs)
 
             # COMMUNICATION
             # If data is passed, assign proper variables
-            if not resp:
-                continue
+            if resp and await self._handle_response(resp, kwargs):
+                return
 
-            if type(resp) is not list:
-                resp = (resp, )
+        # Import deferred plugins when one of their commands is used
+        if is_message and self.lazy_plugins and "ctx" in kwargs:
+            if "route" not in kwargs:
+                kwargs["route"] = self.router.resolve(args[0].content, kwargs["ctx"].prefix)
 
-            # Multiple commands can be passed in a form of a tuple
-            for cmd in resp:
-                # Parse additional variables
-                if type(cmd) in (tuple, list, set):
-                    # Unpacks parameters
-                    cmd, arguments, *safe = cmd
+            route = kwargs["route"]
+            if route is not None:
+                for name in [a for a in route.matches if a in self.lazy_plugins]:
+                    await self.load_lazy(name)
 
-                # No additional arguments
-                else:
-                    arguments = ()
-
-                # Makes communication between the core and plugins possible
-
-                # RETURN
-                # Exits the current event immediately and doesn't call any more plugins
-                if cmd == "return":
-                    return
-
-                # ADD_VAR
-                # Adds a variable to the current kwargs
-                elif cmd == "add_var":
-                    if type(arguments) is tuple:
-                        # Arguments must be a dict
-                        for k, v in arguments[0].items():
-                            kwargs[k] = v
-                    else:
-                        for k, v in arguments.items():
-                            kwargs[k] = v
-
-                # SHUTDOWN
-                # Calls the ON_SHUTDOWN event, then exists
-                elif cmd == "shutdown":
-                    try:
-                        await self.dispatch_event(ON_SHUTDOWN)
-
-                    finally:
-                        # Sys.exit is usually handled by developer.py in the ON_SHUTDOWN event
-                        # but it is here as backup as well
-                        sys.exit(0)
+        calls = [self._call_isolated(name, cb, event_type, profile, args, kwargs)
+                 for name, cb in self.independent_events[event_type]
+                 if not (is_message and self._is_skipped(name, args, kwargs))]
 
+        if not calls:
+            return
+
+        # A single handler (e.g. the plugin that owns a command) doesn't need a gather
+        if len(calls) == 1:
+            responses = [await calls[0]]
+        else:
+            responses = await asyncio.gather(*calls)
+
+        # Only "shutdown" still has a meaning here
+        for resp in responses:
+            if resp:
+                await self._handle_response(resp, kwargs)
 
 nano = Nano()
 
@@ -389,11 +657,17 @@ nano = Nano()
 
 @client.event
 async def on_message(message):
+    if recorder:
+        recorder.record_message(message)
+
     await nano.dispatch_event(ON_MESSAGE, message)
 
 
 @client.event
 async def on_reaction_add(reaction, user):
+    if recorder:
+        recorder.record_reaction(reaction, user)
+
     await nano.dispatch_event(ON_REACTION_ADD, reaction, user)
 
 
@@ -483,6 +757,9 @@ async def on_ready():
 
     await nano.dispatch_event(ON_READY)
 
+    if nano.lazy_plugins:
+        loop.create_task(nano.preload_lazy_plugins())
+
 
 async def start():
     if not parser.has_option("Credentials", "token"):
@@ -492,6 +769,14 @@ async def start():
 
     token = parser.get("Credentials", "token")
 
+    if parser.getboolean("Watchdog", "enabled", fallback=True):
+        nano.watchdog.start()
+
+    if nano.cluster.enabled:
+        loop.create_task(nano.cluster.run_heartbeat(client))
+
+    loop.create_task(stats.run_flusher())
+
     await client.login(token)
     await client.connect()
 
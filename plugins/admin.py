@@ -8,10 +8,10 @@ import traceback
 from typing import Union
 from discord import utils, Client, Embed, TextChannel, Colour, DiscordException, Object, HTTPException
 
-from core.serverhandler import INVITEFILTER_SETTING, SPAMFILTER_SETTING, WORDFILTER_SETTING
-from core.utils import convert_to_seconds, matches_iterable, is_valid_command, StandardEmoji, \
+from core.serverhandler import INVITEFILTER_SETTING, SPAMFILTER_SETTING, WORDFILTER_SETTING, WORD_MAX_LENGTH
+from core.utils import convert_to_seconds, matches_iterable, StandardEmoji, \
                        resolve_time, log_to_file, is_disabled, IgnoredException, parse_special_chars, \
-                       apply_string_padding, filter_text
+                       apply_string_padding, filter_text, INDEPENDENT
 
 from core.stats import MESSAGE
 
@@ -31,6 +31,8 @@ CMD_LIMIT_A = 1000
 SELFROLE_MAX = 35
 PREFIX_MAX = 50
 BLACKLIST_MAX = 35
+# Guild word lists (see nano.wordlist)
+WORDLIST_MAX = 300
 TICK_DURATION = 15
 
 # Threshold for when to make a new command page
@@ -84,6 +86,12 @@ commands = {
     "nano.blacklist remove": {"desc": "Removes a channel from command blacklist", "use": "[command] [channel name]"},
     "nano.blacklist list": {"desc": "Shows all blacklisted channels on this server", "use": "[command]"},
 
+    "nano.wordlist": {"desc": "Words the word filter blocks on this server, on top of the default ones.\nSubcommands: `add` `remove` `list` `clear`"},
+    "nano.wordlist add": {"desc": "Adds words to the server's word filter.", "use": "[command] word, another word, ..."},
+    "nano.wordlist remove": {"desc": "Removes words from the server's word filter.", "use": "[command] word, another word, ..."},
+    "nano.wordlist list": {"desc": "Shows the words the server added to the word filter.", "use": "[command] (page)"},
+    "nano.wordlist clear": {"desc": "Removes all words the server added to the word filter.", "use": "[command]"},
+
     "nano.settings": {"desc": "Sets server settings like word, spam, invite filtering, log channel and selfrole.\nPossible setting keyords: `wordfilter`, `spamfilter`, `invitefilter`, `logchannel`, `selfrole`, `defaultchannel`", "use": "[command] [setting] True/False/Something else"},
     "nano.settings wordfilter": {"desc": "Turns the swearing filter on or off.", "use": "[command] True/False"},
     "nano.settings spamfilter": {"desc": "Turns the spam filter on or off. (please note, this is only a gibberish filter)", "use": "[command] True/False"},
@@ -116,18 +124,16 @@ commands = {
 
 }
 
-# !cmds conflicts with !cmd add/etc...
-ignore_commands = [
-    "_cmds"
-]
-
 
 class RedisSoftBanScheduler:
-    def __init__(self, client, handler, loop=asyncio.get_event_loop()):
+    def __init__(self, client, handler, loop=asyncio.get_event_loop(), leader=None):
         self.client = client
         self.loop = loop
         self.redis = handler.get_plugin_data_manager(namespace="softban")
 
+        # In cluster mode only the leader lifts softbans
+        self.leader = leader
+
     def get_guild_bans(self, guild_id) -> dict:
         return self.redis.hgetall(guild_id)
 
@@ -170,7 +176,12 @@ class RedisSoftBanScheduler:
             logger.debug("Dispatching")
 
             guild = self.client.get_guild(guild_id)
-            await guild.unban(Object(id=user_id))
+
+            # The guild can belong to a different cluster worker
+            if guild is None:
+                await self.client.http.unban(user_id, guild_id)
+            else:
+                await guild.unban(Object(id=user_id))
         except DiscordException as e:
             logger.warning(e)
 
@@ -181,6 +192,10 @@ class RedisSoftBanScheduler:
         last_time = time.time()
 
         while True:
+            if self.leader and not self.leader.is_leader:
+                last_time = await self.tick(last_time)
+                continue
+
             # Iterate through users and their reminders
             for guild_id, ban in self.get_all_bans().items():
                 # If time is up, unban the user
@@ -189,8 +204,9 @@ class RedisSoftBanScheduler:
                         guild_id = int(guild_id)
                         user_id = int(user)
 
-                        await self.dispatch(guild_id, user_id)
-                        self.redis.hdel(guild_id, user_id)
+                        # Claim it first: only the process that removed it lifts the ban
+                        if self.redis.hdel(guild_id, user_id):
+                            await self.dispatch(guild_id, user_id)
 
             # And tick.
             last_time = await self.tick(last_time)
@@ -417,7 +433,8 @@ class Admin:
         self.trans = kwargs.get("trans")
         self.nano = kwargs.get("nano")
 
-        self.timer = RedisSoftBanScheduler(self.client, self.handler, self.loop)
+        self.timer = RedisSoftBanScheduler(self.client, self.handler, self.loop,
+                                           leader=self.nano.cluster.election("softban"))
         self.loop.create_task(self.timer.start_monitoring())
 
         self.list = ObjectListReactions(self.client, self.handler, self.trans)
@@ -635,21 +652,19 @@ class Admin:
         handler = self.handler
         trans = self.trans
 
-        prefix = kwargs.get("prefix")
-        lang = kwargs.get("lang")
+        ctx = kwargs.get("ctx")
+        prefix = ctx.prefix
+        lang = ctx.lang
 
         assert isinstance(client, Client)
 
-        # Check if this is a valid command
-        if not is_valid_command(message.content, commands, prefix):
+        # Only called when the router matched one of our commands (see NanoPlugin.commands_only),
+        # a longer command of another plugin wins (!cmds is help's, not !cmd's)
+        route = kwargs["route"]
+        if route.matches["admin"] != route.command:
             return
-        else:
-            # Check for conflicts
-            for ignore in ignore_commands:
-                if message.content.startswith(ignore.replace("_", prefix)):
-                    return
 
-            self.stats.add(MESSAGE)
+        self.stats.add(MESSAGE)
 
         def startswith(*matches):
             for match in matches:
@@ -1715,6 +1730,75 @@ class Admin:
 
                 await message.channel.send(trans.get("MSG_BLACKLIST_LIST", lang).format(" ".join(names)))
 
+        # nano.wordlist
+        elif startswith("nano.wordlist"):
+            setting, _, words = message.content[len("nano.wordlist "):].strip(" ").partition(" ")
+            words = [a.strip(" ").lower() for a in words.split(",") if a.strip(" ")]
+
+            # nano.wordlist add
+            if setting == "add":
+                if not words:
+                    await message.channel.send(trans.get("MSG_WORDLIST_NO_WORDS", lang))
+                    return
+
+                if [a for a in words if len(a) > WORD_MAX_LENGTH]:
+                    await message.channel.send(trans.get("MSG_WORDLIST_TOO_LONG", lang).format(WORD_MAX_LENGTH))
+                    return
+
+                current = await handler.aio.get_words(message.guild.id)
+                if len(set(current + words)) > WORDLIST_MAX:
+                    await message.channel.send(trans.get("MSG_WORDLIST_TOO_MANY", lang).format(WORDLIST_MAX))
+                    return
+
+                added = await handler.aio.add_words(message.guild.id, words)
+                await message.channel.send(trans.get("MSG_WORDLIST_ADDED", lang).format(added))
+
+            # nano.wordlist remove
+            elif setting == "remove":
+                if not words:
+                    await message.channel.send(trans.get("MSG_WORDLIST_NO_WORDS", lang))
+                    return
+
+                # Longer words can't be on the list
+                words = [a for a in words if len(a) <= WORD_MAX_LENGTH]
+
+                removed = await handler.aio.remove_words(message.guild.id, words) if words else 0
+                await message.channel.send(trans.get("MSG_WORDLIST_REMOVED", lang).format(removed))
+
+            # nano.wordlist list (page)
+            elif setting == "list":
+                current = await handler.aio.get_words(message.guild.id)
+
+                if not current:
+                    await message.channel.send(trans.get("MSG_WORDLIST_NONE", lang))
+                    return
+
+                try:
+                    page = int(words[0]) - 1 if words else 0
+                except ValueError:
+                    await message.channel.send(trans.get("ERROR_NOT_NUMBER", lang))
+                    return
+
+                # A full list is far longer than one message
+                w_list, w_page = make_pages_from_list(["`{}`".format(a) for a in current])
+
+                if not 0 <= page <= w_page:
+                    await message.channel.send(trans.get("MSG_WORDLIST_NO_PAGE", lang).format(w_page + 1))
+                    return
+
+                msg = trans.get("MSG_WORDLIST_LIST", lang).format(page + 1, w_page + 1, "\n".join(w_list[page]))
+                msg_list = await message.channel.send(msg)
+
+                await self.list.new_message(msg_list, page, w_list, trans.get("MSG_WORDLIST_LIST", lang))
+
+            # nano.wordlist clear
+            elif setting == "clear":
+                await handler.aio.clear_words(message.guild.id)
+                await message.channel.send(trans.get("MSG_WORDLIST_CLEARED", lang))
+
+            else:
+                await message.channel.send(trans.get("MSG_WORDLIST_WRONG_USAGE", lang).format(prefix))
+
         # nano.serverreset
         elif startswith("nano.serverreset"):
             confirm = trans.get("INFO_CONFIRM", lang)
@@ -1728,7 +1812,7 @@ class Admin:
                 await message.channel.send(trans.get("MSG_RESET_CONFIRM_TIMEOUT", lang))
                 return
 
-            handler.reset_server(message.guild)
+            await handler.aio.reset_server(message.guild)
             await message.channel.send(trans.get("MSG_RESET_DONE", lang))
 
         # nano.changeprefix
@@ -1799,7 +1883,7 @@ class Admin:
             # User confirmed the action
             else:
                 if ch1.content.lower().strip(" ") == YES_L:
-                    handler.server_setup(message.guild)
+                    await handler.aio.server_setup(message.guild)
 
                     # Edit message to confirm action
                     edit = msg_one + "\n\n " + DONE_EXPR
@@ -2079,8 +2163,9 @@ class NanoPlugin:
     version = "33"
 
     handler = Admin
+    commands_only = True
     events = {
-        "on_message": 10,
+        "on_message": INDEPENDENT,
         "on_member_remove": 4,
         "on_reaction_add": 10,
         "on_plugins_loaded": 5,
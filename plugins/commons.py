@@ -1,15 +1,15 @@
 # coding=utf-8
 import logging
-import sys
 import time
-import re
+from collections import OrderedDict
 from datetime import timedelta, datetime
 from random import randint
 
 from discord import Embed, Forbidden, utils
 
 from core.stats import MESSAGE, PING
-from core.utils import is_valid_command, add_dots, DynamicResponse, CmdResponseTypes, IgnoredException, filter_text
+from core.templates import TemplateEngine, TemplateContext, RenderError, BRACES
+from core.utils import add_dots, filter_text, INDEPENDENT
 
 log = logging.getLogger(__name__)
 log.setLevel(logging.INFO)
@@ -22,6 +22,9 @@ log.setLevel(logging.INFO)
 MAX_DICE_EXPR = 50
 MAX_DICE = 1000
 
+# Custom command indexes of this many guilds are kept in memory
+COMMAND_INDEX_CACHE_SIZE = 1000
+
 quotes = [
     "You miss 100% of the shots you don’t take. –Wayne Gretzky",
     "The most difficult thing is the decision to act, the rest is merely tenacity. –Amelia Earhart",
@@ -67,6 +70,7 @@ commands = {
     "_quote": {"desc": "Brightens your day with a random quote."},
     "_invite": {"desc": "Gives you a link to invite Nano to another (your) server.", "alias": "nano.invite"},
     "nano.invite": {"desc": "Gives you a link to invite Nano to another (your) server.", "alias": "_invite"},
+    "nano.invite.make_real": {"desc": "Restricted to owner, gives you the real invite link of a test instance."},
     "_avatar": {"desc": "Gives you the avatar url of a mentioned person", "use": "[command] [mention or name]"},
     "_say": {"desc": "Says something (#channel is optional)", "use": "[command] (#channel) [message]"},
     "nano.info": {"desc": "A little info about me.", "alias": "_ayybot"},
@@ -76,182 +80,70 @@ commands = {
 valid_commands = commands.keys()
 
 
-# Utility for non-failable get operator
-def l_get(lst, index, fallback=None):
-    return lst[index] if len(lst) > index else fallback
+class CommandIndex:
+    """
+    Trie of a guild's custom command triggers, match() finds the longest trigger the message starts with
+    """
+    __slots__ = ("root", )
 
+    def __init__(self, commands: dict):
+        # Nodes are dicts of char -> node, a response is stored under None
+        self.root = {}
 
-class Parser:
-    __slots__ = ("pt", )
+        for trigger, response in commands.items():
+            node = self.root
+            for char in trigger:
+                node = node.setdefault(char, {})
 
-    def __init__(self):
-        # Used to capture parsing groups
-        self.pt = re.compile(r"({.+?})")
+            node[None] = response
 
-    def _split_groups(self, text):
-        text_list = []
+    def match(self, content: str):
+        node = self.root
+        response = node.get(None)
 
-        # Splits the text on every group in the match
-        c_ind = 0
-        gr = self.pt.finditer(text)
-        for m in gr:
-            st = m.start()
-            en = m.end()
+        for char in content:
+            node = node.get(char)
+            if node is None:
+                break
 
-            text_list.append(text[c_ind:st])
-            text_list.append(text[st:en])
-            # Set last char index
-            c_ind = en
+            response = node.get(None, response)
 
-        # Append the last group
-        last = text[c_ind:len(text)]
-        text_list.append(last)
+        return response
 
-        return text_list
 
-    @staticmethod
-    def _parse_group(group, ctx):
-        name, *tokens = group.split("|")
-        if len(tokens) != 0:
-            first, *tokens = tokens
-        else:
-            first = None
-
-        # Actually gets the result
-        # whole system in this function because of performance
-
-        # 1. Author stuff
-        if name == "author":
-            if first == "name":
-                return ctx.author.display_name
-            if first == "id":
-                return ctx.author.id
-            if first == "mention":
-                return ctx.author.mention
-            if first == "discrim":
-                return ctx.author.discriminator
-            if first == "avatar":
-                return ctx.author.avatar_url or ctx.author.default_avatar_url
-            else:
-                return ctx.author.name
+class CommandIndexCache:
+    """
+    LRU cache of CommandIndex per guild
+    An entry is used as long as its version is not older than the guild's commands version (see GuildContext).
+    """
+    __slots__ = ("_indexes", "max_size", "hits", "misses")
 
-        # 2. Mention stuff
-        elif name == "mentions":
-            # first == index
-            try:
-                typ = tokens[0]
-            except IndexError:
-                typ = None
+    def __init__(self, max_size: int = COMMAND_INDEX_CACHE_SIZE):
+        # guild_id -> (version, CommandIndex)
+        self._indexes = OrderedDict()
+        self.max_size = max_size
 
-            if first:
-                first = int(first)
-            else:
-                first = 0
+        self.hits = 0
+        self.misses = 0
 
-            try:
-                if typ == "name":
-                    return ctx.mentions[first].display_name
-                if typ == "id":
-                    return ctx.mentions[first].id
-                if typ == "mention":
-                    return ctx.mentions[first].mention
-                if typ == "discrim":
-                    return ctx.mentions[first].discriminator
-                if typ == "avatar":
-                    return ctx.mentions[first].avatar_url or ctx.mentions[first].default_avatar_url
-                else:
-                    return ctx.mentions[first].name
-            except IndexError:
-                raise IndexError("No such mention") from None
-
-        # 3. Random numbers
-        elif name == "rnd":
-            # from is first
-            # to is the second item (index 1)
-            to = l_get(tokens, 0)
-            first = first or 1
-
-            # Two arguments
-            if to:
-                # Assumes both arguments can be ints
-                return randint(int(first), int(to))
-            # Only one
-            else:
-                # Assumes argument is int
-                return randint(0, int(first))
-
-        elif name == "time":
-            # https://docs.python.org/3/library/datetime.html#strftime-strptime-behavior
-            first = first or "format"
-
-            if first == "raw":
-                return time.time()
-            elif first == "now":
-                return datetime.now().strftime("%H:%M %d. of %B, %Y")
-            elif first == "format":
-                return datetime.now().strftime(tokens[0])
-            else:
-                # Defaults to epoch time
-                return time.time()
+    def get(self, guild_id: int, version: int):
+        entry = self._indexes.get(guild_id)
 
-        elif name == "choose":
-            items = (first, *tokens)
-            chnum = randint(0, len(items) - 1)
+        # Versions come from a global counter, a newer one is never stale
+        if entry is None or entry[0] < version:
+            self.misses += 1
+            return None
 
-            return items[chnum]
+        self._indexes.move_to_end(guild_id)
+        self.hits += 1
+        return entry[1]
 
-        # 4. Failure fallback
-        elif name == "onfail":
-            # onfail|<message> - returns your custom text
-            # onfail|raw - returns the raw exception
-            if first == "raw":
-                return DynamicResponse.register_failure_response(lambda: "Error: " + str(sys.exc_info()[1]))
-            else:
-                return DynamicResponse.register_failure_response(first)
+    def put(self, guild_id: int, version: int, index: CommandIndex):
+        self._indexes[guild_id] = (version, index)
+        self._indexes.move_to_end(guild_id)
 
-    @staticmethod
-    def _handle_onfail(on_fail):
-        if callable(on_fail):
-            return on_fail()
-        else:
-            return on_fail
-
-    def parse(self, text, ctx):
-        # Ignore stuff that isn't a dynamic command
-        if "{" not in text or "}" not in text:
-            return text
-
-        ls = self._split_groups(text)
-        responses = []
-
-        on_fail = None
-
-        for ind, t in enumerate(ls):
-            if t and (t[0] == "{") and (t[-1] == "}"):
-                # valid group, parse
-                # Cut out { and }
-                try:
-                    result = self._parse_group(t[1:-1], ctx)
-                except Exception:
-                    if on_fail is not None:
-                        return self._handle_onfail(on_fail)
-
-                    raise IgnoredException
-
-                if type(result) is DynamicResponse:
-                    # Special cases (for example: {onfail|text}
-                    if result.intention == CmdResponseTypes.REGISTER_ON_FAIL:
-                        on_fail = result.data
-
-                    # Don't add that class' repr to the list
-                    continue
-
-                responses.append(str(result))
-            # Not a group, just append it to responses
-            else:
-                responses.append(t)
-
-        return "".join(responses)
+        if len(self._indexes) > self.max_size:
+            self._indexes.popitem(last=False)
 
 
 class Commons:
@@ -267,7 +159,24 @@ class Commons:
         self.getter = None
         self.resolve_user = None
 
-        self.parser = Parser()
+        self.templates = TemplateEngine(BRACES)
+        self.command_indexes = CommandIndexCache()
+
+    async def get_command_index(self, ctx) -> CommandIndex:
+        """
+        Returns the custom commands of a guild, only fetched again when they change
+        """
+        # Commands that haven't changed since versions were introduced are version 0
+        version = ctx.commands_version or 0
+
+        index = self.command_indexes.get(ctx.guild_id, version)
+        if index is None:
+            version, commands = await self.handler.aio.get_command_list(ctx.guild_id)
+
+            index = CommandIndex(commands)
+            self.command_indexes.put(ctx.guild_id, version or 0, index)
+
+        return index
 
     async def on_plugins_loaded(self):
         self.getter = self.nano.get_plugin("server").instance
@@ -297,31 +206,31 @@ class Commons:
         client = self.client
         trans = self.trans
 
-        prefix = kwargs.get("prefix")
-        lang = kwargs.get("lang")
+        ctx = kwargs.get("ctx")
+        prefix = ctx.prefix
+        lang = ctx.lang
 
         # Custom commands registered for the server
-        server_commands = self.handler.get_custom_commands_keys(message.guild.id)
+        index = await self.get_command_index(ctx)
+        response = index.match(message.content)
 
-        if server_commands:
-            # According to tests, .startswith is faster than slicing, m8pls
-            for k in server_commands:
-                k = str(k)
-
-                if message.content.startswith(k):
-                    # raw_resp = self.handler.get_custom_command_by_key(message.guild.id, k)
-                    # response = self.parser.parse(raw_resp, message)
-                    response = self.handler.get_custom_command_by_key(message.guild.id, k)
-
-                    await message.channel.send(response)
-                    return
+        if response is not None:
+            try:
+                response = self.templates.render(response, TemplateContext.from_message(message))
+            except RenderError as e:
+                log.debug("Custom command in {} failed: {}".format(message.guild.id, e))
+                await message.channel.send(trans.get("ERROR_CUSTOM_CMD_FAILED", lang).format(filter_text(str(e))))
+                return
 
+            await message.channel.send(response)
+            return
 
-        # Check if this is a valid command
-        if not is_valid_command(message.content, commands, prefix):
+        # Commands are matched by the router (see core.router)
+        route = kwargs.get("route")
+        if route is None or "commons" not in route:
             return
-        else:
-            self.stats.add(MESSAGE)
+
+        self.stats.add(MESSAGE)
 
         def startswith(*matches):
             for match in matches:
@@ -557,7 +466,7 @@ class NanoPlugin:
 
     handler = Commons
     events = {
-        "on_message": 10,
+        "on_message": INDEPENDENT,
         "on_reaction_add": 10,
         "on_plugins_loaded": 5,
         # type : importance
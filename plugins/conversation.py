@@ -3,6 +3,8 @@ import logging
 from random import randint
 from fuzzywuzzy import fuzz, process
 
+from core.utils import INDEPENDENT
+
 
 log = logging.getLogger(__name__)
 log.setLevel(logging.INFO)
@@ -30,10 +32,11 @@ class Conversation:
             return False
 
     async def on_message(self, message, **kwargs):
-        prefix = kwargs.get("prefix")
+        ctx = kwargs.get("ctx")
+        prefix = ctx.prefix
 
         trans = self.trans
-        lang = kwargs.get("lang")
+        lang = ctx.lang
 
         if self.client.user not in message.mentions:
             return
@@ -110,6 +113,6 @@ class NanoPlugin:
 
     handler = Conversation
     events = {
-        "on_message": 10
+        "on_message": INDEPENDENT
         # type : importance
     }
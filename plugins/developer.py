@@ -10,7 +10,8 @@ from shutil import copy2
 from discord import Game, utils, Embed, Colour, DiscordException
 
 from core.stats import MESSAGE
-from core.utils import is_valid_command, log_to_file, StandardEmoji, resolve_time
+from core.cluster import EXIT_RESTART
+from core.utils import log_to_file, StandardEmoji, resolve_time, INDEPENDENT
 from core.confparser import get_settings_parser, BACKUP_DIR, DATA_DIR
 
 #######################
@@ -42,6 +43,24 @@ game_list = [
 
 commands = {
     "nano.dev": {"desc": "Developer commands, restricted."},
+    "nano.dev.server_info": {"desc": "Restricted to owner, shows info about a server.", "use": "[command] [server id]"},
+    "nano.dev.test_exception": {"desc": "Restricted to owner, raises an exception."},
+    "nano.dev.embed_test": {"desc": "Restricted to owner, sends a test embed."},
+    "nano.dev.backup": {"desc": "Restricted to owner, backs up the database."},
+    "nano.dev.leave_server": {"desc": "Restricted to owner, leaves a server.", "use": "[command] [server id]"},
+    "nano.dev.tf.clean": {"desc": "Restricted to owner, downloads the tf2 item data again."},
+    "nano.dev.plugin.reload": {"desc": "Restricted to owner, reloads a plugin.", "use": "[command] [plugin name]"},
+    "nano.dev.servers.tidy": {"desc": "Restricted to owner, deletes data of servers Nano is no longer in."},
+    "nano.dev.translations.reload": {"desc": "Restricted to owner, reloads translations."},
+    "nano.dev.perf": {"desc": "Restricted to owner, shows event latency per plugin.", "use": "[command] (reset/total/calls)"},
+    "nano.dev.stalls": {"desc": "Restricted to owner, shows event loop stalls.", "use": "[command] (reset)"},
+    "nano.dev.cache": {"desc": "Restricted to owner, shows cache statistics."},
+    "nano.dev.modlog": {"desc": "Restricted to owner, shows moderation log statistics."},
+    "nano.dev.history": {"desc": "Restricted to owner, shows activity history.", "use": "[command] (60m/24h/7d)"},
+    "nano.dev.test_default_channel": {"desc": "Restricted to owner, sends a test message to the default channel."},
+    "nano.dev.announce": {"desc": "Restricted to owner, sends an announcement to all servers.", "use": "[command] [message]"},
+    "nano.dev.logannounce": {"desc": "Restricted to owner, sends an announcement to all log channels.", "use": "[command] [message]"},
+    "nano.dev.userdetective": {"desc": "Restricted to owner, looks up a user.", "use": "[command] [mention or user id]"},
     "nano.playing": {"desc": "Restricted to owner, changes 'playing' status.", "use": "[command] [status]"},
     "nano.restart": {"desc": "Restricted to owner, restarts down the bot.", "use": "[command]"},
     "nano.reload": {"desc": "Restricted to owner, reloads all settings from config file.", "alias": "_reload"},
@@ -51,6 +70,21 @@ commands = {
 valid_commands = commands.keys()
 
 
+# nano.dev.history argument -> (resolution, amount of buckets)
+HISTORY_VIEWS = {
+    "60m": ("minute", 60),
+    "24h": ("hour", 24),
+    "7d": ("day", 7),
+}
+
+SPARK_CHARS = "▁▂▃▄▅▆▇█"
+
+
+def sparkline(values: list) -> str:
+    highest = max(values) or 1
+    return "".join(SPARK_CHARS[int(v / highest * (len(SPARK_CHARS) - 1))] for v in values)
+
+
 class StatusRoller:
     def __init__(self, client, time=21600):  # 6 Hours
         log.info("Status changer enabled")
@@ -87,9 +121,12 @@ class StatusRoller:
 
 
 class BackupManager:
-    def __init__(self, time=86400, keep_backup_every=3):  # 86400 seconds = one day (backup is executed once a day)
+    def __init__(self, time=86400, keep_backup_every=3, leader=None):  # 86400 seconds = one day (backup is executed once a day)
         log.info("Backup enabled")
 
+        # In cluster mode only one worker makes backups
+        self.leader = leader
+
         self.s_path = os.path.join(DATA_DIR, "data.rdb")
         self.s_path_d = os.path.join(BACKUP_DIR, "data.rdb.bak")
 
@@ -140,6 +177,9 @@ class BackupManager:
             # Run the backup every day or as specified
             await sleep(self.time)
 
+            if self.leader and not self.leader.is_leader:
+                continue
+
             # Full backup counter
             self.temp_keep -= 1
 
@@ -162,7 +202,7 @@ class DevFeatures:
         self.loop = kwargs.get("loop")
         self.trans = kwargs.get("trans")
 
-        self.backup = BackupManager()
+        self.backup = BackupManager(leader=self.nano.cluster.election("backup"))
         self.roller = StatusRoller(self.client)
 
         self.shutdown_mode = None
@@ -175,14 +215,12 @@ class DevFeatures:
     async def on_message(self, message, **kwargs):
         client = self.client
 
-        prefix = kwargs.get("prefix")
-        lang = kwargs.get("lang")
+        ctx = kwargs.get("ctx")
+        prefix = ctx.prefix
+        lang = ctx.lang
 
-        # Check if this is a valid command
-        if not is_valid_command(message.content, commands, prefix):
-            return
-        else:
-            self.stats.add(MESSAGE)
+        # Only called when the router matched one of our commands (see NanoPlugin.commands_only)
+        self.stats.add(MESSAGE)
 
         def startswith(*matches):
             for match in matches:
@@ -268,6 +306,7 @@ class DevFeatures:
         elif startswith("nano.restart"):
             await message.channel.send("**DED, but gonna come back**")
 
+            await self.flush_before_logout()
             await client.logout()
 
             self.shutdown_mode = "restart"
@@ -277,6 +316,7 @@ class DevFeatures:
         elif startswith("nano.kill"):
             await message.channel.send("**DED**")
 
+            await self.flush_before_logout()
             await client.logout()
 
             self.shutdown_mode = "exit"
@@ -295,6 +335,74 @@ class DevFeatures:
 
             await message.channel.send(StandardEmoji.PERFECT)
 
+        # nano.dev.perf (reset/total/calls)
+        elif startswith("nano.dev.perf"):
+            profiler = self.nano.profiler
+            arg = message.content[len("nano.dev.perf "):].strip(" ")
+
+            if arg == "reset":
+                profiler.reset()
+                await message.channel.send("Profiler data cleared " + StandardEmoji.PERFECT)
+                return
+
+            sort_by = arg if arg in ("total", "calls", "p50", "p95") else "p99"
+            table = profiler.format_stats(limit=15, sort_by=sort_by)
+
+            await message.channel.send("Event latency in ms (sampling 1/{}, sorted by {}):\n```{}```".format(
+                profiler.sample_rate, sort_by, table[:1850]))
+
+        # nano.dev.stalls (reset)
+        elif startswith("nano.dev.stalls"):
+            watchdog = self.nano.watchdog
+
+            if message.content[len("nano.dev.stalls "):].strip(" ") == "reset":
+                watchdog.reset()
+                await message.channel.send("Stall data cleared " + StandardEmoji.PERFECT)
+                return
+
+            wd_stats = watchdog.get_stats()
+            per_plugin = "\n".join("{}: {}".format(name, amount) for name, amount in
+                                   sorted(wd_stats["per_plugin"].items(), key=lambda a: a[1], reverse=True))
+
+            embed = Embed(title="Event loop stalls", colour=Colour.darker_grey())
+            embed.add_field(name="Lag", value="current: {}ms\nmax: {}ms".format(
+                round(wd_stats["current_lag"] * 1000, 1), round(wd_stats["max_lag"] * 1000, 1)))
+            embed.add_field(name="Stalls per plugin", value=per_plugin or "None so far")
+
+            if watchdog.stalls:
+                last = watchdog.stalls[-1]
+                stack = "".join(last.stack[-6:])
+                embed.add_field(name="Last: {}s in {} ({})".format(round(last.lag, 3), last.plugin, last.event),
+                                value="```{}```".format(stack[-900:]), inline=False)
+
+            await message.channel.send(embed=embed)
+
+        # nano.dev.cache
+        elif startswith("nano.dev.cache"):
+            cache_stats = self.handler.cache.get_stats()
+            await message.channel.send("Guild settings cache:\n```{}```".format(
+                "\n".join("{}: {}".format(k, v) for k, v in cache_stats.items())))
+
+        # nano.dev.modlog
+        elif startswith("nano.dev.modlog"):
+            log_stats = self.nano.get_plugin("moderator").instance.log.get_stats()
+            await message.channel.send("Moderation logs:\n```{}```".format(
+                "\n".join("{}: {}".format(k, v) for k, v in log_stats.items())))
+
+        # nano.dev.history (60m/24h/7d)
+        elif startswith("nano.dev.history"):
+            arg = message.content[len("nano.dev.history "):].strip(" ")
+            resolution, amount = HISTORY_VIEWS.get(arg, HISTORY_VIEWS["24h"])
+
+            history = await self.stats.get_history(resolution, amount)
+            lines = ["{:<10} {:>8} {:>7}  {}".format("", "total", "peak", "per {}, oldest first".format(resolution))]
+
+            for name, values in history.items():
+                lines.append("{:<10} {:>8} {:>7}  {}".format(name, sum(values), max(values), sparkline(values)))
+
+            await message.channel.send("Activity over the last {}:\n```{}```".format(
+                arg if arg in HISTORY_VIEWS else "24h", "\n".join(lines)))
+
         # nano.dev.test_default_channel
         elif startswith("nano.dev.test_default_channel"):
             df = await self.default_channel(message.guild)
@@ -397,11 +505,33 @@ class DevFeatures:
         self.loop.create_task(self.backup.start())
         self.loop.create_task(self.roller.run())
 
+        dump_interval = parser.getint("Profiler", "dump_interval", fallback=900)
+        if dump_interval > 0:
+            self.loop.create_task(self.nano.profiler.run_dumper(dump_interval))
+
+    async def flush_before_logout(self):
+        """
+        Sends what still needs the connection to Discord (ON_SHUTDOWN is dispatched after logging out)
+        """
+        if "moderator" in self.nano.plugins:
+            await self.nano.get_plugin("moderator").instance.log.stop()
+
     async def on_shutdown(self):
+        # Write stats that are still in memory
+        self.stats.flush()
+
         # Make redis save data with BGSAVE
         self.handler.bg_save()
 
-        if self.shutdown_mode == "restart":
+        # Let other workers take over background jobs right away
+        await self.nano.cluster.release()
+
+        if self.shutdown_mode == "restart" and self.nano.cluster.enabled:
+            # The supervisor starts this worker again
+            log.critical("Restarting this worker!")
+            self.nano.exit_code = EXIT_RESTART
+
+        elif self.shutdown_mode == "restart":
             log.critical("Restarting Nano!")
             # Launches a new instance of Nano...
             if os.name == "nt":
@@ -415,8 +545,9 @@ class NanoPlugin:
     version = "27"
 
     handler = DevFeatures
+    commands_only = True
     events = {
-        "on_message": 10,
+        "on_message": INDEPENDENT,
         "on_ready": 5,
         "on_shutdown": 15,
         "on_plugins_loaded": 5,
@@ -16,7 +16,7 @@ from discord import Embed, Colour, File
 from PIL import Image, ImageDraw, ImageFont
 
 from core.stats import PRAYER, MESSAGE, IMAGE_SENT
-from core.utils import is_valid_command, build_url, add_dots, gen_id, filter_text
+from core.utils import build_url, add_dots, gen_id, filter_text, INDEPENDENT
 from core.confparser import get_config_parser, DATA_DIR, PLUGINS_DIR
 
 # plugins/config.ini
@@ -271,8 +271,9 @@ class Fun:
     async def on_message(self, message, **kwargs):
         trans = self.trans
 
-        prefix = kwargs.get("prefix")
-        lang = kwargs.get("lang")
+        ctx = kwargs.get("ctx")
+        prefix = ctx.prefix
+        lang = ctx.lang
 
         # simple_commands = {
         #     "( ͡° ͜ʖ ͡°)": trans.get("MSG_WHOKNOWS", lang)
@@ -285,11 +286,8 @@ class Fun:
         #         self.stats.add(MESSAGE)
         #         return
 
-        # Check if this is a valid command
-        if not is_valid_command(message.content, commands, prefix):
-            return
-        else:
-            self.stats.add(MESSAGE)
+        # Only called when the router matched one of our commands (see NanoPlugin.commands_only)
+        self.stats.add(MESSAGE)
 
         def startswith(*matches):
             for match in matches:
@@ -406,7 +404,8 @@ class NanoPlugin:
     version = "13"
 
     handler = Fun
+    commands_only = True
     events = {
-        "on_message": 10,
+        "on_message": INDEPENDENT,
         # type : importance
     }
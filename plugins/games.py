@@ -10,7 +10,7 @@ except ImportError:
     from json import loads, dumps
 from discord import Embed
 
-from core.utils import is_valid_command, build_url
+from core.utils import build_url, INDEPENDENT
 from core.confparser import get_config_parser
 from core.stats import MESSAGE
 
@@ -207,14 +207,12 @@ class GameDB:
     async def on_message(self, message, **kwargs):
         trans = self.trans
 
-        prefix = kwargs.get("prefix")
-        lang = kwargs.get("lang")
+        ctx = kwargs.get("ctx")
+        prefix = ctx.prefix
+        lang = ctx.lang
 
-        # Check if this is a valid command
-        if not is_valid_command(message.content, commands, prefix):
-            return
-        else:
-            self.stats.add(MESSAGE)
+        # Only called when the router matched one of our commands (see NanoPlugin.commands_only)
+        self.stats.add(MESSAGE)
 
         def startswith(*matches):
             for match in matches:
@@ -269,7 +267,8 @@ class NanoPlugin:
     version = "1"
 
     handler = GameDB
+    commands_only = True
     events = {
-        "on_message": 10,
+        "on_message": INDEPENDENT,
         # type : importance
     }
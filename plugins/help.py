@@ -6,7 +6,7 @@ from datetime import datetime
 from discord import Embed, Colour
 
 from core.stats import MESSAGE, HELP, WRONG_ARG
-from core.utils import is_valid_command
+from core.utils import INDEPENDENT
 from core.confparser import get_settings_parser, DATA_DIR
 
 # Template: {"desc": ""},
@@ -51,10 +51,6 @@ def save_submission(sub):
         subs.write("{}\n{}\n\n".format(sub, "-" * 20))
 
 
-def get_raw_commands(plugin):
-    return getattr(plugin, "commands", None)
-
-
 class Help:
     def __init__(self, **kwargs):
         self.loop = kwargs.get("loop")
@@ -71,6 +67,7 @@ class Help:
         cmd = self.commands.get(str(cmd_name.replace(prefix, "_").strip(" ")))
 
         if cmd:
+            trans = self.trans.for_lang(lang)
             emb = Embed(colour=Colour.blue())
 
             cmd_name = cmd_name.replace(prefix, "")
@@ -78,17 +75,17 @@ class Help:
             description = cmd.get("desc")
             if description:
                 description = description.replace("{p}", prefix)
-                emb.add_field(name=self.trans.get("MSG_HELP_DESC", lang), value=description)
+                emb.add_field(name=trans.get("MSG_HELP_DESC"), value=description)
 
             use = cmd.get("use")
             if use:
                 use = cmd.get("use").replace("[command]", prefix + cmd_name if not cmd_name.startswith("nano.") else cmd_name)
-                emb.add_field(name=self.trans.get("MSG_HELP_USE", lang), value=use, inline=False)
+                emb.add_field(name=trans.get("MSG_HELP_USE"), value=use, inline=False)
 
             alias = cmd.get("alias")
             if alias:
                 alias = cmd.get("alias").replace("_", prefix)
-                emb.add_field(name=self.trans.get("MSG_HELP_ALIASES", lang), value=alias, inline=False)
+                emb.add_field(name=trans.get("MSG_HELP_ALIASES"), value=alias, inline=False)
 
             self.stats.add(HELP)
             return "**{}**".format(cmd_name), emb
@@ -98,9 +95,8 @@ class Help:
             return None, None
 
     async def on_plugins_loaded(self):
-        # Collect all commands
-        plugins = [a.plugin for a in self.nano.plugins.values() if a.plugin]
-        cmdslist = [get_raw_commands(b) for b in plugins if get_raw_commands(b)]
+        # Collect all commands (including plugins that are imported on first use)
+        cmdslist = [b for b in self.nano.get_plugin_commands().values() if b]
 
         for pl_list in cmdslist:
             for command, info in pl_list.items():
@@ -109,16 +105,14 @@ class Help:
                     self.commands[command] = info
 
     async def on_message(self, message, *_, **kwargs):
-        trans = self.trans
+        ctx = kwargs.get("ctx")
+        prefix = ctx.prefix
+        lang = ctx.lang
 
-        prefix = kwargs.get("prefix")
-        lang = kwargs.get("lang")
+        trans = self.trans.for_lang(lang)
 
-        # Check if this is a valid command
-        if not is_valid_command(message.content, commands, prefix):
-            return
-        else:
-            self.stats.add(MESSAGE)
+        # Only called when the router matched one of our commands (see NanoPlugin.commands_only)
+        self.stats.add(MESSAGE)
 
         def startswith(*matches):
             for match in matches:
@@ -129,7 +123,7 @@ class Help:
 
         # Bare !help
         if message.content.strip(" ") == (prefix + "help"):
-            await message.channel.send(trans.get("MSG_HELP", lang).format(prefix=prefix))
+            await message.channel.send(trans.get("MSG_HELP").format(prefix=prefix))
 
             self.stats.add(HELP)
 
@@ -141,19 +135,19 @@ class Help:
                 arg = message.content[len(prefix + "commands "):].lower()
 
             if not arg or not cmd_links.get(arg):
-                await message.channel.send(trans.get("MSG_HELP_CMDWEB", lang))
+                await message.channel.send(trans.get("MSG_HELP_CMDWEB"))
             else:
                 ending = cmd_links.get(arg)
                 full_link = BASE_CMDS_LINK + ending
 
-                await message.channel.send(trans.get("MSG_HELP_CMD_SPEC", lang).format(full_link))
+                await message.channel.send(trans.get("MSG_HELP_CMD_SPEC").format(full_link))
 
 
             self.stats.add(HELP)
 
         # !help simple
         elif startswith(prefix + "help simple"):
-            await message.channel.send(trans.get("MSG_HELP_SIMPLE", lang).format(prefix=prefix))
+            await message.channel.send(trans.get("MSG_HELP_SIMPLE").format(prefix=prefix))
 
             self.stats.add(HELP)
 
@@ -168,7 +162,7 @@ class Help:
                 if name:
                     await message.channel.send(name, embed=embed)
                 else:
-                    await message.channel.send(trans.get("MSG_HELP_CMDNOTFOUND", lang).format(prefix=prefix))
+                    await message.channel.send(trans.get("MSG_HELP_CMDNOTFOUND").format(prefix=prefix))
 
             else:
                 name, embed = self.get_command_info(prefix + search, prefix, lang)
@@ -176,7 +170,7 @@ class Help:
                 if name:
                     await message.channel.send(name, embed=embed)
                 else:
-                    await message.channel.send(trans.get("MSG_HELP_CMDNOTFOUND", lang).format(prefix=prefix))
+                    await message.channel.send(trans.get("MSG_HELP_CMDNOTFOUND").format(prefix=prefix))
 
                 self.stats.add(HELP)
 
@@ -187,12 +181,12 @@ class Help:
 
             # Disallow empty reports
             if not report:
-                await message.channel.send(trans.get("MSG_REPORT_EMPTY", lang))
+                await message.channel.send(trans.get("MSG_REPORT_EMPTY"))
                 return
 
             # :P
             if report in ("hi", "hello"):
-                await message.channel.send(trans.get("MSG_REPORT_EE_THX", lang))
+                await message.channel.send(trans.get("MSG_REPORT_EE_THX"))
                 return
 
             # Cooldown implementation
@@ -201,7 +195,7 @@ class Help:
             else:
                 # 300 seconds --> 5 minute cooldown
                 if (time.time() - self.last_times[message.author.id]) < 300:
-                    await message.channel.send(trans.get("MSG_REPORT_RATELIMIT", lang))
+                    await message.channel.send(trans.get("MSG_REPORT_RATELIMIT"))
                     return
 
                 else:
@@ -235,15 +229,15 @@ class Help:
             save_submission(to_file)
             await owner.send(comp)
 
-            await message.channel.send(trans.get("MSG_REPORT_THANKS", lang))
+            await message.channel.send(trans.get("MSG_REPORT_THANKS"))
 
         # !bug
         elif startswith(prefix + "bug"):
-            await message.channel.send(trans.get("MSG_BUG", lang))
+            await message.channel.send(trans.get("MSG_BUG"))
 
         # !tos
         elif startswith(prefix + "tos"):
-            await message.channel.send(trans.get("MSG_TOS", lang))
+            await message.channel.send(trans.get("MSG_TOS"))
 
 
 class NanoPlugin:
@@ -251,8 +245,9 @@ class NanoPlugin:
     version = "30"
 
     handler = Help
+    commands_only = True
     events = {
-        "on_message": 10,
+        "on_message": INDEPENDENT,
         "on_plugins_loaded": 5,
         # type : importance
     }
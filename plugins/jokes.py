@@ -17,7 +17,7 @@ from typing import Union
 from discord import Embed, Colour
 
 from core.stats import MESSAGE, IMAGE_SENT
-from core.utils import is_valid_command, is_number, log_to_file, filter_text
+from core.utils import is_number, log_to_file, filter_text, INDEPENDENT
 from core.confparser import get_config_parser, PLUGINS_DIR
 
 commands = {
@@ -110,7 +110,9 @@ class ComicImage:
 
 
 class XKCD:
-    def __init__(self, handler, loop=asyncio.get_event_loop()):
+    def __init__(self, handler, loop=None):
+        loop = loop or asyncio.get_event_loop()
+
         self.url_latest = "http://xkcd.com/info.0.json"
         self.url_number = "http://xkcd.com/{}/info.0.json"
         self.link_base = "https://xkcd.com/{}"
@@ -262,14 +264,12 @@ class Joke:
     async def on_message(self, message, **kwargs):
         trans = self.trans
 
-        prefix = kwargs.get("prefix")
-        lang = kwargs.get("lang")
+        ctx = kwargs.get("ctx")
+        prefix = ctx.prefix
+        lang = ctx.lang
 
-        # Check if this is a valid command
-        if not is_valid_command(message.content, commands, prefix):
-            return
-        else:
-            self.stats.add(MESSAGE)
+        # Only called when the router matched one of our commands (see NanoPlugin.commands_only)
+        self.stats.add(MESSAGE)
 
         def startswith(*matches):
             for match in matches:
@@ -361,6 +361,7 @@ class NanoPlugin:
     version = "10"
 
     handler = Joke
+    commands_only = True
     events = {
-        "on_message": 10
+        "on_message": INDEPENDENT
     }
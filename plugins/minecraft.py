@@ -14,7 +14,7 @@ import aiohttp
 from discord import File
 
 from core.stats import MESSAGE, WRONG_ARG, IMAGE_SENT
-from core.utils import is_valid_command, is_number
+from core.utils import is_number, INDEPENDENT
 from core.confparser import PLUGINS_DIR
 
 log = logging.getLogger(__name__)
@@ -192,14 +192,12 @@ class Minecraft:
         trans = self.trans
         mc = self.mc
 
-        prefix = kwargs.get("prefix")
-        lang = kwargs.get("lang")
+        ctx = kwargs.get("ctx")
+        prefix = ctx.prefix
+        lang = ctx.lang
 
-        # Check if this is a valid command
-        if not is_valid_command(message.content, commands, prefix):
-            return
-        else:
-            self.stats.add(MESSAGE)
+        # Only called when the router matched one of our commands (see NanoPlugin.commands_only)
+        self.stats.add(MESSAGE)
 
         def startswith(*matches):
             for match in matches:
@@ -276,7 +274,8 @@ class NanoPlugin:
     version = "14"
 
     handler = Minecraft
+    commands_only = True
     events = {
-        "on_message": 10
+        "on_message": INDEPENDENT
         # type : importance
     }
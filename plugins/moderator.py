@@ -1,13 +1,17 @@
 # coding=utf-8
+import asyncio
 import logging
 import re
+import time
+from collections import OrderedDict, deque
 from enum import IntEnum
-from pickle import load
+from typing import Union
 
-from discord import Message, Embed, TextChannel
+import numpy as np
+from discord import Message, Embed, TextChannel, HTTPException
 
 from core.stats import SUPPRESS
-from core.utils import add_dots, get_valid_commands
+from core.utils import add_dots
 from core.confparser import PLUGINS_DIR
 
 logger = logging.getLogger(__name__)
@@ -15,22 +19,48 @@ logger.setLevel(logging.DEBUG)
 
 # CONSTANTS
 
+# Compiled word filters of guilds with their own word list kept in memory
+WORD_FILTER_CACHE_SIZE = 128
+
+# Deleted messages are collected per guild for this long before they're sent to the log channel (in seconds)
+LOG_WINDOW = 3
+# Deletions waiting per guild at most, more are dropped
+LOG_BUFFER_SIZE = 50
+# Deletions per log embed (Discord allows 25 fields and 6000 characters)
+LOG_ENTRIES_PER_EMBED = 10
+
+# Repeated messages: members that haven't written anything for this long are forgotten (in seconds, see RepeatingMessageDetector)
+REPEAT_TTL = 60 * 5
+# and at most this many (guild, member) pairs are remembered
+REPEAT_MAX_ENTRIES = 100000
+
+# Raids: a message is flagged when at least RAID_MIN_USERS other members posted (nearly) the same message
+# in the same channel during the last RAID_WINDOW seconds
+RAID_WINDOW = 15
+RAID_MIN_USERS = 4
+# Fingerprints (SimHash) this many bits apart still count as the same message
+RAID_MAX_DISTANCE = 8
+# Shorter messages ("lol", "gg", ...) are never a raid
+RAID_MIN_LENGTH = 20
+# Fingerprints kept per channel and channels kept at most
+RAID_WINDOW_SIZE = 50
+RAID_MAX_CHANNELS = 10000
+
+HASH_MASK = (1 << 64) - 1
+# Stands for "no previous message", real hashes that collide with it are treated the same way
+EMPTY_HASH = HASH_MASK
+
+# Characters the gibberish model knows, in the order of its rows/columns (everything else is ignored)
 accepted_chars = "abcdefghijklmnopqrstuvwxyz "
 
+SPAM_MODEL = "spam_model.npy"
+# A message is gibberish if at least len(message) / GIBBERISH_RATIO of its character pairs are unlikely
+GIBBERISH_RATIO = 1.8
 
-def normalize(line):
-    # Ignores punctuation, new lines, etc...
-    accepted = "".join([char for char in line if char in accepted_chars])
-
-    return accepted
-
-
-def two_chars(line):
-    # Normalizes
-    norm = normalize(line)
-    # Yields two by two
-    for rn in range(0, len(norm) - 1):
-        yield norm[rn:rn + 1], norm[rn + 1:rn + 2]
+# Byte -> index in accepted_chars, -1 if ignored
+_char_table = np.full(256, -1, dtype=np.int8)
+for _index, _char in enumerate(accepted_chars):
+    _char_table[ord(_char)] = _index
 
 
 class SpamType(IntEnum):
@@ -38,11 +68,90 @@ class SpamType(IntEnum):
     GIBBERISH = 2
     CAPS = 3
     MENTIONS = 4
+    RAID = 5
+
+
+def simhash(text: str, shingle: int = 4) -> int:
+    """
+    64-bit SimHash of the character shingles of a text: similar texts get fingerprints that differ in only a few bits
+    """
+    if len(text) <= shingle:
+        shingles = [text]
+    else:
+        shingles = [text[i:i + shingle] for i in range(len(text) - shingle + 1)]
+
+    hashes = np.array([hash(a) for a in shingles], dtype=np.int64)
+    counts = np.unpackbits(hashes.view(np.uint8)).reshape(-1, 64).sum(axis=0)
+
+    # Every bit is set if it's set in the majority of shingle hashes
+    return int.from_bytes(np.packbits(counts * 2 > len(shingles)).tobytes(), "big")
+
+
+class MessageFeatures:
+    """
+    Everything the spam detectors look at, extracted from a message once (see NanoModerator.check_spam)
+    """
+    __slots__ = ("content", "length", "upper_count", "upper_ratio", "url_spans", "text", "_indexes",
+                 "mentions", "content_hash", "_fingerprint")
+
+    def __init__(self, content: str, mentions: int = 0):
+        self.content = content
+        self.length = len(content)
+
+        self.upper_count = sum(map(str.isupper, content))
+        self.upper_ratio = self.upper_count / self.length if self.length else 0
+
+        # Links are located and left out of the text in the same pass over the words
+        words = []
+        self.url_spans = []
+
+        position = 0
+        for word in content.split(" "):
+            if word.startswith(("https://", "http://")):
+                self.url_spans.append((position, position + len(word)))
+            else:
+                words.append(word)
+
+            position += len(word) + 1
+
+        # Content without links
+        self.text = " ".join(words)
+        self._indexes = None
+
+        self.mentions = mentions
+        self.content_hash = hash(content)
+        self._fingerprint = None
+
+    @property
+    def indexes(self) -> np.ndarray:
+        """
+        Characters of text as indexes into accepted_chars (everything else is left out)
+        Only computed when a detector needs them, most messages are decided before the gibberish check.
+        """
+        if self._indexes is None:
+            indexes = _char_table[np.frombuffer(self.text.encode("utf-8", errors="ignore"), dtype=np.uint8)]
+            self._indexes = indexes[indexes >= 0]
+
+        return self._indexes
+
+    @property
+    def fingerprint(self) -> int:
+        """
+        SimHash of the content (lower case, whitespace collapsed), only computed when needed
+        """
+        if self._fingerprint is None:
+            self._fingerprint = simhash(" ".join(self.content.lower().split()))
+
+        return self._fingerprint
+
+    @classmethod
+    def from_message(cls, message: Message):
+        return cls(message.content, len(message.mentions) + len(message.role_mentions))
 
 
 class ModBucket:
     """
-    A Bucket item: maintains a history of booleans. If "limit" is reached, notice(...) returns True
+    A Bucket item: maintains a history of booleans (bits of an int, used as a ring). If "limit" is reached, notice(...) returns True
     """
     __slots__ = ("threshold", "max_history", "history", "position")
 
@@ -50,136 +159,378 @@ class ModBucket:
         self.threshold = limit
         self.max_history = history
 
-        self.history = [False] * history
+        self.history = 0
         self.position = 0
 
-    def next_position(self) -> int:
-        if self.position >= self.max_history-1:
-            self.position = 0
-            return 0
-        else:
-            self.position += 1
-            return self.position
-
     def threshold_reached(self) -> bool:
-        return self.history.count(True) >= self.threshold
+        return bin(self.history).count("1") >= self.threshold
 
+    @staticmethod
+    def step(history: int, position: int, is_offense: bool, threshold: int, max_history: int) -> tuple:
+        """
+        Records an offense (or not) in a history ring, also used on packed state (see RepeatingMessageDetector)
+        :return: tuple(history, position, threshold_reached)
+        """
+        position = 0 if position >= max_history - 1 else position + 1
 
-    def notice(self, is_offense=False) -> bool:
-        pos = self.next_position()
+        if is_offense:
+            history |= 1 << position
+        else:
+            history &= ~(1 << position)
+
+        if bin(history).count("1") >= threshold:
+            # Reset history
+            return 0, position, True
 
-        self.history[pos] = is_offense
+        return history, position, False
 
-        if self.threshold_reached():
-            # Reset history and return True
-            self.history = [False] * self.max_history
-            return True
+    def notice(self, is_offense=False) -> bool:
+        self.history, self.position, reached = self.step(self.history, self.position, is_offense,
+                                                         self.threshold, self.max_history)
+        return reached
 
 
 class GibberishDetector:
     """
     Detects "gibberish" (e.g. asdasdhadasda). Uses statistical occurences of two characters one after another.
+
+    spam_model.npy is a (28, 27) array over accepted_chars: row n of the first 27 rows holds how common every
+    character is after the n-th one, the last row holds the threshold of every row. Pairs below it are unlikely.
     """
-    __slots__ = ("data", "threshold", "char_positions", "chars2", "pos2")
+    __slots__ = ("model", "unlikely", "ratio")
 
-    def __init__(self):
-        # Gibberish detector
-        with open("{}/spam_model.pki".format(PLUGINS_DIR), "rb") as spam_model:
-            spam_model = load(spam_model)
+    def __init__(self, path: str = None, ratio: float = GIBBERISH_RATIO):
+        # Memory-mapped, the file is shared between processes
+        self.model = np.load(path or "{}/{}".format(PLUGINS_DIR, SPAM_MODEL), mmap_mode="r")
+        self.ratio = ratio
 
-        self.data = spam_model["data"]
-        self.threshold = spam_model["threshold"]
-        self.char_positions = spam_model["positions"]
+        # (first, second) -> whether the pair is unlikely
+        self.unlikely = np.asarray(self.model[:-1] < self.model[-1][:, None])
 
-        # Entropy calculator
-        self.chars2 = "abcdefghijklmnopqrstuvwxyz,.-!?_;:|1234567890*=)(/&%$#\"~<> "
-        self.pos2 = dict([(c, index) for index, c in enumerate(self.chars2)])
+    @staticmethod
+    def _to_indexes(message: str) -> np.ndarray:
+        # Ignores punctuation, new lines, etc... (and everything that isn't ASCII)
+        indexes = _char_table[np.frombuffer(message.encode("utf-8", errors="ignore"), dtype=np.uint8)]
+        return indexes[indexes >= 0]
 
+    def unlikely_pairs(self, message: str, indexes: np.ndarray = None) -> int:
+        if indexes is None:
+            indexes = self._to_indexes(message)
 
-    def is_gibberish(self, message: str):
+        return int(np.count_nonzero(self.unlikely[indexes[:-1], indexes[1:]]))
+
+    def unlikely_pairs_batch(self, messages: list) -> np.ndarray:
+        """
+        Counts unlikely pairs of many messages at once, pairs spanning two messages are not counted
         """
-        Method: spam_model.pki is a pickle file with statistical occurrences of two characters one after another.
+        encoded = [m.encode("utf-8", errors="ignore") for m in messages]
 
+        indexes = _char_table[np.frombuffer(b"".join(encoded), dtype=np.uint8)]
+        owners = np.repeat(np.arange(len(encoded)), [len(e) for e in encoded])
+
+        accepted = indexes >= 0
+        indexes = indexes[accepted]
+        owners = owners[accepted]
+
+        pairs = self.unlikely[indexes[:-1], indexes[1:]] & (owners[:-1] == owners[1:])
+        return np.bincount(owners[:-1][pairs], minlength=len(messages))
+
+    def is_gibberish(self, message: str) -> bool:
+        """
         :param message: string
         :return bool
         """
         if not message:
-            return
+            return False
 
-        th = len(message) / 1.8
-        c = float(0)
-        for ca, cb in two_chars(message):
+        return self.unlikely_pairs(message) >= len(message) / self.ratio
 
-            if self.data[self.char_positions[ca]][self.char_positions[cb]] < self.threshold[self.char_positions[ca]]:
-                c += 1
+    def check(self, features: MessageFeatures) -> bool:
+        # Same as is_gibberish(features.text), but with the indexes that were already extracted
+        if not features.text:
+            return False
 
-        return bool(c >= th)
+        return self.unlikely_pairs(features.text, features.indexes) >= len(features.text) / self.ratio
 
+    def is_gibberish_batch(self, messages: list) -> np.ndarray:
+        """
+        is_gibberish for a list of messages, returns an array of bools
+        """
+        if not messages:
+            return np.zeros(0, dtype=bool)
 
-class SwearingDetector:
+        lengths = np.fromiter((len(m) for m in messages), dtype=np.float64, count=len(messages))
+        return (self.unlikely_pairs_batch(messages) >= lengths / self.ratio) & (lengths > 0)
+
+
+# Leetspeak -> letter, applied to messages before matching so every combination is covered (e.g. @$$ and 4s$)
+LEETSPEAK = str.maketrans({
+    "4": "a",
+    "@": "a",
+    "$": "s",
+    "0": "o",
+})
+
+
+class WordMatcher:
     """
-    Detects blocked words from banned_words.txt. Makes some "permutations" to all words so detection quality is higher.
+    Aho-Corasick automaton over a word list: finds any of the words in one pass over the message.
+    Words only match as a whole (not as a part of a longer word), but may contain spaces ("blow job").
     """
-    __slots__ = ("permutations", "word_list")
+    __slots__ = ("goto", "fail", "outputs", "size")
+
+    def __init__(self, words):
+        # State 0 is the root, goto[state] maps a character to the next state
+        goto = [{}]
+        # Lengths of the words that end in a state
+        outputs = [()]
+
+        for word in words:
+            word = word.strip(" ").lower().translate(LEETSPEAK)
+            if not word:
+                continue
+
+            state = 0
+            for char in word:
+                nxt = goto[state].get(char)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][char] = nxt
+                    goto.append({})
+                    outputs.append(())
+
+                state = nxt
+
+            if len(word) not in outputs[state]:
+                outputs[state] += (len(word),)
+
+        # Failure links (breadth-first), a state also outputs what its failure state outputs
+        fail = [0] * len(goto)
+        queue = list(goto[0].values())
+        for state in queue:
+            for char, nxt in goto[state].items():
+                queue.append(nxt)
+
+                f = fail[state]
+                while f and char not in goto[f]:
+                    f = fail[f]
+
+                fail[nxt] = goto[f].get(char, 0)
+                outputs[nxt] += outputs[fail[nxt]]
+
+        self.goto = goto
+        self.fail = fail
+        self.outputs = outputs
+        self.size = len(goto)
+
+    def search(self, message: str) -> Union[str, None]:
+        """
+        Returns the first blocked word found (with leetspeak replaced) or None
 
-    def __init__(self):
-        self.permutations = [
-            dict(a="4"),
-            dict(s="$"),
-            dict(o="0"),
-            dict(a="@"),
-        ]
+        :param message: lower-case message content
+        """
+        message = message.translate(LEETSPEAK)
+        goto = self.goto
+        fail = self.fail
+        outputs = self.outputs
 
-        with open("{}/banned_words.txt".format(PLUGINS_DIR)) as banned:
-            self.word_list = [line.strip("\n") for line in banned.readlines()]
+        length = len(message)
+        state = 0
+
+        for index, char in enumerate(message):
+            while state and char not in goto[state]:
+                state = fail[state]
+
+            state = goto[state].get(char, 0)
+            if not outputs[state]:
+                continue
+
+            # Word boundaries: the characters around the match must not be letters or digits
+            end = index + 1
+            if end < length and message[end].isalnum():
+                continue
 
-        # Builds a more sophisticated list
-        before = len(self.word_list)
-        for word in self.word_list:
-            initial = str(word)
+            for word_length in outputs[state]:
+                start = end - word_length
+                if start == 0 or not message[start - 1].isalnum():
+                    return message[start:end]
 
-            for perm in self.permutations:
-                (k, v), = perm.items()
-                changed = initial.replace(k, v)
-                if initial != changed:
-                    self.word_list.append(changed)
+        return None
 
-        logger.info("Processed word list: added {} entries ({} total)".format(len(self.word_list) - before, len(self.word_list)))
+
+class SwearingDetector:
+    """
+    Detects blocked words from banned_words.txt. Leetspeak (see LEETSPEAK) is handled as well so detection quality is higher.
+    """
+    __slots__ = ("word_list", "matcher")
+
+    def __init__(self):
+        with open("{}/banned_words.txt".format(PLUGINS_DIR)) as banned:
+            self.word_list = [line.strip("\n") for line in banned.readlines() if line.strip("\n")]
+
+        self.matcher = WordMatcher(self.word_list)
+        logger.info("Compiled word list: {} words ({} states)".format(len(self.word_list), self.matcher.size))
 
     def has_swearing(self, message: str) -> bool:
         """
         Returns True if there is a banned word
 
-        :param message: Discord Message content
+        :param message: Discord Message content (lower case)
         """
-        res = [a for a in self.word_list if a in message.split(" ")]
-        return bool(res)
+        return self.matcher.search(message) is not None
+
+
+class WordFilterCache:
+    """
+    LRU cache of compiled word filters (banned_words.txt + the guild's own words) for guilds with their own word list
+    An entry is used as long as its version is not older than the guild's word list version (see GuildContext).
+    """
+    __slots__ = ("_matchers", "max_size", "hits", "misses")
+
+    def __init__(self, max_size: int = WORD_FILTER_CACHE_SIZE):
+        # guild_id -> (version, WordMatcher)
+        self._matchers = OrderedDict()
+        self.max_size = max_size
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, guild_id: int, version: int) -> Union[WordMatcher, None]:
+        entry = self._matchers.get(guild_id)
+
+        # Versions come from a global counter, a newer one is never stale
+        if entry is None or entry[0] < version:
+            self.misses += 1
+            return None
+
+        self._matchers.move_to_end(guild_id)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, guild_id: int, version: int, matcher: WordMatcher):
+        self._matchers[guild_id] = (version, matcher)
+        self._matchers.move_to_end(guild_id)
+
+        if len(self._matchers) > self.max_size:
+            self._matchers.popitem(last=False)
 
 
 class RepeatingMessageDetector:
-    __slots__ = ("user_buckets", "last_from_user")
+    """
+    Remembers what every (guild, member) pair last wrote, packed into one int per pair:
+    the low 64 bits hold a hash of the message, the rest the ModBucket ring of repeats (history, then position).
 
-    def __init__(self):
-        self.last_from_user = {}
-        self.user_buckets = {}
+    Pairs are kept in two generations: the current one and the previous one. The generations are rotated every
+    ttl / 2 seconds, or once the current one holds max_entries / 2 pairs, and the previous one is dropped then.
+    Members that were active since the last rotation move into the current generation.
+    """
+    __slots__ = ("current", "previous", "rotated", "ttl", "max_entries", "limit", "history")
 
-    def is_repeating(self, user_id: int, message: str):
-        # Get bucket
-        bucket = self.user_buckets.get(user_id)
-        if not bucket:
-            bucket = ModBucket()
-            self.user_buckets[user_id] = bucket
+    def __init__(self, ttl: int = REPEAT_TTL, max_entries: int = REPEAT_MAX_ENTRIES, limit: int = 2, history: int = 3):
+        # (guild_id << 64 | user_id) -> packed state
+        self.current = {}
+        self.previous = {}
+        self.rotated = time.monotonic()
 
-        # See if message repeats
-        last = self.last_from_user.get(user_id)
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        # ModBucket parameters
+        self.limit = limit
+        self.history = history
+
+    def __len__(self):
+        return len(self.current) + len(self.previous)
+
+    def _rotate(self, now: float):
+        if now - self.rotated >= self.ttl / 2 or len(self.current) >= self.max_entries / 2:
+            self.previous = self.current
+            self.current = {}
+            self.rotated = now
+
+    def is_repeating(self, guild_id: int, user_id: int, features: MessageFeatures) -> bool:
+        self._rotate(time.monotonic())
+
+        key = guild_id << 64 | user_id
+
+        state = self.current.get(key)
+        if state is None:
+            state = self.previous.pop(key, None)
+
+        # Empty messages (attachments only, ...) don't count as a previous message
+        content_hash = features.content_hash & HASH_MASK if features.content else EMPTY_HASH
 
-        self.last_from_user[user_id] = message
         # If first message
-        if not last:
+        if state is None:
+            self.current[key] = content_hash
+            return False
+
+        last = state & HASH_MASK
+        ring = state >> 64
+
+        if last == EMPTY_HASH:
+            self.current[key] = ring << 64 | content_hash
+            return False
+
+        # See if message repeats
+        history, position, reached = ModBucket.step(ring & ((1 << self.history) - 1), ring >> self.history,
+                                                    content_hash == last, self.limit, self.history)
+
+        self.current[key] = (position << self.history | history) << 64 | content_hash
+        return reached
+
+
+class RaidDetector:
+    """
+    Flags messages that (nearly) match messages other members posted in the same channel a moment ago.
+    Every channel keeps the fingerprints of its last window_size messages (see simhash), so a message is compared
+    to at most window_size others. Channels that weren't written in for the longest are dropped first.
+    """
+    __slots__ = ("channels", "window", "window_size", "min_users", "max_distance", "max_channels")
+
+    def __init__(self, window: int = RAID_WINDOW, window_size: int = RAID_WINDOW_SIZE, min_users: int = RAID_MIN_USERS,
+                 max_distance: int = RAID_MAX_DISTANCE, max_channels: int = RAID_MAX_CHANNELS):
+        # channel_id -> deque of (time, fingerprint, user_id)
+        self.channels = OrderedDict()
+
+        self.window = window
+        self.window_size = window_size
+        self.min_users = min_users
+        self.max_distance = max_distance
+        self.max_channels = max_channels
+
+    def is_raid(self, channel_id: int, user_id: int, features: MessageFeatures) -> bool:
+        if features.length < RAID_MIN_LENGTH:
             return False
 
-        return bucket.notice(message == last)
+        now = time.monotonic()
+        fingerprint = features.fingerprint
+
+        recent = self.channels.get(channel_id)
+        if recent is None:
+            recent = deque(maxlen=self.window_size)
+            self.channels[channel_id] = recent
+
+            if len(self.channels) > self.max_channels:
+                self.channels.popitem(last=False)
+        else:
+            self.channels.move_to_end(channel_id)
 
+            # Forget messages that left the window
+            while recent and now - recent[0][0] > self.window:
+                recent.popleft()
+
+        # Newest first, stops as soon as enough members match (most of the window does during a raid)
+        users = set()
+        for _, other, other_user in reversed(recent):
+            if other_user != user_id and bin(fingerprint ^ other).count("1") <= self.max_distance:
+                users.add(other_user)
+
+                if len(users) >= self.min_users:
+                    break
+
+        recent.append((now, fingerprint, user_id))
+        return len(users) >= self.min_users
 
 
 class NanoModerator:
@@ -187,35 +538,51 @@ class NanoModerator:
         self.gib_detect = GibberishDetector()
         self.swearing_detect = SwearingDetector()
         self.repeating_detect = RepeatingMessageDetector()
+        self.raid_detect = RaidDetector()
 
         self.invite_regex = re.compile(r'(http(s)?://)?discord.gg/\w+')
 
 
-    def check_swearing(self, message: str) -> bool:
+    def check_swearing(self, message: str, matcher: WordMatcher = None) -> bool:
         """
         Checks whether a message includes words that are not allowed.
 
         :param message: str
+        :param matcher: the guild's own word filter (see Moderator.get_word_filter), defaults to banned_words.txt
         :return: bool
         """
-        return self.swearing_detect.has_swearing(message.lower())
+        if matcher is None:
+            return self.swearing_detect.has_swearing(message.lower())
 
+        return matcher.search(message.lower()) is not None
 
-    def check_spam(self, author_id: int, message: str, raw_message):
+
+    def check_spam(self, message: Message, features: MessageFeatures = None):
         """
         Does a set of checks to know whether something is spam or not.
 
-        :param author_id: int
-        :param message: str
-        :return: bool
+        :param message: Message
+        :param features: MessageFeatures of the message, extracted if not given
+        :return: SpamType or False
         """
         # NOTE: If any of the detectors returns a positive result, the message is deleted
+        if features is None:
+            features = MessageFeatures.from_message(message)
+
+        #########
+        # Same message from many members (raids)
+        #########
+
+        # Checked first so every message ends up in the channel's window
+        if self.raid_detect.is_raid(message.channel.id, message.author.id, features):
+            return SpamType.RAID
+
 
         #########
         # Repeating sentence detection
         #########
 
-        is_repeating = self.repeating_detect.is_repeating(author_id, message)
+        is_repeating = self.repeating_detect.is_repeating(message.guild.id, message.author.id, features)
         if is_repeating is True:
             return SpamType.REPEATED
 
@@ -223,10 +590,7 @@ class NanoModerator:
         #########
         # Usage of caps
         #########
-        caps_threshold = len(message) * 0.45
-
-        up_count = sum([1 for c in message if c.isupper()])
-        if len(message) > 5 and up_count > caps_threshold:
+        if features.length > 5 and features.upper_count > features.length * 0.45:
             return SpamType.CAPS
 
 
@@ -234,7 +598,7 @@ class NanoModerator:
         # Mention spam
         #########
         mention_limit = 5
-        if sum([len(raw_message.mentions), len(raw_message.role_mentions)]) > mention_limit:
+        if features.mentions > mention_limit:
             return SpamType.MENTIONS
 
 
@@ -242,15 +606,11 @@ class NanoModerator:
         # Gibberish detection
         #########
 
-        # Should exclude links
-        message = " ".join([word for word in message.split(" ") if
-                            (not word.startswith("https://")) and (not word.startswith("http://"))])
-
-        # Should always ignore short sentences
-        if len(message) < 10:
+        # Should always ignore short sentences (links excluded)
+        if len(features.text) < 10:
             return False
 
-        if self.gib_detect.is_gibberish(message):
+        if self.gib_detect.check(features):
             return SpamType.GIBBERISH
 
         return False
@@ -266,7 +626,22 @@ class NanoModerator:
         return bool(res) if res else False
 
 
+class LogEntry:
+    __slots__ = ("reason", "author", "avatar_url", "content", "channel")
+
+    def __init__(self, message: Message, reason: str):
+        self.reason = reason
+        self.author = "{} ({})".format(message.author.name, message.author.id)
+        self.avatar_url = message.author.avatar_url
+        self.content = message.content
+        self.channel = message.channel.mention
+
+
 class LogManager:
+    """
+    Collects deleted messages per guild and sends them to its log channel in the background (see run_sender),
+    a spam wave ends up as a few multi-entry embeds instead of one API call per message
+    """
     def __init__(self, client, nano, loop, handler, trans):
         self.client = client
         self.nano = nano
@@ -277,30 +652,136 @@ class LogManager:
         self.getter = None
         self.running = True
 
+        # guild_id -> (guild, lang, [LogEntry, ...])
+        self.buffers = {}
+        self.wake = asyncio.Event()
+
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+
     async def resolve_plugin(self):
         self.getter = self.nano.get_plugin("server").instance
 
-    async def send_log(self, message: Message, lang, reason=""):
-        if not self.getter:
-            self.loop.call_later(5, self.send_log(message, lang, reason))
-            logger.warning("Getter is not set, calling in 5 seconds...")
+    def send_log(self, message: Message, lang, reason=""):
+        """
+        Queues a deleted message for the log channel, never waits on Discord
+        """
+        buffer = self.buffers.get(message.guild.id)
+        if buffer is None:
+            buffer = (message.guild, lang, [])
+            self.buffers[message.guild.id] = buffer
+
+        entries = buffer[2]
+        if len(entries) >= LOG_BUFFER_SIZE:
+            self.dropped += 1
             return
 
-        log_channel = await self.getter.handle_log_channel(message.guild)
+        entries.append(LogEntry(message, reason))
+        self.wake.set()
+
+    def get_stats(self) -> dict:
+        return {
+            "pending": sum(len(entries) for _, _, entries in self.buffers.values()),
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+        }
+
+    def make_embeds(self, lang, entries: list) -> list:
+        trans = self.trans.for_lang(lang)
+
+        if len(entries) == 1:
+            entry = entries[0]
+
+            embed = Embed(title=trans.format("MSG_MOD_MSG_DELETED", entry.reason), description=add_dots(entry.content))
+            embed.set_author(name=entry.author, icon_url=entry.avatar_url)
+            embed.add_field(name=trans.get("INFO_CHANNEL"), value=entry.channel)
+            return [embed]
 
+        embeds = []
+        title = trans.format("MSG_MOD_MSGS_DELETED", len(entries))
+
+        for i in range(0, len(entries), LOG_ENTRIES_PER_EMBED):
+            embed = Embed(title=title)
+
+            for entry in entries[i:i + LOG_ENTRIES_PER_EMBED]:
+                embed.add_field(name="{} - {}".format(entry.reason, entry.author),
+                                value="{}: {}".format(entry.channel, add_dots(entry.content)),
+                                inline=False)
+
+            embeds.append(embed)
+
+        return embeds
+
+    async def _send_guild(self, guild, lang, entries: list):
+        log_channel = await self.getter.handle_log_channel(guild)
         if not log_channel:
             return
 
-        author = message.author
+        embeds = self.make_embeds(lang, entries)
+
+        logger.debug("Sending {} logs for {}".format(len(entries), guild.name))
+        for index, embed in enumerate(embeds):
+            try:
+                await log_channel.send(embed=embed)
+            except HTTPException as e:
+                # Missing permissions, deleted channel, ...: don't retry
+                unsent = entries[index * LOG_ENTRIES_PER_EMBED:]
+                self.dropped += len(unsent)
+                logger.warning("Could not send logs for {}: {}".format(guild.id, e))
+                return
+
+            self.sent += 1
 
-        embed_title = self.trans.get("MSG_MOD_MSG_DELETED", lang).format(reason)
+        self.coalesced += len(entries) - len(embeds)
 
-        embed = Embed(title=embed_title, description=add_dots(message.content))
-        embed.set_author(name="{} ({})".format(author.name, author.id), icon_url=author.avatar_url)
-        embed.add_field(name=self.trans.get("INFO_CHANNEL", lang), value=message.channel.mention)
+    async def flush(self):
+        """
+        Sends everything that was collected so far (guilds in parallel)
+        """
+        if not self.buffers or not self.getter:
+            return
 
-        logger.debug("Sending logs for {}".format(message.guild.name))
-        await log_channel.send(embed=embed)
+        buffers = list(self.buffers.values())
+        self.buffers = {}
+
+        results = await asyncio.gather(*[self._send_guild(guild, lang, entries) for guild, lang, entries in buffers],
+                                       return_exceptions=True)
+
+        # HTTP errors are handled (and counted) by _send_guild, anything else ends up here
+        for (guild, _, entries), result in zip(buffers, results):
+            if isinstance(result, Exception):
+                self.dropped += len(entries)
+                logger.error("Could not send logs for {}: {!r}".format(guild.id, result))
+
+    def drop_pending(self):
+        self.dropped += sum(len(entries) for _, _, entries in self.buffers.values())
+        self.buffers = {}
+
+    async def stop(self):
+        """
+        Stops the sender and sends what's still waiting, must be called before the client logs out
+        """
+        self.running = False
+        # Let run_sender exit
+        self.wake.set()
+
+        await self.flush()
+
+    async def run_sender(self):
+        while self.running:
+            await self.wake.wait()
+
+            # Let the rest of the wave come in first
+            await asyncio.sleep(LOG_WINDOW)
+            self.wake.clear()
+
+            if not self.getter:
+                logger.warning("Getter is not set, sending logs later...")
+                continue
+
+            await self.flush()
 
 
 class Moderator:
@@ -315,65 +796,78 @@ class Moderator:
         self.checker = NanoModerator()
         self.log = LogManager(self.client, self.nano, self.loop, self.handler, self.trans)
 
-        self.valid_commands = set()
+        self.word_filters = WordFilterCache()
 
-    async def on_plugins_loaded(self):
-        # Collect all valid commands
-        plugins = [a.plugin for a in self.nano.plugins.values() if a.plugin]
+    async def get_word_filter(self, ctx) -> Union[WordMatcher, None]:
+        """
+        Returns the compiled word filter of a guild with its own word list, None if it only uses the default one
+        """
+        if not ctx.word_list_version:
+            return None
+
+        matcher = self.word_filters.get(ctx.guild_id, ctx.word_list_version)
+        if matcher is None:
+            version, words = await self.handler.aio.get_word_list(ctx.guild_id)
+            if not version:
+                return None
 
-        temp = []
-        for pl in plugins:
-            commands = get_valid_commands(pl)
-            if commands is not None:
-                # Joins two lists
-                temp += commands
+            matcher = WordMatcher(self.checker.swearing_detect.word_list + words)
+            self.word_filters.put(ctx.guild_id, version, matcher)
 
-        self.valid_commands = set(temp)
+            logger.debug("Compiled the word filter for {} ({} words)".format(ctx.guild_id, len(words)))
 
+        return matcher
+
+    async def on_plugins_loaded(self):
         await self.log.resolve_plugin()
+        self.loop.create_task(self.log.run_sender())
+
+    async def on_shutdown(self):
+        # Logs are normally sent by nano.restart/nano.kill before logging out (see LogManager.stop)
+        if self.client.is_closed():
+            if self.log.buffers:
+                logger.warning("Client is closed, dropping moderation logs that are still waiting")
+            self.log.drop_pending()
+        else:
+            await self.log.stop()
 
     async def on_message(self, message, **kwargs):
         handler = self.handler
 
-        prefix = kwargs.get("prefix")
-        lang = kwargs.get("lang")
+        ctx = kwargs.get("ctx")
+        prefix = ctx.prefix
+        lang = ctx.lang
 
         if not isinstance(message.channel, TextChannel):
             return "return"
 
         # Muting
-        if handler.is_muted(message.guild, message.author.id):
+        if ctx.muted:
             await message.delete()
 
             self.stats.add(SUPPRESS)
             return "return"
 
         # Channel blacklisting
-        if handler.is_blacklisted(message.guild.id, message.channel.id):
+        if ctx.blacklisted:
             return "return"
 
         # Ignore the filter if user is executing a command
-        if message.content.startswith(prefix):
-            np_text = message.content[len(prefix):]
-        else:
-            np_text = message.content
-
-        np_text = "_" + np_text.split(" ", maxsplit=1)[0]
-        if np_text in self.valid_commands:
+        if kwargs.get("route") is not None:
             return
 
         # Spam, swearing and invite filter
-        needs_spam_filter = handler.has_spam_filter(message.guild)
-        needs_swearing_filter = handler.has_word_filter(message.guild)
-        needs_invite_filter = handler.has_invite_filter(message.guild)
+        needs_spam_filter = ctx.spam_filter
+        needs_swearing_filter = ctx.word_filter
+        needs_invite_filter = ctx.invite_filter
 
         if needs_spam_filter:
-            spam_reason = self.checker.check_spam(message.author.id, message.content, message)
+            spam_reason = self.checker.check_spam(message)
         else:
             spam_reason = False
 
         if needs_swearing_filter:
-            swearing = self.checker.check_swearing(message.content)
+            swearing = self.checker.check_swearing(message.content, await self.get_word_filter(ctx))
         else:
             swearing = False
 
@@ -395,29 +889,32 @@ class Moderator:
             logger.debug("Message filtered")
 
             # Check if current channel is the logging channel
-            log_channel_name = self.handler.get_log_channel(message.guild)
+            log_channel_name = await self.handler.aio.get_log_channel(message.guild)
             if log_channel_name == message.channel.name:
                 return
 
             # Make correct messages
+            trans = self.trans.for_lang(lang)
             if spam_reason:
                 if spam_reason == SpamType.GIBBERISH:
-                    await self.log.send_log(message, lang, self.trans.get("MSG_MOD_SPAM_G", lang))
+                    self.log.send_log(message, lang, trans.get("MSG_MOD_SPAM_G"))
                 elif spam_reason == SpamType.CAPS:
-                    await self.log.send_log(message, lang, self.trans.get("MSG_MOD_SPAM_C", lang))
+                    self.log.send_log(message, lang, trans.get("MSG_MOD_SPAM_C"))
                 elif spam_reason == SpamType.REPEATED:
-                    await self.log.send_log(message, lang, self.trans.get("MSG_MOD_SPAM_R", lang))
+                    self.log.send_log(message, lang, trans.get("MSG_MOD_SPAM_R"))
                 elif spam_reason == SpamType.MENTIONS:
-                    await self.log.send_log(message, lang, self.trans.get("MSG_MOD_SPAM_M", lang))
+                    self.log.send_log(message, lang, trans.get("MSG_MOD_SPAM_M"))
+                elif spam_reason == SpamType.RAID:
+                    self.log.send_log(message, lang, trans.get("MSG_MOD_SPAM_RAID"))
 
                 else:
                     raise NotImplementedError("This offense type is not implemented.")
 
             elif swearing:
-                await self.log.send_log(message, lang, self.trans.get("MSG_MOD_SWEARING", lang))
+                self.log.send_log(message, lang, trans.get("MSG_MOD_SWEARING"))
 
             elif invite:
-                await self.log.send_log(message, lang, self.trans.get("MSG_MOD_INVITE", lang))
+                self.log.send_log(message, lang, trans.get("MSG_MOD_INVITE"))
 
             else:
                 # Lol wat
@@ -428,11 +925,12 @@ class Moderator:
 
 class NanoPlugin:
     name = "Moderator"
-    version = "31"
+    version = "32"
 
     handler = Moderator
     events = {
         "on_plugins_loaded": 5,
-        "on_message": 6
+        "on_message": 6,
+        "on_shutdown": 3,
         # type : importance
     }
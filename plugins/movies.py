@@ -9,7 +9,7 @@ from discord import errors
 from typing import Union
 
 from core.stats import MESSAGE
-from core.utils import is_valid_command, IgnoredException, filter_text
+from core.utils import IgnoredException, filter_text, INDEPENDENT
 from core.confparser import get_config_parser
 
 log = logging.getLogger(__name__)
@@ -160,14 +160,12 @@ class TMDb:
     async def on_message(self, message, **kwargs):
         trans = self.trans
 
-        prefix = kwargs.get("prefix")
-        lang = kwargs.get("lang")
+        ctx = kwargs.get("ctx")
+        prefix = ctx.prefix
+        lang = ctx.lang
 
-        # Check if this is a valid command
-        if not is_valid_command(message.content, commands, prefix):
-            return
-        else:
-            self.stats.add(MESSAGE)
+        # Only called when the router matched one of our commands (see NanoPlugin.commands_only)
+        self.stats.add(MESSAGE)
 
         def startswith(*matches):
             for match in matches:
@@ -310,7 +308,8 @@ class NanoPlugin:
     version = "19"
 
     handler = TMDb
+    commands_only = True
     events = {
-        "on_message": 10
+        "on_message": INDEPENDENT
         # type : importance
     }
@@ -4,17 +4,20 @@ import time
 
 from discord import TextChannel
 
-from core.stats import SLEPT
-from core.confparser import get_config_parser
-from core.utils import get_valid_commands
+from core.stats import SLEPT, SEEN
+from core.confparser import get_config_parser, get_settings_parser
 
 log = logging.getLogger(__name__)
 log.setLevel(logging.INFO)
 
 parser = get_config_parser()
+settings = get_settings_parser()
 
 DEFAULT_PREFIX = parser.get("Servers", "defaultprefix")
 
+# Fetch settings of guilds that were cached before the last shutdown
+CACHE_WARMUP = settings.getboolean("Cache", "warmup", fallback=True)
+
 # Prefix getter plugin
 
 commands = {
@@ -57,26 +60,31 @@ class Bucket:
 class Observer:
     def __init__(self, *_, **kwargs):
         self.client = kwargs.get("client")
+        self.loop = kwargs.get("loop")
         self.handler = kwargs.get("handler")
         self.stats = kwargs.get("stats")
         self.trans = kwargs.get("trans")
         self.nano = kwargs.get("nano")
 
         self.buckets = {}
-        self.valid_commands = set()
 
-    async def on_plugins_loaded(self):
-        # Collect all valid commands
-        plugins = [a.plugin for a in self.nano.plugins.values() if hasattr(a, "plugin")]
+    async def on_ready(self):
+        aio = self.handler.aio
+
+        # Cross-process invalidation of the guild settings cache
+        if await aio.enable_keyspace_events():
+            self.loop.create_task(aio.listen_for_invalidations())
+
+        if CACHE_WARMUP:
+            started = time.monotonic()
 
-        temp = []
-        for pl in plugins:
-            cmds = get_valid_commands(pl)
-            if cmds is not None:
-                # Joins two lists
-                temp += cmds
+            guilds = [g for g in await aio.get_warmup_guilds() if self.client.get_guild(g)]
+            amount = await aio.warm_up_cache(guilds)
 
-        self.valid_commands = set(temp)
+            log.info("Warmed up settings cache for {} guilds in {}s".format(amount, round(time.monotonic() - started, 3)))
+
+    async def on_shutdown(self):
+        await self.handler.aio.save_warmup_guilds()
 
     async def on_message(self, message, **_):
         trans = self.trans
@@ -91,26 +99,28 @@ class Observer:
         if message.author.bot:
             return "return"
 
-        # Add prefix to kwargs for future plugins
-        pref = self.handler.get_prefix(message.guild)
-        if pref is None:
-            pref = str(DEFAULT_PREFIX)
+        self.stats.add(SEEN)
+
+        # Everything later plugins need about this guild, in one round trip
+        ctx = await self.handler.aio.get_guild_context(message)
+
+        if ctx.prefix is None:
+            ctx.prefix = str(DEFAULT_PREFIX)
         else:
-            pref = str(pref)
+            ctx.prefix = str(ctx.prefix)
 
         # Parse language
-        lang = self.handler.get_lang(message.guild.id)
-        if not lang:
-            lang = str(self.trans.default_lang)
+        if not ctx.lang:
+            ctx.lang = str(self.trans.default_lang)
 
-        # Ignore the filter if user is not executing a command
-        if message.content.startswith(pref):
-            np_text = message.content[len(pref):]
-        else:
-            np_text = message.content
+        pref = ctx.prefix
+        lang = ctx.lang
+
+        # Resolved once for all plugins
+        route = self.nano.router.resolve(message.content, pref)
 
-        np_text = "_" + np_text.split(" ", maxsplit=1)[0]
-        if np_text in self.valid_commands:
+        # Ignore the filter if user is not executing a command
+        if route is not None:
             # Check rate-limits
             # If user was silent until now, create a new bucket
             if message.author.id not in self.buckets.keys():
@@ -131,8 +141,8 @@ class Observer:
 
 
         # Set up the server if it is not present in redis db
-        if not self.handler.server_exists(message.guild.id):
-            await self.handler.server_setup(message.guild)
+        if not ctx.exists:
+            await self.handler.aio.server_setup(message.guild)
 
         # Ah, the shortcuts
         def startswith(*matches):
@@ -149,7 +159,7 @@ class Observer:
                 await message.channel.send(trans.get("PERM_ADMIN", lang))
                 return "return"
 
-            self.handler.set_sleeping(message.guild, True)
+            await self.handler.aio.set_sleeping(message.guild, True)
             await message.channel.send(self.trans.get("MSG_NANO_SLEEP", lang))
             return "return"
 
@@ -159,28 +169,28 @@ class Observer:
                 await message.channel.send(trans.get("PERM_ADMIN", lang))
                 return "return"
 
-            if not self.handler.is_sleeping(message.guild.id):
+            if not ctx.sleeping:
                 await message.channel.send(trans.get("MSG_NANO_WASNT_SLEEPING", lang))
                 return "return"
 
-            self.handler.set_sleeping(message.guild, False)
+            await self.handler.aio.set_sleeping(message.guild, False)
             await message.channel.send(self.trans.get("MSG_NANO_WAKE", lang))
 
             self.stats.add(SLEPT)
             return "return"
 
         # Quit if the bot is sleeping
-        if self.handler.is_sleeping(message.guild.id):
+        if ctx.sleeping:
             return "return"
 
-        return "add_var", dict(prefix=pref, lang=lang)
+        return "add_var", dict(ctx=ctx, route=route)
 
     async def on_member_join(self, member, **_):
         # Quit if the bot is sleeping
-        if self.handler.is_sleeping(member.guild.id):
+        if await self.handler.aio.is_sleeping(member.guild.id):
             return "return"
 
-        lang = self.handler.get_lang(member.guild.id)
+        lang = await self.handler.aio.get_lang(member.guild.id)
         if not lang:
             lang = str(self.trans.default_lang)
 
@@ -188,10 +198,10 @@ class Observer:
 
     async def on_member_ban(self, guild, _, **__):
         # Quit if the bot is sleeping
-        if self.handler.is_sleeping(guild.id):
+        if await self.handler.aio.is_sleeping(guild.id):
             return "return"
 
-        lang = self.handler.get_lang(guild.id)
+        lang = await self.handler.aio.get_lang(guild.id)
         if not lang:
             lang = str(self.trans.default_lang)
 
@@ -199,10 +209,10 @@ class Observer:
 
     async def on_member_remove(self, member, **_):
         # Quit if the bot is sleeping
-        if self.handler.is_sleeping(member.guild.id):
+        if await self.handler.aio.is_sleeping(member.guild.id):
             return "return"
 
-        lang = self.handler.get_lang(member.guild.id)
+        lang = await self.handler.aio.get_lang(member.guild.id)
         if not lang:
             lang = str(self.trans.default_lang)
 
@@ -218,7 +228,7 @@ class Observer:
         if not isinstance(reaction.message.channel, TextChannel):
             return "return"
 
-        lang = self.handler.get_lang(user.guild.id)
+        lang = await self.handler.aio.get_lang(user.guild.id)
         if not lang:
             lang = str(self.trans.default_lang)
 
@@ -234,7 +244,8 @@ class NanoPlugin:
     handler = Observer
     events = {
         "on_message": 4,
-        "on_plugins_loaded": 4,
+        "on_ready": 4,
+        "on_shutdown": 4,
         "on_member_join": 5,
         "on_member_ban": 5,
         "on_member_remove": 5,
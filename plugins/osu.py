@@ -7,7 +7,7 @@ import osu_ds
 from discord import Embed, Colour, errors
 
 from core.stats import MESSAGE
-from core.utils import is_valid_command, invert_num, invert_str, split_every
+from core.utils import invert_num, invert_str, split_every, INDEPENDENT
 from core.confparser import get_config_parser
 
 #####
@@ -52,14 +52,12 @@ class Osu:
     async def on_message(self, message, **kwargs):
         trans = self.trans
 
-        prefix = kwargs.get("prefix")
-        lang = kwargs.get("lang")
+        ctx = kwargs.get("ctx")
+        prefix = ctx.prefix
+        lang = ctx.lang
 
-        # Check if this is a valid command
-        if not is_valid_command(message.content, commands, prefix):
-            return
-        else:
-            self.stats.add(MESSAGE)
+        # Only called when the router matched one of our commands (see NanoPlugin.commands_only)
+        self.stats.add(MESSAGE)
 
         def startswith(*matches):
             for match in matches:
@@ -151,7 +149,8 @@ class NanoPlugin:
     version = "9"
 
     handler = Osu
+    commands_only = True
     events = {
-        "on_message": 10
+        "on_message": INDEPENDENT
         # type : importance
     }
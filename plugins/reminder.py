@@ -8,7 +8,7 @@ from typing import Union
 from discord import DiscordException
 
 from core.stats import MESSAGE, WRONG_ARG
-from core.utils import resolve_time, convert_to_seconds, is_valid_command, gen_id, IgnoredException, log_to_file, filter_text
+from core.utils import resolve_time, convert_to_seconds, gen_id, IgnoredException, log_to_file, filter_text, INDEPENDENT
 
 log = logging.getLogger(__name__)
 log.setLevel(logging.INFO)
@@ -56,13 +56,16 @@ class RedisReminderHandler:
                             raw: raw content
 
     """
-    def __init__(self, client, handler, trans, loop=asyncio.get_event_loop()):
+    def __init__(self, client, handler, trans, loop=asyncio.get_event_loop(), leader=None):
         self.redis = handler.get_plugin_data_manager(namespace="reminder")
 
         self.loop = loop
         self.client = client
         self.trans = trans
 
+        # In cluster mode only the leader dispatches reminders
+        self.leader = leader
+
     def get_reminder_amount(self):
         return len(self.get_all_reminders())
 
@@ -186,9 +189,14 @@ class RedisReminderHandler:
             log.info("Dispatching channel reminder by {}".format(rem["receiver"]))
 
             guild = self.client.get_guild(int(rem["server"]))
-            channel = guild.get_channel(int(rem["receiver"]))
-
             content = self._prepare_channel(rem["raw"], rem["lang"])
+
+            # The guild can belong to a different cluster worker, but the REST API works for any channel
+            if guild is None:
+                await self.client.http.send_message(int(rem["receiver"]), content)
+                return
+
+            channel = guild.get_channel(int(rem["receiver"]))
             await channel.send(content)
 
         # Private reminder.
@@ -196,6 +204,11 @@ class RedisReminderHandler:
             log.info("Dispatching personal reminder by {}".format(rem["receiver"]))
 
             user = self.client.get_user(int(rem["receiver"]))
+            if not user:
+                try:
+                    user = await self.client.fetch_user(int(rem["receiver"]))
+                except DiscordException:
+                    user = None
 
             if not user:
                 log.info("User missing, ignoring...")
@@ -210,6 +223,10 @@ class RedisReminderHandler:
         last_time = time.time()
 
         while True:
+            if self.leader and not self.leader.is_leader:
+                last_time = await self.tick(last_time)
+                continue
+
             # Iterate through users and their reminders
             a = self.get_all_reminders()
             for user in a:
@@ -217,14 +234,16 @@ class RedisReminderHandler:
                 for id_, reminder in user.items():
                     # If enough time has passed, send the reminder
                     if int(reminder["time_target"]) <= last_time:
+                        # Claim it first: only the process that deleted it sends it
+                        if not self.remove_reminder(reminder["author"], id_):
+                            continue
+
                         try:
                             await self.dispatch(reminder)
                         except (DiscordException, KeyError):
                             log.warning("ERROR in reminders, see bugs.txt")
                             log_to_file(traceback.format_exc(), "bug")
 
-                        self.remove_reminder(reminder["author"], id_)
-
             # And tick.
             last_time = await self.tick(last_time)
 
@@ -238,7 +257,8 @@ class Reminder:
         self.stats = kwargs.get("stats")
         self.trans = kwargs.get("trans")
 
-        self.reminder = RedisReminderHandler(self.client, self.handler, self.trans, self.loop)
+        self.reminder = RedisReminderHandler(self.client, self.handler, self.trans, self.loop,
+                                             leader=self.nano.cluster.election("reminder"))
 
         self.filter = None
 
@@ -285,14 +305,12 @@ class Reminder:
     async def on_message(self, message, **kwargs):
         trans = self.trans
 
-        prefix = kwargs.get("prefix")
-        lang = kwargs.get("lang")
+        ctx = kwargs.get("ctx")
+        prefix = ctx.prefix
+        lang = ctx.lang
 
-        # Check if this is a valid command
-        if not is_valid_command(message.content, commands, prefix):
-            return
-        else:
-            self.stats.add(MESSAGE)
+        # Only called when the router matched one of our commands (see NanoPlugin.commands_only)
+        self.stats.add(MESSAGE)
 
         def startswith(*matches):
             for match in matches:
@@ -406,8 +424,9 @@ class NanoPlugin:
     version = "22"
 
     handler = Reminder
+    commands_only = True
     events = {
-        "on_message": 10,
+        "on_message": INDEPENDENT,
         "on_plugins_loaded": 5,
         # type : importance
     }
@@ -5,6 +5,7 @@ import traceback
 
 from discord import errors, Message, Member, User, Guild
 
+from core.stats import ERROR
 from core.utils import log_to_file, IgnoredException
 
 log = logging.getLogger(__name__)
@@ -13,12 +14,14 @@ log.setLevel(logging.INFO)
 
 class Reporter:
     def __init__(self, **kwargs):
-        pass
+        self.stats = kwargs.get("stats")
 
-    @staticmethod
-    async def on_error(event, *args, **kwargs):
+    async def on_error(self, event, *args, **kwargs):
         e_type, value, _ = sys.exc_info()
 
+        if e_type != IgnoredException:
+            self.stats.add(ERROR)
+
         # Ignore Forbidden errors (but log them anyways)
         if e_type == errors.Forbidden:
             log.warning("Forbidden 403")
@@ -7,10 +7,11 @@ import time
 import psutil
 
 from discord import utils, Embed, Colour, __version__ as d_version, HTTPException
-from discord import Member, Guild, Status, VerificationLevel
+from discord import Member, Status, VerificationLevel
 
 from core.stats import MESSAGE
-from core.utils import is_valid_command, log_to_file, is_disabled, IgnoredException
+from core.templates import TemplateEngine, TemplateContext, RenderError, COLONS
+from core.utils import log_to_file, is_disabled, IgnoredException, INDEPENDENT
 
 log = logging.getLogger(__name__)
 log.setLevel(logging.INFO)
@@ -47,6 +48,7 @@ class ServerManagement:
         self.lt = time.time()
 
         self.modp = self.handler.get_plugin_data_manager("moderation")
+        self.templates = TemplateEngine(COLONS)
 
     async def handle_log_channel(self, guild):
         # Older servers may still have names of channels, that can cause an error
@@ -101,32 +103,26 @@ class ServerManagement:
         # Color: Nano's dark blue color
         return Embed(description="ID: {}".format(user.id), color=color).set_author(name="{} {}".format(user.name, action), icon_url=user.avatar_url)
 
-    @staticmethod
-    def parse_dynamic_response(text: str, member: Member, guild: Guild):
-        order = [":username", ":user", ":server"]
-        replacements = {
-            ":user": member.mention,
-            ":username": member.display_name,
-            ":server": guild.name
-        }
-
-        for t in order:
-            text = text.replace(t, replacements[t])
-
-        return text
+    def parse_dynamic_response(self, text: str, member: Member) -> str:
+        """
+        Renders :user, :username and :server in welcome/leave messages, returns None if it can't be sent
+        """
+        try:
+            return self.templates.render(text, TemplateContext.from_member(member))
+        except RenderError as e:
+            log.warning("Could not render a message for {}: {}".format(member.guild.id, e))
+            return None
 
     async def on_message(self, message, **kwargs):
         client = self.client
         trans = self.trans
 
-        prefix = kwargs.get("prefix")
-        lang = kwargs.get("lang")
+        ctx = kwargs.get("ctx")
+        prefix = ctx.prefix
+        lang = ctx.lang
 
-        # Check if this is a valid command
-        if not is_valid_command(message.content, commands, prefix):
-            return
-        else:
-            self.stats.add(MESSAGE)
+        # Only called when the router matched one of our commands (see NanoPlugin.commands_only)
+        self.stats.add(MESSAGE)
 
         def startswith(*matches):
             for match in matches:
@@ -141,12 +137,25 @@ class ServerManagement:
             members = 0
             channels = 0
 
-            # Iterate though servers and add up things
-            for guild in client.guilds:
+            cluster = self.nano.cluster
+            if cluster.enabled:
+                # Add up the heartbeats of every worker
+                workers = await cluster.get_status()
+                shards = 0
+
+                for worker in workers:
+                    server_count += worker["guilds"]
+                    members += worker["members"]
+                    channels += worker["channels"]
+                    shards += len(worker["shards"])
+
+            else:
+                # Iterate though servers and add up things
+                for guild in client.guilds:
 
-                server_count += 1
-                members += int(guild.member_count)
-                channels += len(guild.channels)
+                    server_count += 1
+                    members += int(guild.member_count)
+                    channels += len(guild.channels)
 
             embed = Embed(name=trans.get("MSG_STATUS_STATS", lang), colour=Colour.dark_blue())
 
@@ -154,6 +163,12 @@ class ServerManagement:
             embed.add_field(name=trans.get("MSG_STATUS_USERS", lang), value=trans.get("MSG_STATUS_USERS_L", lang).format(members), inline=True)
             embed.add_field(name=trans.get("MSG_STATUS_CHANNELS", lang), value=trans.get("MSG_STATUS_CHANNELS_L", lang).format(channels), inline=True)
 
+            if cluster.enabled:
+                embed.add_field(name=trans.get("MSG_STATUS_WORKERS", lang),
+                                value=trans.get("MSG_STATUS_WORKERS_L", lang).format(
+                                    len(workers), cluster.config.workers, shards, cluster.config.shard_count),
+                                inline=True)
+
             await message.channel.send("**Stats**", embed=embed)
 
         # !debug
@@ -279,7 +294,7 @@ class ServerManagement:
         lang = kwargs.get("lang")
 
         raw_msg = str(self.handler.get_var(member.guild.id, "welcomemsg"))
-        welcome_msg = self.parse_dynamic_response(raw_msg, member, member.guild)
+        welcome_msg = self.parse_dynamic_response(raw_msg, member)
 
         log_c = await self.handle_log_channel(member.guild)
         def_c = await self.default_channel(member.guild)
@@ -316,7 +331,7 @@ class ServerManagement:
 
 
         raw_msg = str(self.handler.get_var(member.guild.id, key))
-        leave_msg = self.parse_dynamic_response(raw_msg, member, member.guild)
+        leave_msg = self.parse_dynamic_response(raw_msg, member)
 
         log_c = await self.handle_log_channel(member.guild)
         def_c = await self.default_channel(member.guild)
@@ -338,7 +353,7 @@ class ServerManagement:
         await self.send_message_failproof(d_chan, self.trans.get("EVENT_SERVER_JOIN", lang))
 
         # Create server settings
-        self.handler.server_setup(guild)
+        await self.handler.aio.server_setup(guild)
 
         # Log
         log_to_file("Joined guild: {}".format(guild.name))
@@ -359,11 +374,15 @@ class ServerManagement:
         log.info("Checking guild vars...")
         for guild in self.client.guilds:
             if not self.handler.server_exists(guild.id):
-                self.handler.server_setup(guild)
+                await self.handler.aio.server_setup(guild)
 
             self.handler.check_server_vars(guild)
         log.info("Done.")
 
+        # A cluster worker only sees its own guilds and would delete everything else
+        if self.nano.cluster.enabled:
+            return
+
         log.info("Checking for non-used guild data...")
         server_ids = [s.id for s in self.client.guilds]
         self.handler.check_old_servers(server_ids)
@@ -375,8 +394,9 @@ class NanoPlugin:
     version = "2"
 
     handler = ServerManagement
+    commands_only = True
     events = {
-        "on_message": 10,
+        "on_message": INDEPENDENT,
         "on_ready": 11,
         "on_member_join": 10,
         "on_member_remove": 10,
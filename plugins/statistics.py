@@ -8,7 +8,7 @@ except ImportError:
     from json import loads, dumps
 from discord import Embed, Colour
 
-from core.utils import is_valid_command, get_valid_commands
+from core.utils import INDEPENDENT
 from core.confparser import get_config_parser
 from core.stats import MESSAGE
 
@@ -19,117 +19,140 @@ commands = {
 
 valid_commands = commands.keys()
 
+# Commands that are not tracked
+IGNORED_COMMANDS = ("_rip", )
+
 parser = get_config_parser()
 log = logging.getLogger(__name__)
 log.setLevel(logging.DEBUG)
 
 
-class StatisticsParser:
-    T_DAY = 60 * 60 * 24
-    T_WEEK = 60 * 60 * 24 * 7
-    T_MONTH = 60 * 60 * 24 * 7 * 30
+# Unique users and guilds are counted with HyperLogLogs (~0.8% error, at most 12 KB per key)
+HLL_USERS = "bs:hll:users"
+HLL_GUILDS = "bs:hll:guilds"
+
+# Period buckets: bs:hll:<u/g>:hour:<hours since epoch> and bs:hll:<u/g>:day:<days since epoch>
+HLL_BUCKET = "bs:hll:{}:{}:{}"
+
+HOUR = 60 * 60
+DAY = 60 * 60 * 24
+
+# How many buckets each period is made of
+HISTORY_PERIODS = {
+    "day": ("hour", 24),
+    "week": ("day", 7),
+    "month": ("day", 30),
+}
+
+# Buckets expire once no period needs them anymore
+BUCKET_TTL = {
+    "hour": HOUR * 25,
+    "day": DAY * 31,
+}
 
+# Amount of tracked messages to buffer before writing
+BUFFER_SIZE = 5
+
+
+def bucket_index(size: str, timestamp: float) -> int:
+    return int(timestamp // (HOUR if size == "hour" else DAY))
+
+
+def bucket_key(kind: str, size: str, index: int) -> str:
+    return HLL_BUCKET.format(kind, size, index)
+
+
+class StatisticsParser:
     """
     Data layout:
-        
+
         MAIN DB:
-        bs:uniqueusers -> Set with user ids
-        bs:uniqueguilds -> Set with guild ids
-        
+        bs:hll:users -> HyperLogLog of all user ids
+        bs:hll:guilds -> HyperLogLog of all guild ids
+
         CACHE DB
-        bs: 
-            ˇ represents user/guild ID
-            u/g: day:<id>   -> value
-                 week:<id>  -> value
-                 month:<id> -> value
-    
+        bs:hll:
+            u/g: hour:<hours since epoch> -> HyperLogLog (expires after 25 hours)
+                 day:<days since epoch>   -> HyperLogLog (expires after 31 days)
+
+    Day is the union of the last 24 hourly buckets, week and month of the last 7 and 30 daily ones.
+    See utilities/migrate_statistics.py for moving the old sets and TTL keys to this layout.
     """
     def __init__(self, handler):
-        cache = handler.get_cache_handler()
+        # asyncio clients, tracking runs for every command and must not block the loop
+        cache = handler.get_cache_handler().aio
         self.cache = cache.get_plugin_data_manager("bs")
-        self.plugin = handler.get_plugin_data_manager("bs")
-
-        self.time_periods = {
-            "day": StatisticsParser.T_DAY,
-            "week": StatisticsParser.T_WEEK,
-            "month": StatisticsParser.T_MONTH
-        }
+        self.plugin = handler.aio.get_plugin_data_manager("bs")
 
         self.buffer = []
 
-    def track_user(self, user_id, guild_id):
+    async def track_user(self, user_id, guild_id):
         self.buffer.append([user_id, guild_id])
 
         # Buffer data together
-        if len(self.buffer) >= 5:
-            t = time.clock()
-            # Update data and reset buffer
-            self._update_data()
+        if len(self.buffer) >= BUFFER_SIZE:
+            # Reset the buffer before waiting, messages that arrive meanwhile go into the next update
+            buffer = self.buffer
             self.buffer = []
-            log.debug("Buffered update took {}s".format(time.clock()-t))
 
+            t = time.perf_counter()
+            await self._update_data(buffer)
+            log.debug("Buffered update took {}s".format(time.perf_counter() - t))
+
+    async def _update_data(self, buffer: list):
+        users = [a[0] for a in buffer]
+        guilds = [a[1] for a in buffer]
 
-    def _update_data(self):
         # To increase performance
-        pipe = self.plugin.pipeline()
+        pipe = self.plugin.pipeline(transaction=False)
 
         #  History belongs to the cache part
-        cpipe = self.cache.pipeline()
+        cpipe = self.cache.pipeline(transaction=False)
+
+        pipe.pfadd(HLL_USERS, *users)
+        pipe.pfadd(HLL_GUILDS, *guilds)
 
-        for item in self.buffer:
-            # Unpack
-            user_id, guild_id = item
+        now = time.time()
+        for size, ttl in BUCKET_TTL.items():
+            index = bucket_index(size, now)
 
-            # Add operations to pipeline
-            pipe.sadd("bs:uniqueusers", user_id)
-            pipe.sadd("bs:uniqueguilds", guild_id)
+            for kind, ids in (("u", users), ("g", guilds)):
+                key = bucket_key(kind, size, index)
 
-            for name, ttl in self.time_periods.items():
-                cpipe.set("bs:u:{}:{}".format(name, user_id), 0, ex=ttl)
-                cpipe.set("bs:g:{}:{}".format(name, guild_id), 0, ex=ttl)
+                cpipe.pfadd(key, *ids)
+                cpipe.expire(key, ttl)
 
         # Execute these operations all at once
-        pipe.execute()
-        cpipe.execute()
+        await pipe.execute()
+        await cpipe.execute()
 
-    def get_statistics_uniques(self) -> tuple:
-        u_users = self._get_sscan_length("bs:uniqueusers")
-        u_guilds = self._get_sscan_length("bs:uniqueguilds")
+    async def get_statistics_uniques(self) -> tuple:
+        pipe = self.plugin.pipeline(transaction=False)
+        pipe.pfcount(HLL_USERS)
+        pipe.pfcount(HLL_GUILDS)
 
+        u_users, u_guilds = await pipe.execute()
         return u_users, u_guilds
 
-    def _get_sscan_length(self, name, match=None) -> int:
-        """
-        Memory-efficient sscan length
-        """
-        amount = 0
-
-        cursor = '0'
-        while cursor != 0:
-            cursor, data = self.plugin.sscan(name, cursor, use_namespace=False, match=match, count=20)
-            amount += len(data)
+    async def get_statistics_history(self) -> dict:
+        now = time.time()
+        cpipe = self.cache.pipeline(transaction=False)
 
-        return amount
+        # PFCOUNT with multiple keys counts their union
+        for name, (size, amount) in HISTORY_PERIODS.items():
+            last = bucket_index(size, now)
+            indexes = range(last - amount + 1, last + 1)
 
-    def _get_scan_length(self, match) -> int:
-        """
-        Memory-efficient scan length
-        """
-        amount = 0
+            cpipe.pfcount(*[bucket_key("u", size, i) for i in indexes])
+            cpipe.pfcount(*[bucket_key("g", size, i) for i in indexes])
 
-        cursor = '0'
-        while cursor != 0:
-            cursor, data = self.cache.scan(cursor, use_namespace=False, match=match, count=20)
-            amount += len(data)
+        results = iter(await cpipe.execute())
 
-        return amount
-
-    def get_statistics_history(self) -> dict:
         data = {}
-        for name in self.time_periods.keys():
+        for name in HISTORY_PERIODS.keys():
             data[name] = {
-                "users": self._get_scan_length("bs:u:{}:*".format(name)),
-                "guilds": self._get_scan_length("bs:g:{}:*".format(name))
+                "users": next(results),
+                "guilds": next(results)
             }
 
         return data
@@ -144,49 +167,25 @@ class Statistics:
         self.trans = kwargs.get("trans")
 
         self.adv_stats = StatisticsParser(self.handler)
-        self.valid_commands = set()
-
-    async def on_plugins_loaded(self):
-        # Collect all valid commands
-        plugins = [a.plugin for a in self.nano.plugins.values() if a.plugin]
-
-        temp = []
-        for pl in plugins:
-            cmds = get_valid_commands(pl)
-            if cmds is not None:
-                # Joins two lists
-                temp += cmds
-
-        # Special case: rip
-        try:
-            temp.remove("_rip")
-        except:
-            pass
-
-        self.valid_commands = set(temp)
 
     async def on_message(self, message, **kwargs):
         trans = self.trans
 
-        prefix = kwargs.get("prefix")
-        lang = kwargs.get("lang")
+        ctx = kwargs.get("ctx")
+        prefix = ctx.prefix
+        lang = ctx.lang
 
         # If any of the commands match, add user to statistics
-        if message.content.startswith(prefix):
-            np_text = message.content[len(prefix):]
-        else:
-            np_text = message.content
-
-        np_text = "_" + np_text.split(" ", maxsplit=1)[0]
-        if np_text in self.valid_commands:
+        route = kwargs.get("route")
+        if route is not None and route.command not in IGNORED_COMMANDS:
             # Register user to stats
-            self.adv_stats.track_user(message.author.id, message.guild.id)
+            await self.adv_stats.track_user(message.author.id, message.guild.id)
 
-        # Check if this is a valid command
-        if not is_valid_command(message.content, commands, prefix):
+        # Commands are matched by the router (see core.router)
+        if route is None or "statistics" not in route:
             return
-        else:
-            self.stats.add(MESSAGE)
+
+        self.stats.add(MESSAGE)
 
         def startswith(*matches):
             for match in matches:
@@ -224,9 +223,9 @@ class Statistics:
 
         # !advancedstats
         elif startswith(prefix + "advancedstats"):
-            u_users, u_guilds = self.adv_stats.get_statistics_uniques()
+            u_users, u_guilds = await self.adv_stats.get_statistics_uniques()
 
-            data = self.adv_stats.get_statistics_history()
+            data = await self.adv_stats.get_statistics_history()
 
             description = trans.get("MSG_ADVS_DESC", lang).format(u_users, u_guilds) \
                         + "\n\n"\
@@ -254,7 +253,6 @@ class NanoPlugin:
 
     handler = Statistics
     events = {
-        "on_message": 10,
-        "on_plugins_loaded": 5,
+        "on_message": INDEPENDENT,
         # type : importance
     }
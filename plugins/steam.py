@@ -5,7 +5,7 @@ import steamapi
 from discord import HTTPException
 
 from core.stats import MESSAGE, WRONG_ARG
-from core.utils import is_valid_command, filter_text
+from core.utils import filter_text, INDEPENDENT
 from core.confparser import get_config_parser
 
 logger = logging.getLogger(__name__)
@@ -73,15 +73,14 @@ class Steam:
         self.steam = SteamSearch(key)
 
     async def on_message(self, message, **kwargs):
-        prefix = kwargs.get("prefix")
+        ctx = kwargs.get("ctx")
+        prefix = ctx.prefix
 
         trans = self.trans
-        lang = kwargs.get("lang")
+        lang = ctx.lang
 
-        if not is_valid_command(message.content, commands, prefix=prefix):
-            return
-        else:
-            self.stats.add(MESSAGE)
+        # Only called when the router matched one of our commands (see NanoPlugin.commands_only)
+        self.stats.add(MESSAGE)
 
         def startswith(*msg):
             for a in msg:
@@ -183,7 +182,8 @@ class NanoPlugin:
     version = "18"
 
     handler = Steam
+    commands_only = True
     events = {
-        "on_message": 10
+        "on_message": INDEPENDENT
         # type : importance
     }
@@ -15,7 +15,7 @@ from json import JSONDecodeError
 import aiohttp
 
 from core.stats import MESSAGE, WRONG_ARG
-from core.utils import is_valid_command
+from core.utils import INDEPENDENT
 from core.confparser import get_config_parser, CACHE_DIR
 
 #####
@@ -341,14 +341,12 @@ class TeamFortress:
     async def on_message(self, message, **kwargs):
         trans = self.trans
 
-        prefix = kwargs.get("prefix")
-        lang = kwargs.get("lang")
+        ctx = kwargs.get("ctx")
+        prefix = ctx.prefix
+        lang = ctx.lang
 
-        # Check if this is a valid command
-        if not is_valid_command(message.content, commands, prefix):
-            return
-        else:
-            self.stats.add(MESSAGE)
+        # Only called when the router matched one of our commands (see NanoPlugin.commands_only)
+        self.stats.add(MESSAGE)
 
         def startswith(*matches):
             for match in matches:
@@ -391,7 +389,8 @@ class NanoPlugin:
     version = "21"
 
     handler = TeamFortress
+    commands_only = True
     events = {
-        "on_message": 10
+        "on_message": INDEPENDENT
         # type : importance
     }
@@ -10,7 +10,7 @@ except ImportError:
 from discord import Embed, Colour, errors
 
 from core.stats import MESSAGE, VOTE, WRONG_PERMS
-from core.utils import is_valid_command, log_to_file, decode, add_dots, filter_text
+from core.utils import log_to_file, decode, add_dots, filter_text, INDEPENDENT
 
 __author__ = "DefaltSimon"
 # Voting plugin
@@ -151,14 +151,12 @@ class Vote:
     async def on_message(self, message, **kwargs):
         trans = self.trans
 
-        prefix = kwargs.get("prefix")
-        lang = kwargs.get("lang")
+        ctx = kwargs.get("ctx")
+        prefix = ctx.prefix
+        lang = ctx.lang
 
-        # Check if this is a valid command
-        if not is_valid_command(message.content, commands, prefix):
-            return
-        else:
-            self.stats.add(MESSAGE)
+        # Only called when the router matched one of our commands (see NanoPlugin.commands_only)
+        self.stats.add(MESSAGE)
 
         def startswith(*matches):
             for match in matches:
@@ -357,7 +355,8 @@ class NanoPlugin:
     version = "28"
 
     handler = Vote
+    commands_only = True
     events = {
-        "on_message": 10,
+        "on_message": INDEPENDENT,
         # type : importance
     }
@@ -11,7 +11,7 @@ except ImportError:
     from json import loads
 
 from core.stats import MESSAGE
-from core.utils import is_valid_command, add_dots, filter_text
+from core.utils import add_dots, filter_text, INDEPENDENT
 from core.confparser import get_config_parser
 
 logger = logging.getLogger(__name__)
@@ -122,15 +122,14 @@ class Definitions:
     async def on_message(self, message, **kwargs):
         assert isinstance(message, Message)
 
-        prefix = kwargs.get("prefix")
+        ctx = kwargs.get("ctx")
+        prefix = ctx.prefix
 
         trans = self.trans
-        lang = kwargs.get("lang")
+        lang = ctx.lang
 
-        if not is_valid_command(message.content, commands, prefix=prefix):
-            return
-        else:
-            self.stats.add(MESSAGE)
+        # Only called when the router matched one of our commands (see NanoPlugin.commands_only)
+        self.stats.add(MESSAGE)
 
         def startswith(*msg):
             for a in msg:
@@ -191,7 +190,8 @@ class NanoPlugin:
     version = "10"
 
     handler = Definitions
+    commands_only = True
     events = {
-        "on_message": 10
+        "on_message": INDEPENDENT
         # type : importance
     }
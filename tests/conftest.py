@@ -0,0 +1,32 @@
+# coding=utf-8
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# core.confparser reads core/directories.json relative to the working directory (like bench/)
+os.chdir(ROOT)
+sys.path.insert(0, ROOT)
+
+
+class Clock:
+    """
+    Stands in for time.monotonic, moved with advance()
+    """
+    def __init__(self, now: float = 1000):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr("time.monotonic", clock)
+    return clock
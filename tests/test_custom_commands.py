@@ -0,0 +1,22 @@
+# coding=utf-8
+from plugins.commons import CommandIndex
+
+
+def test_longest_trigger():
+    index = CommandIndex({"!a": "short", "!ab": "long", "!abc d": "spaced"})
+
+    assert index.match("!abc") == "long"
+    assert index.match("!ab") == "long"
+    assert index.match("!a b") == "short"
+    assert index.match("!abc d e") == "spaced"
+    # Falls back to the longest complete trigger on the way
+    assert index.match("!abc x") == "long"
+
+
+def test_no_match():
+    index = CommandIndex({"!hello": "hi"})
+
+    assert index.match("!hell") is None
+    assert index.match("hello") is None
+    assert index.match("") is None
+    assert CommandIndex({}).match("!hello") is None
@@ -0,0 +1,78 @@
+# coding=utf-8
+from plugins.moderator import MessageFeatures, RaidDetector, simhash, RAID_MIN_LENGTH
+
+RAID_MESSAGE = "join my server for free nitro discord.gg/abcdef"
+
+
+def distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def test_simhash_near_duplicates():
+    base = simhash(RAID_MESSAGE)
+
+    assert simhash(RAID_MESSAGE) == base
+    assert distance(base, simhash(RAID_MESSAGE + "!")) <= 8
+    assert distance(base, simhash("what did everyone think of the last episode")) > 8
+
+
+def test_raid_needs_enough_members(clock):
+    detector = RaidDetector(min_users=3)
+    features = MessageFeatures(RAID_MESSAGE)
+
+    for user_id in range(3):
+        assert not detector.is_raid(1, user_id, features)
+        clock.advance(1)
+
+    assert detector.is_raid(1, 3, features)
+
+
+def test_raid_ignores_the_same_member(clock):
+    detector = RaidDetector(min_users=3)
+    features = MessageFeatures(RAID_MESSAGE)
+
+    for _ in range(10):
+        assert not detector.is_raid(1, 1, features)
+
+
+def test_raid_window(clock):
+    detector = RaidDetector(window=15, min_users=3)
+    features = MessageFeatures(RAID_MESSAGE)
+
+    for user_id in range(3):
+        detector.is_raid(1, user_id, features)
+
+    # The earlier messages left the window
+    clock.advance(16)
+    assert not detector.is_raid(1, 3, features)
+    assert len(detector.channels[1]) == 1
+
+
+def test_raid_is_per_channel(clock):
+    detector = RaidDetector(min_users=3)
+    features = MessageFeatures(RAID_MESSAGE)
+
+    for user_id in range(3):
+        detector.is_raid(user_id, user_id, features)
+
+    assert not detector.is_raid(4, 4, features)
+
+
+def test_short_messages_are_skipped(clock):
+    detector = RaidDetector(min_users=1)
+    features = MessageFeatures("a" * (RAID_MIN_LENGTH - 1))
+
+    for user_id in range(5):
+        assert not detector.is_raid(1, user_id, features)
+
+    assert not detector.channels
+
+
+def test_channels_are_bounded(clock):
+    detector = RaidDetector(max_channels=2)
+    features = MessageFeatures(RAID_MESSAGE)
+
+    for channel_id in range(5):
+        detector.is_raid(channel_id, 1, features)
+
+    assert list(detector.channels) == [3, 4]
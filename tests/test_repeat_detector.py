@@ -0,0 +1,71 @@
+# coding=utf-8
+from plugins.moderator import MessageFeatures, RepeatingMessageDetector
+
+
+def test_repeating(clock):
+    detector = RepeatingMessageDetector(limit=2, history=3)
+    features = MessageFeatures("hello there")
+
+    assert not detector.is_repeating(1, 1, features)
+    assert not detector.is_repeating(1, 1, features)
+    assert detector.is_repeating(1, 1, features)
+
+
+def test_repeating_is_per_guild_and_member(clock):
+    detector = RepeatingMessageDetector(limit=2, history=3)
+    features = MessageFeatures("hello there")
+
+    for guild_id, user_id in ((1, 1), (1, 2), (2, 1)):
+        assert not detector.is_repeating(guild_id, user_id, features)
+        assert not detector.is_repeating(guild_id, user_id, features)
+
+    assert len(detector) == 3
+
+
+def test_empty_messages_dont_repeat(clock):
+    detector = RepeatingMessageDetector(limit=2, history=3)
+    empty = MessageFeatures("")
+
+    for _ in range(5):
+        assert not detector.is_repeating(1, 1, empty)
+
+
+def test_active_members_survive_rotation(clock):
+    detector = RepeatingMessageDetector(ttl=10, limit=2, history=3)
+    features = MessageFeatures("hello there")
+
+    detector.is_repeating(1, 1, features)
+    detector.is_repeating(1, 1, features)
+
+    # Rotated once: the state is in the previous generation and moves back when used
+    clock.advance(6)
+    assert detector.is_repeating(1, 1, features)
+    assert (1 << 64 | 1) in detector.current
+    assert not detector.previous
+
+
+def test_idle_members_are_dropped(clock):
+    detector = RepeatingMessageDetector(ttl=10, limit=2, history=3)
+    features = MessageFeatures("hello there")
+
+    detector.is_repeating(1, 1, features)
+    detector.is_repeating(1, 1, features)
+
+    # Two rotations without a message from the member
+    clock.advance(6)
+    detector.is_repeating(2, 2, features)
+    clock.advance(6)
+    detector.is_repeating(2, 2, features)
+
+    assert len(detector) == 1
+    assert not detector.is_repeating(1, 1, features)
+
+
+def test_rotation_by_size(clock):
+    detector = RepeatingMessageDetector(max_entries=4)
+    features = MessageFeatures("hello there")
+
+    for user_id in range(10):
+        detector.is_repeating(1, user_id, features)
+
+    assert len(detector) <= 4
@@ -0,0 +1,102 @@
+# coding=utf-8
+import asyncio
+from types import SimpleNamespace
+
+from discord import TextChannel
+
+from core.router import CommandRouter
+from plugins.moderator import Moderator
+
+COMMANDS = {
+    "commons": ["_cat", "_ban", "nano.info"],
+    "admin": ["_ban", "_cmd add", "_cmd"],
+    "minecraft": ["_mc"],
+}
+
+
+def router() -> CommandRouter:
+    router = CommandRouter()
+    router.build(COMMANDS)
+    return router
+
+
+def test_whole_commands():
+    r = router()
+
+    assert r.resolve("!cat", "!").command == "_cat"
+    assert r.resolve("!cat me", "!").command == "_cat"
+    assert r.resolve("nano.info", "!").plugin == "commons"
+    assert r.resolve("?mc status", "?").plugin == "minecraft"
+
+
+def test_longer_words_are_not_commands():
+    r = router()
+
+    assert r.resolve("!catXXX", "!") is None
+    assert r.resolve("!catXXX spam", "!") is None
+    assert r.resolve("!mcdonalds free nitro discord.gg/abc", "!") is None
+    assert r.resolve("!banana", "!") is None
+    assert r.resolve("nano.infos", "!") is None
+
+
+def test_longest_command():
+    r = router()
+
+    route = r.resolve("!cmd add hello world", "!")
+    assert route.command == "_cmd add"
+    assert route.plugin == "admin"
+
+    # "_cmd add" needs a boundary as well
+    assert r.resolve("!cmd addition", "!").command == "_cmd"
+    assert r.resolve("!ban @someone", "!").matches == {"commons": "_ban", "admin": "_ban"}
+
+
+def test_other_prefix():
+    r = router()
+
+    assert r.resolve("!cat", "?") is None
+    assert r.resolve("?cat", "?").command == "_cat"
+
+
+class FakeMessage:
+    def __init__(self, content: str):
+        self.content = content
+        self.channel = TextChannel.__new__(TextChannel)
+        self.channel.name = "general"
+        self.guild = SimpleNamespace(id=1)
+        self.author = SimpleNamespace(id=1)
+        self.mentions = []
+        self.role_mentions = []
+        self.deleted = False
+
+    async def delete(self):
+        self.deleted = True
+
+
+async def _is_admin(*_):
+    return False
+
+
+async def _get_log_channel(*_):
+    return None
+
+
+def test_unknown_command_is_still_filtered():
+    handler = SimpleNamespace(is_admin=_is_admin, aio=SimpleNamespace(get_log_channel=_get_log_channel))
+    trans = SimpleNamespace(for_lang=lambda lang: SimpleNamespace(get=lambda name: name))
+    moderator = Moderator(handler=handler, trans=trans)
+
+    logged = []
+    moderator.log = SimpleNamespace(send_log=lambda message, lang, reason: logged.append(reason))
+
+    ctx = SimpleNamespace(prefix="!", lang="en", muted=False, blacklisted=False, spam_filter=False,
+                          word_filter=False, invite_filter=True, word_list_version=None, guild_id=1)
+    message = FakeMessage("!catXXX free nitro discord.gg/abcdef")
+
+    route = router().resolve(message.content, ctx.prefix)
+    assert route is None
+
+    result = asyncio.run(moderator.on_message(message, ctx=ctx, route=route))
+    assert result == "return"
+    assert message.deleted
+    assert logged == ["MSG_MOD_INVITE"]
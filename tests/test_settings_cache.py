@@ -0,0 +1,69 @@
+# coding=utf-8
+from core.serverhandler import GuildSettingsCache, CACHED_SETTINGS
+
+VALUES = [None] * len(CACHED_SETTINGS)
+
+
+def test_put_and_get():
+    cache = GuildSettingsCache()
+
+    assert cache.get(1) is None
+    cache.put(1, VALUES, cache.token())
+    assert cache.get(1) is not None
+
+    assert cache.get_stats()["hits"] == 1
+    assert cache.get_stats()["misses"] == 1
+
+
+def test_invalidated_while_reading():
+    cache = GuildSettingsCache()
+
+    token = cache.token()
+    cache.invalidate(1)
+
+    # The values are still returned, but not cached
+    assert cache.put(1, VALUES, token) is not None
+    assert cache.get(1) is None
+
+
+def test_cleared_while_reading():
+    cache = GuildSettingsCache()
+
+    token = cache.token()
+    cache.clear()
+
+    cache.put(1, VALUES, token)
+    assert cache.get(1) is None
+
+
+def test_invalidation_drops_the_guild():
+    cache = GuildSettingsCache()
+
+    cache.put(1, VALUES, cache.token())
+    cache.put(2, VALUES, cache.token())
+    cache.invalidate(1)
+
+    assert cache.get(1) is None
+    assert cache.get(2) is not None
+    assert cache.get_stats()["invalidations"] == 1
+
+
+
+def test_contains_isnt_counted():
+    cache = GuildSettingsCache()
+    cache.put(1, VALUES)
+
+    assert 1 in cache
+    assert 2 not in cache
+    assert cache.get_stats()["hits"] == 0
+    assert cache.get_stats()["misses"] == 0
+
+
+def test_cached_guilds_by_last_use():
+    cache = GuildSettingsCache()
+
+    for guild_id in (1, 2, 3):
+        cache.put(guild_id, VALUES)
+
+    cache.get(1)
+    assert cache.cached_guilds() == [2, 3, 1]
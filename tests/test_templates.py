@@ -0,0 +1,84 @@
+# coding=utf-8
+from types import SimpleNamespace
+
+import pytest
+
+from core.templates import TemplateEngine, TemplateContext, RenderError, BRACES, COLONS
+
+
+def member(name="member", user_id=123456789012345678):
+    return SimpleNamespace(display_name=name, name=name, id=user_id, mention="<@{}>".format(user_id),
+                           discriminator="0001", avatar_url="", default_avatar_url="default")
+
+
+def context(author=None, mentions=(), guild_name="guild"):
+    return TemplateContext(author or member(), list(mentions), SimpleNamespace(name=guild_name))
+
+
+def test_groups():
+    engine = TemplateEngine(BRACES)
+    ctx = context(member("Alice"), [member("Bob", 2)])
+
+    assert engine.render("hi {author|name}", ctx) == "hi Alice"
+    assert engine.render("{mentions|0|name} ({mentions|0|id})", ctx) == "Bob (2)"
+    assert engine.render("{choose|x}", ctx) == "x"
+    assert 1 <= int(engine.render("{rnd|1|6}", ctx)) <= 6
+
+
+def test_unknown_groups_stay_as_text():
+    engine = TemplateEngine(BRACES)
+    ctx = context(member("Alice"))
+
+    assert engine.render("{nothing} and {author|name}", ctx) == "{nothing} and Alice"
+    assert engine.render("{choose}", ctx) == "{choose}"
+    # Colons aren't part of the brace syntax
+    assert engine.render(":user", ctx) == ":user"
+
+
+def test_names_cant_ping_everyone():
+    ctx = context(member("@everyone"), [member("@here", 2)], guild_name="@everyone's guild")
+
+    assert "@everyone" not in TemplateEngine(BRACES).render("{author|name}", ctx)
+    assert "@here" not in TemplateEngine(BRACES).render("{mentions|0|name}", ctx)
+    assert "@everyone" not in TemplateEngine(COLONS).render(":username joined :server", ctx)
+
+    # Mentions are meant to ping
+    assert TemplateEngine(COLONS).render("welcome :user", context(member(user_id=1))) == "welcome <@1>"
+
+
+def test_onfail():
+    engine = TemplateEngine(BRACES)
+    ctx = context()
+
+    assert engine.render("{onfail|no mention}{mentions|0|name}", ctx) == "no mention"
+    assert engine.render("{onfail|raw}{mentions|0|name}", ctx) == "Error: No such mention"
+    assert engine.render("{onfail|bad}{rnd|x}", ctx) == "bad"
+
+    with pytest.raises(RenderError):
+        engine.render("{mentions|0|name}", ctx)
+
+
+def test_budgets():
+    engine = TemplateEngine(BRACES)
+    ctx = context()
+
+    with pytest.raises(RenderError):
+        engine.render("{author|id}" * 3, ctx, max_ops=2)
+
+    with pytest.raises(RenderError):
+        engine.render("a" * 11, ctx, max_length=10)
+
+    with pytest.raises(RenderError):
+        engine.render("{author|name}" * 3, ctx, max_length=10)
+
+    assert engine.render("{author|id}" * 2, ctx, max_ops=2) == str(ctx.author.id) * 2
+
+
+def test_cache():
+    engine = TemplateEngine(BRACES, max_size=2)
+    ctx = context()
+
+    for text in ("a", "b", "a", "c", "b"):
+        engine.render(text, ctx)
+
+    assert engine.get_stats() == {"templates": 2, "hits": 1, "misses": 4}
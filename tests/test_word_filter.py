@@ -0,0 +1,71 @@
+# coding=utf-8
+from plugins.moderator import WordMatcher, WordFilterCache
+
+
+def test_whole_words_only():
+    matcher = WordMatcher(["ass"])
+
+    assert matcher.search("you ass") == "ass"
+    assert matcher.search("ass") == "ass"
+    assert matcher.search("class") is None
+    assert matcher.search("assassin") is None
+    assert matcher.search("grass is green") is None
+
+
+def test_punctuation_is_a_boundary():
+    # The old filter split on spaces only, so these didn't match
+    matcher = WordMatcher(["ass"])
+
+    assert matcher.search("ass!") == "ass"
+    assert matcher.search("(ass)") == "ass"
+    assert matcher.search("what,ass,what") == "ass"
+    assert matcher.search("ass_") == "ass"
+
+
+def test_leetspeak():
+    matcher = WordMatcher(["ass"])
+
+    assert matcher.search("4$$") == "ass"
+    assert matcher.search("@ss") == "ass"
+    # Leetspeak in the word list is normalized the same way
+    assert WordMatcher(["a$$"]).search("ass") == "ass"
+
+
+def test_words_with_spaces():
+    matcher = WordMatcher(["blow job"])
+
+    assert matcher.search("a blow job") == "blow job"
+    assert matcher.search("blow jobs") is None
+    assert matcher.search("blow") is None
+
+
+def test_suffix_words():
+    # "b" is only found through the failure link of "ab"
+    matcher = WordMatcher(["ab", "b"])
+
+    assert matcher.search("ab") == "ab"
+    assert matcher.search("x b") == "b"
+    assert matcher.search("cab") is None
+    assert matcher.search("a-b") == "b"
+
+
+def test_empty_words_are_ignored():
+    matcher = WordMatcher(["", "  ", "word"])
+
+    assert matcher.search("") is None
+    assert matcher.search(" ") is None
+    assert matcher.search("a word") == "word"
+
+
+def test_filter_cache_versions():
+    cache = WordFilterCache(max_size=2)
+    matcher = WordMatcher(["word"])
+
+    cache.put(1, 5, matcher)
+    assert cache.get(1, 5) is matcher
+    assert cache.get(1, 4) is matcher
+    assert cache.get(1, 6) is None
+
+    cache.put(2, 1, matcher)
+    cache.put(3, 1, matcher)
+    assert cache.get(1, 5) is None
@@ -0,0 +1,126 @@
+# coding=utf-8
+import time
+import logging
+import asyncio
+import os
+import sys
+
+os.chdir("..")
+sys.path.insert(0, os.getcwd())
+
+from core.serverhandler import ServerHandler
+from core.utils import decode
+from plugins.statistics import HLL_USERS, HLL_GUILDS, BUCKET_TTL, bucket_index, bucket_key
+
+#########################################
+# Statistics migration
+# Folds the old unique user/guild sets and per-period TTL keys into HyperLogLogs (see plugins/statistics.py)
+#########################################
+
+log = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+# Old layout
+OLD_SETS = {
+    "bs:uniqueusers": HLL_USERS,
+    "bs:uniqueguilds": HLL_GUILDS,
+}
+
+# Period -> TTL the old keys were set with
+OLD_PERIODS = {
+    "day": 60 * 60 * 24,
+    "week": 60 * 60 * 24 * 7,
+    "month": 60 * 60 * 24 * 7 * 30,
+}
+
+# PFADD this many elements at once
+BATCH_SIZE = 1000
+
+print("---------------------------")
+print("STATISTICS MIGRATION UTILITY")
+print("---------------------------")
+
+if input("This script will copy unique user and guild statistics to the new HyperLogLog layout.\n"
+         "Do you want to proceed? (y/n) ").lower() == "n":
+    sys.exit(4)
+
+remove_old = input("Do you want to remove the old keys afterwards? (y/n) ").lower() == "y"
+
+init = time.monotonic()
+
+red = ServerHandler.get_handler(asyncio.get_event_loop())
+cache = ServerHandler.get_cache_handler()
+
+# Main DB: all-time sets -> HLL
+for old, new in OLD_SETS.items():
+    amount = 0
+    batch = []
+
+    for member in red.redis.sscan_iter(old, count=BATCH_SIZE):
+        batch.append(member)
+
+        if len(batch) >= BATCH_SIZE:
+            red.redis.pfadd(new, *batch)
+            amount += len(batch)
+            batch = []
+
+    if batch:
+        red.redis.pfadd(new, *batch)
+        amount += len(batch)
+
+    print("{}: {} ids folded into {} (now ~{})".format(old, amount, new, red.redis.pfcount(new)))
+
+    if remove_old:
+        red.redis.delete(old)
+
+# Cache DB: TTL keys -> period buckets
+# The remaining TTL tells when an id was last seen: last_seen = now - (period - ttl)
+now = time.time()
+buckets = {}
+old_keys = []
+
+for kind in ("u", "g"):
+    for period, length in OLD_PERIODS.items():
+        for key in cache.redis.scan_iter(match="bs:{}:{}:*".format(kind, period), count=BATCH_SIZE):
+            key = decode(key)
+            ttl = cache.redis.ttl(key)
+            old_keys.append(key)
+
+            if ttl is None or ttl < 0:
+                continue
+
+            last_seen = now - (length - ttl)
+            id_ = key.rsplit(":", maxsplit=1)[1]
+
+            for size, bucket_ttl in BUCKET_TTL.items():
+                # Buckets that would have already expired are skipped
+                if now - last_seen >= bucket_ttl:
+                    continue
+
+                bucket = bucket_key(kind, size, bucket_index(size, last_seen))
+                buckets.setdefault(bucket, set()).add(id_)
+
+for bucket, ids in buckets.items():
+    ids = list(ids)
+    size = bucket.split(":")[3]
+
+    pipe = cache.redis.pipeline()
+    for i in range(0, len(ids), BATCH_SIZE):
+        pipe.pfadd(bucket, *ids[i:i + BATCH_SIZE])
+
+    # Expire with the same lifetime the bucket would have had
+    index = int(bucket.rsplit(":", maxsplit=1)[1])
+    bucket_end = (index + 1) * (60 * 60 if size == "hour" else 60 * 60 * 24)
+    pipe.expire(bucket, max(int(bucket_end + BUCKET_TTL[size] - now), 1))
+
+    pipe.execute()
+
+print("Period keys: {} old keys folded into {} buckets".format(len(old_keys), len(buckets)))
+
+if remove_old:
+    for i in range(0, len(old_keys), BATCH_SIZE):
+        cache.redis.delete(*old_keys[i:i + BATCH_SIZE])
+
+    print("Removed old keys.")
+
+print("Done in {}s.".format(round(time.monotonic() - init, 2)))